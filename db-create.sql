@@ -1,3 +1,5 @@
+-- The base tables. Indexes and later schema changes are applied by
+-- scrimp-migrate, from scrimp/migrations.
 CREATE TABLE IF NOT EXISTS aws_credentials(
 id serial primary key,
 access_key_id varchar(255) not null,
@@ -60,7 +62,7 @@ request_id varchar(255) not null,
 request_time timestamp default now(),
 subnet integer not null,
 cost_aware_ins integer not null,
-cost_aware_bid numeric CONSTRAINT positive_price_check CHECK (price >= 0),
+cost_aware_bid numeric CONSTRAINT positive_bid_check CHECK (cost_aware_bid >= 0),
 cost_aware_subnet integer not null,
 CONSTRAINT fk2_tenant FOREIGN KEY (tenant) REFERENCES tenant (id) MATCH SIMPLE ON UPDATE CASCADE ON DELETE CASCADE,
 CONSTRAINT fk1_instance FOREIGN KEY (instance_type) REFERENCES instance_type (id) MATCH SIMPLE ON UPDATE CASCADE ON DELETE CASCADE,
@@ -76,7 +78,7 @@ private_dns varchar(255) not null,
 fulfilled_time timestamp default now(),
 terminate_time timestamp,
 cost numeric CONSTRAINT positive_price_check CHECK (cost >= 0),
-reason = varchar(255), 
+reason varchar(255),
 CONSTRAINT fk1_request FOREIGN KEY (request_id) REFERENCES instance_request (id) MATCH SIMPLE ON UPDATE CASCADE ON DELETE CASCADE
 );
 
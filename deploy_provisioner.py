@@ -115,6 +115,14 @@ class AddProvisioner():
             if len(line) > 5:
                 self.dbconn.execute(line)
 
+        # Then apply the migrations (indexes etc.) on top of the tables
+        submit = subprocess.Popen((["scrimp-migrate", "--config",
+                                    "deploy.ini"]),
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT)
+        s_out, s_err = submit.communicate()
+        print s_out
+
 
 if __name__ == '__main__':
     adder = AddProvisioner()
@@ -1,5 +1,10 @@
 from scrimp.cloud.aws.instance import Instance
 from scrimp.cloud.aws.request import Request
+from scrimp.cloud.aws.catalog import InstanceCatalog
+from scrimp.cloud.aws.prices import SpotPriceService, SpotPriceView
+from scrimp.cloud.aws.executor import EC2Executor
 
 from . import api
 from . import manager
+from . import tags
+from . import ratelimit
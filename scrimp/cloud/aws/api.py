@@ -1,51 +1,21 @@
 import boto
-from pytz import timezone
-import datetime
-import time
 from string import Template
 from boto.ec2.blockdevicemapping import BlockDeviceType
 from boto.ec2.blockdevicemapping import BlockDeviceMapping
 
 from scrimp import ProvisionerConfig, logger
+from scrimp.dbwriter import NOW
+from scrimp.cloud.aws.connections import tenant_connection
+from scrimp.cloud.aws.executor import shared_executor
+from scrimp.cloud.aws.tags import tag_queue
 
 
-def get_spot_prices(instances, tenant):
+def get_spot_prices(instances, tenant, spot_prices):
     """
-    Get the current spot price for each instance type.
+    Get the current spot price for each instance type in the tenant's
+    zones from the shared spot price service.
     """
-    utc = timezone('UTC')
-    utc_time = datetime.datetime.now(utc)
-    now = utc_time.strftime('%Y-%m-%d %H:%M:%S')
-    conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
-    timeStr = str(now).replace(" ", "T") + "Z"
-    for ins in instances:
-        prices = conn.get_spot_price_history(
-            instance_type=ins.type,
-            product_description="Linux/UNIX (Amazon VPC)",
-            end_time=timeStr, start_time=timeStr)
-        for price in prices:
-            for key, val in tenant.subnets.iteritems():
-                if price.availability_zone == key:
-                    ins.spot.update({price.availability_zone: price.price})
-
-
-def tag_requests(req, tag, conn):
-    """
-    Tag any requests that have just been made with the tenant name
-    """
-    for x in range(0, 3):
-        try:
-            conn.create_tags([req], {"tenant": tag})
-            conn.create_tags([req], {"Name": 'worker@%s' % tag})
-            break
-        except boto.exception.BotoClientError:
-            time.sleep(2)
-            pass
-        except boto.exception.BotoServerError:
-            time.sleep(2)
-            pass
-        except boto.exception.EC2ResponseError:
-            logger.exception("There was an error communicating with EC2.")
+    tenant.spot_prices = spot_prices.view(tenant, instances)
 
 
 def launch_ondemand_request(conn, request, tenant, job):
@@ -80,44 +50,45 @@ def launch_ondemand_request(conn, request, tenant, job):
         my_req_ids = [req.id for req in res.instances]
         # address = ""
         for req in my_req_ids:
-            # tag each request
-            tag_requests(req, tenant.name, conn)
             # update the database to include the new request
-            ProvisionerConfig().dbconn.execute(
-                ("insert into instance_request (tenant, instance_type, " +
-                 "price, job_runner_id, request_type, request_id, " +
-                 "subnet) values ('%s', '%s', %s, %s, '%s', '%s', %s)") %
-                (tenant.db_id, request.instance.db_id,
-                 request.instance.ondemand, job.id,
-                 "ondemand", req, tenant.subnet_id))
-            # ProvisionerConfig().dbconn.commit()
-            return
+            ProvisionerConfig().dbwriter.insert('instance_request', [
+                ('tenant', tenant.db_id),
+                ('instance_type', request.instance.db_id),
+                ('price', request.instance.ondemand),
+                ('job_runner_id', job.id),
+                ('request_type', "ondemand"),
+                ('request_id', req),
+                ('subnet', tenant.subnet_id)])
+        return my_req_ids
     except boto.exception.EC2ResponseError:
         logger.exception("There was an error communicating with EC2.")
+    return []
 
 
 def insert_launch_stats(req, request, tenant):
     """
     Record that the instance was launched.
     """
-    cmd = ("insert into launch_stats (type, zone, bid, current_price, " +
-           "request_id, request_time) values " +
-           "('%s','%s','%s','%s','%s', NOW());" % (request.instance_type,
-                                                   request.zone,
-                                                   request.price, 0, req))
-    print cmd
-    ProvisionerConfig().dbconn.execute(cmd)
+    ProvisionerConfig().dbwriter.insert('launch_stats', [
+        ('type', request.instance_type),
+        ('zone', request.zone),
+        ('bid', request.price),
+        ('current_price', 0),
+        ('request_id', req),
+        ('request_time', NOW)])
 
 
-def launch_spot_request(conn, request, tenant, job):
+def launch_spot_request(conn, request, tenant, jobs, user_data):
+    """
+    Make one spot request for a batch of jobs that selected the same
+    instance type, zone, bid, AMI and user data, and return the ids of the
+    requests made for each job.
+    """
     try:
         logger.debug("%s = %s. tenants vpc = %s" %
                      (request.zone, tenant.subnets[request.zone],
                       tenant.vpc))
 
-        cost_aware_req = job.cost_aware
-        drafts_req = job.cost_aware
-        drafts_avg = job.cost_aware
         mapping = BlockDeviceMapping()
         sda1 = BlockDeviceType()
         eph0 = BlockDeviceType()
@@ -140,88 +111,165 @@ def launch_spot_request(conn, request, tenant, job):
         inst_req = conn.request_spot_instances(
             price=request.bid, image_id=request.ami,
             subnet_id=tenant.subnets[request.zone],
-            count=request.count,
+            count=sum(int(job.launch.count) for job in jobs),
             key_name=tenant.key_pair,
             security_group_ids=[tenant.security_group],
             instance_type=request.instance_type,
-            user_data=customise_cloudinit(tenant, job),
+            user_data=user_data,
             block_device_map=mapping)
         my_req_ids = [req.id for req in inst_req]
+        # Give each job as many of the requests as it asked for
+        job_req_ids = []
+        for job in jobs:
+            count = int(job.launch.count)
+            job_req_ids.append((job, my_req_ids[:count]))
+            my_req_ids = my_req_ids[count:]
         # address = ""
-        for req in my_req_ids:
-            insert_launch_stats(req, request, tenant)
-            # tag each request
-            tag_requests(req, tenant.name, conn)
-            ProvisionerConfig().dbconn.execute(
-                ("insert into instance_request (tenant, instance_type, " +
-                 "price, job_runner_id, request_type, request_id, " +
-                 "subnet, cost_aware_ins, cost_aware_bid, cost_aware_subnet," +
-                 " drafts_ins, drafts_bid, drafts_subnet, selected_avg_price,"
-                 " cost_aware_avg_price, drafts_avg_price, drafts_avg_ins, " +
-                 "drafts_avg_bid, drafts_avg_subnet, drafts_avg_avg_price) " +
-                 "values ('%s', '%s', %s, %s, '%s', '%s', %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)") %
-                (tenant.db_id, request.instance.db_id, request.price, job.id,
-                 "spot", req, tenant.subnets_db_id[request.zone],
-                 cost_aware_req.instance.db_id, cost_aware_req.bid,
-                 tenant.subnets_db_id[cost_aware_req.zone],
-                 drafts_req.instance.db_id,
-                 drafts_req.DrAFTS, tenant.subnets_db_id[drafts_req.zone],
-                 request.AvgPrice, cost_aware_req.AvgPrice,
-                 drafts_req.AvgPrice,
-                 drafts_avg.instance.db_id, drafts_avg.DrAFTS,
-                 tenant.subnets_db_id[
-                     drafts_avg.zone],
-                 drafts_avg.AvgPrice))
-
-        return my_req_ids
+        for job, req_ids in job_req_ids:
+            for req in req_ids:
+                record_spot_request(req, job.launch, tenant, job)
+        return job_req_ids
     except boto.exception.EC2ResponseError:
         logger.exception("There was an error communicating with EC2.")
+    return [(job, []) for job in jobs]
+
 
+def record_spot_request(req, request, tenant, job):
+    """
+    Record a spot request, made with the request selected for job.
+    """
+    cost_aware_req = job.cost_aware
+    drafts_req = job.cost_aware
+    drafts_avg = job.cost_aware
+    insert_launch_stats(req, request, tenant)
+    ProvisionerConfig().dbwriter.insert('instance_request', [
+        ('tenant', tenant.db_id),
+        ('instance_type', request.instance.db_id),
+        ('price', request.price),
+        ('job_runner_id', job.id),
+        ('request_type', "spot"),
+        ('request_id', req),
+        ('subnet', tenant.subnets_db_id[request.zone]),
+        ('cost_aware_ins', cost_aware_req.instance.db_id),
+        ('cost_aware_bid', cost_aware_req.bid),
+        ('cost_aware_subnet',
+         tenant.subnets_db_id[cost_aware_req.zone]),
+        ('drafts_ins', drafts_req.instance.db_id),
+        ('drafts_bid', drafts_req.DrAFTS),
+        ('drafts_subnet', tenant.subnets_db_id[drafts_req.zone]),
+        ('selected_avg_price', request.AvgPrice),
+        ('cost_aware_avg_price', cost_aware_req.AvgPrice),
+        ('drafts_avg_price', drafts_req.AvgPrice),
+        ('drafts_avg_ins', drafts_avg.instance.db_id),
+        ('drafts_avg_bid', drafts_avg.DrAFTS),
+        ('drafts_avg_subnet', tenant.subnets_db_id[drafts_avg.zone]),
+        ('drafts_avg_avg_price', drafts_avg.AvgPrice)])
+
+
+def launch_request(tenant, request, jobs, user_data=None):
+    """
+    Launch a request for a batch of jobs on its own connection, and return
+    the ids of the requests (or instances) made for each job. Ondemand
+    requests are made for one job at a time. The new ids are queued to be
+    tagged as soon as the batch is made.
+    """
+    with tenant_connection(tenant) as conn:
+        if request.ondemand:
+            launched = [
+                (job, launch_ondemand_request(conn, request, tenant, job))
+                for job in jobs]
+        else:
+            launched = launch_spot_request(conn, request, tenant, jobs,
+                                           user_data)
+    tag_queue.add(tenant, [req for job, req_ids in launched
+                           for req in req_ids])
+    return launched
 
-def request_resources(tenant):
+
+def batch_requests(tenant, launches):
     """
-    Request the resources that have been selected for each job
+    Group the jobs whose spot requests share an instance type, zone, bid,
+    AMI and user data, so each group can be made in one call. Returns a
+    list of (request, jobs, user data).
     """
-    conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
+    batches = []
+    spot = {}
+    for job, request in launches:
+        if request.ondemand:
+            batches.append((request, [job], None))
+            continue
+        user_data = customise_cloudinit(tenant, job)
+        key = (request.instance_type, request.zone, request.bid, request.ami,
+               user_data)
+        if key not in spot:
+            spot[key] = (request, [], user_data)
+            batches.append(spot[key])
+        spot[key][1].append(job)
+    return batches
+
 
+def request_resources(tenant, executor=None):
+    """
+    Request the resources that have been selected for each job. Jobs with
+    the same spot request are batched into one call, and the requests are
+    made concurrently, and tagged in the background as each is made.
+    """
+    if executor is None:
+        executor = shared_executor
     output_string = "Name: %s\n" % tenant.name
     output_string = "%sTenant: %s\n" % (output_string, tenant.name)
     instance_req_string = ""
     req_cpus = 0
     req_instances = 0
 
+    launches = []
     for job in tenant.idle_jobs:
         if job.fulfilled is False:
             request = job.launch
             if request is None:
-                logger.debug("Failed to find request object for job %s" % job)
+                logger.debug("Failed to find request object for job %s" %
+                             job)
                 continue
             logger.debug(repr(request))
             # increment some counters
             req_instances += int(request.count)
             req_cpus += int(job.req_cpus)
-            # Launch any on-demand requests
-            # req_type = "spot"
-            if request.ondemand:
-                # launch the ondemand request
-                launch_ondemand_request(conn, request, tenant, job)
+            launches.append((job, request))
+
+    batches = batch_requests(tenant, launches)
+    logger.debug("Making %s requests for %s jobs." % (len(batches),
+                                                      len(launches)))
+    with executor.phase('request'):
+        results = [executor.submit('request', launch_request, tenant,
+                                   request, jobs, user_data)
+                   for request, jobs, user_data in batches]
+        # A batch that fails does not stop the others being recorded
+        launched = []
+        for (request, jobs, user_data), result in zip(batches, results):
+            try:
+                launched.extend((job, job.launch, req_ids)
+                                for job, req_ids in result.get())
+            except Exception:
+                logger.exception("Failed to request %s for jobs %s." % (
+                    request.instance_type,
+                    ", ".join(str(job.id) for job in jobs)))
+
+    for job, request, req_ids in launched:
+        if request.ondemand:
+            instance_req_string = (
+                ("%sONDEMAND_INSTANCE_REQUEST" +
+                 "\t%s\t%s\t%s\t%s\t%s\n") %
+                (instance_req_string, tenant.name,
+                 request.instance_type, request.bid, job.id,
+                 "ondemand"))
+        else:
+            for req in req_ids:
                 instance_req_string = (
-                    ("%sONDEMAND_INSTANCE_REQUEST" +
-                     "\t%s\t%s\t%s\t%s\t%s\n") %
+                    ("%sSPOT_INSTANCE_REQUEST" +
+                     "\t%s\t%s\t%s\t%s\t%s\tDrAFTS: %s\t%s\n") %
                     (instance_req_string, tenant.name,
                      request.instance_type, request.bid, job.id,
-                     "ondemand"))
-            else:
-                # launch the spot request
-                # TODO batch request instances of the same type
-                req_ids = launch_spot_request(conn, request, tenant, job)
-                for req in req_ids:
-                    instance_req_string = (
-                        ("%sSPOT_INSTANCE_REQUEST" +
-                         "\t%s\t%s\t%s\t%s\t%s\tDrAFTS: %s\t%s\n") %
-                        (instance_req_string, tenant.name,
-                         request.instance_type, request.bid, job.id,
-                         "spot", request.DrAFTS, req))
+                     "spot", request.DrAFTS, req))
 
     logger.debug(
         ("%s\nTotal CPUs requested: %s\n" +
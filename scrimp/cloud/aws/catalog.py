@@ -0,0 +1,95 @@
+import bisect
+
+
+class InstanceCatalog(object):
+    """
+    An index of the available instance types, built once when they are
+    loaded, for finding the instance types that meet a job's requirements.
+    Instances are looked up by name with a dict. The instances are also
+    sorted by cpus and by memory, with a bitmask of the instances at or
+    above each position, so the eligible set for a requirement is the AND
+    of two masks found by binary search. Masks are cached per requirement.
+    """
+
+    def __init__(self, instances):
+        self.instances = list(instances)
+        self.by_type = {}
+        self.index = {}
+        for i, ins in enumerate(self.instances):
+            # keep the first instance of each name, as a linear search would
+            if ins.type not in self.by_type:
+                self.by_type[ins.type] = ins
+                self.index[ins.type] = i
+
+        self.cpus, self.cpu_masks = self.build_masks(
+            [int(ins.cpus) for ins in self.instances])
+        self.memory, self.memory_masks = self.build_masks(
+            [int(ins.memory) for ins in self.instances])
+        self.masks = {}
+        self.eligible_lists = {}
+
+    def __len__(self):
+        return len(self.instances)
+
+    def __repr__(self):
+        return "InstanceCatalog(%s)" % ', '.join(
+            ins.type for ins in self.instances)
+
+    def build_masks(self, values):
+        """
+        Sort the values and, for each position in the sorted list, build a
+        bitmask of the instances with that value or more.
+        """
+        order = sorted(range(len(values)), key=lambda i: values[i])
+        masks = [0] * (len(order) + 1)
+        for k in range(len(order) - 1, -1, -1):
+            masks[k] = masks[k + 1] | (1 << order[k])
+        return [values[i] for i in order], masks
+
+    def get(self, ins_type):
+        """
+        Get an instance type by its name, or None if it is not available.
+        """
+        return self.by_type.get(ins_type)
+
+    def eligible_mask(self, cpus, memory):
+        """
+        The bitmask of instances with at least the given cpus and memory.
+        """
+        key = (cpus, memory)
+        if key not in self.masks:
+            self.masks[key] = (
+                self.cpu_masks[bisect.bisect_left(self.cpus, cpus)] &
+                self.memory_masks[bisect.bisect_left(self.memory, memory)])
+        return self.masks[key]
+
+    def eligible(self, job):
+        """
+        Get the instance types that can fulfil a job's requirements, in the
+        order they were loaded.
+        """
+        key = (int(job.req_cpus), int(job.req_mem))
+        if key not in self.eligible_lists:
+            mask = self.eligible_mask(*key)
+            self.eligible_lists[key] = [
+                ins for i, ins in enumerate(self.instances) if mask >> i & 1]
+        return list(self.eligible_lists[key])
+
+    def check_requirements(self, instance, job):
+        """
+        Check to see if an instance can fulfil a jobs requirements.
+        The instance can be an Instance or str (aws instance type name
+        e.g. m2.4xlarge).
+        """
+        if isinstance(instance, basestring):
+            if instance not in self.by_type:
+                # an unknown type cannot be shown to meet the requirements
+                return False
+            instance = self.by_type[instance]
+        cpus = int(job.req_cpus)
+        memory = int(job.req_mem)
+        i = self.index.get(instance.type)
+        if i is not None and self.instances[i] is instance:
+            return bool(self.eligible_mask(cpus, memory) >> i & 1)
+        # not one of the catalog's instances, so check it directly
+        return int(instance.cpus) >= cpus and int(instance.memory) >= memory
@@ -0,0 +1,174 @@
+import time
+import threading
+from contextlib import contextmanager
+
+import boto
+import boto.ec2
+
+from scrimp import logger
+from scrimp.cloud.aws.ratelimit import rate_limits
+
+
+class PooledConnection(object):
+    """
+    An EC2 connection held by the pool, with when it was last used and
+    last known to be working.
+    """
+
+    def __init__(self, conn, secret_key):
+        self.conn = conn
+        self.secret_key = secret_key
+        self.last_used = time.time()
+        self.last_checked = time.time()
+        self.healthy = True
+
+
+class ConnectionPool(object):
+    """
+    A registry of EC2 connections keyed by (access key, region), so that
+    connections (and their TLS sessions) are reused across cycles rather
+    than opened by each helper. A connection is checked out for exclusive
+    use, so the pool can be shared by threads processing tenants
+    concurrently; a thread that finds no idle connection for its key opens
+    another. Connections idle for more than max_idle seconds are closed,
+    and connections idle for more than check_interval seconds are checked
+    with a cheap describe call before being handed out again. If given a
+    limiter, the connections handed out are rate limited for their
+    account.
+    """
+
+    def __init__(self, max_idle=900, check_interval=300, limiter=None):
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.limiter = limiter
+        self.idle = {}
+        self.lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def connect(self, access_key, secret_key, region=None):
+        if region is None:
+            return boto.connect_ec2(access_key, secret_key)
+        return boto.ec2.connect_to_region(
+            region, aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key)
+
+    def healthy(self, pooled):
+        """
+        Check that a connection that has been idle for a while still works.
+        """
+        if time.time() - pooled.last_checked < self.check_interval:
+            return pooled.healthy
+        try:
+            pooled.conn.get_all_zones()
+            pooled.last_checked = time.time()
+            return True
+        except Exception:
+            logger.warn("Discarding unhealthy EC2 connection.")
+            return False
+
+    def close(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def evict_idle(self):
+        """
+        Close any connections that have not been used for max_idle seconds.
+        """
+        now = time.time()
+        expired = []
+        with self.lock:
+            for key, conns in self.idle.items():
+                keep = []
+                for pooled in conns:
+                    if now - pooled.last_used > self.max_idle:
+                        expired.append(pooled)
+                    else:
+                        keep.append(pooled)
+                if len(keep) > 0:
+                    self.idle[key] = keep
+                else:
+                    del self.idle[key]
+        for pooled in expired:
+            self.close(pooled)
+        return len(expired)
+
+    def acquire(self, access_key, secret_key, region=None):
+        """
+        Take an idle connection for the credentials and region out of the
+        pool, or open a new one.
+        """
+        self.evict_idle()
+        key = (access_key, region)
+        while True:
+            with self.lock:
+                conns = self.idle.get(key, [])
+                pooled = conns.pop() if len(conns) > 0 else None
+            if pooled is None:
+                break
+            if pooled.secret_key != secret_key or not self.healthy(pooled):
+                self.close(pooled)
+                continue
+            self.reused += 1
+            return pooled
+        self.created += 1
+        return PooledConnection(
+            self.connect(access_key, secret_key, region), secret_key)
+
+    def release(self, access_key, pooled, region=None):
+        """
+        Return a checked out connection to the pool.
+        """
+        if not pooled.healthy:
+            self.close(pooled)
+            return
+        pooled.last_used = time.time()
+        with self.lock:
+            self.idle.setdefault((access_key, region), []).append(pooled)
+
+    @contextmanager
+    def checkout(self, access_key, secret_key, region=None):
+        """
+        Check out a connection for exclusive use within a with block. The
+        connection is discarded rather than returned if the block fails
+        with anything other than an error response from EC2 (which shows
+        the connection itself is working).
+        """
+        pooled = self.acquire(access_key, secret_key, region)
+        conn = pooled.conn
+        if self.limiter is not None:
+            conn = self.limiter.wrap(conn, (access_key, region))
+        try:
+            yield conn
+        except boto.exception.BotoServerError:
+            raise
+        except Exception:
+            pooled.healthy = False
+            raise
+        finally:
+            self.release(access_key, pooled, region)
+
+    def clear(self):
+        """
+        Close all of the idle connections.
+        """
+        with self.lock:
+            conns = [p for ps in self.idle.values() for p in ps]
+            self.idle = {}
+        for pooled in conns:
+            self.close(pooled)
+
+
+pool = ConnectionPool(limiter=rate_limits)
+
+
+def tenant_connection(tenant, connections=None):
+    """
+    Check out a connection for a tenant's account from the shared pool.
+    """
+    if connections is None:
+        connections = pool
+    return connections.checkout(tenant.access_key, tenant.secret_key,
+                                getattr(tenant, 'region', None))
@@ -0,0 +1,95 @@
+import time
+import threading
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from scrimp import logger
+
+
+class EC2Executor(object):
+    """
+    Issue boto calls from a pool of threads, so that the requests, tags
+    and describes of a cycle are in flight at once rather than made one
+    after another. At most workers calls run at a time; the rest wait in
+    the pool's queue. Each call should check out its own connection, as a
+    boto connection can not be shared between threads. The time taken by
+    each phase of a cycle, and by the calls made in it, is recorded.
+    """
+
+    def __init__(self, workers=10):
+        self.workers = workers
+        self.pool = None
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def submit(self, phase, fn, *args, **kwargs):
+        """
+        Call fn in the pool, returning an AsyncResult.
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = ThreadPool(self.workers)
+        return self.pool.apply_async(self.call, (phase, fn, args, kwargs))
+
+    def call(self, phase, fn, args, kwargs):
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self.record(phase, call=time.time() - start)
+
+    def map(self, phase, fn, items):
+        """
+        Call fn on each of items concurrently, as one phase, and return the
+        results in order.
+        """
+        with self.phase(phase):
+            results = [self.submit(phase, fn, item) for item in items]
+            return [r.get() for r in results]
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Record how long the calls made in a with block take overall.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(name, wall=time.time() - start)
+
+    def record(self, name, wall=None, call=None):
+        with self.lock:
+            stats = self.stats.setdefault(name, [0.0, 0, 0.0, 0.0])
+            if wall is not None:
+                stats[0] += wall
+            if call is not None:
+                stats[1] += 1
+                stats[2] += call
+                stats[3] = max(stats[3], call)
+
+    def log_stats(self, reset=True):
+        """
+        Log the time spent in each phase, and the number and latency of
+        the calls made in it.
+        """
+        with self.lock:
+            stats = self.stats
+            if reset:
+                self.stats = {}
+        for name, (wall, calls, total, longest) in sorted(stats.items()):
+            mean = total / calls if calls else 0
+            logger.debug("AWS %s: %.3fs, %s calls, %.3fs mean, %.3fs max" %
+                         (name, wall, calls, mean, longest))
+
+    def close(self):
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+
+# Used when no executor is given
+shared_executor = EC2Executor()
@@ -14,4 +14,3 @@ class Instance(SimpleStringifiable):
         self.memory = memory
         self.disk = disk
         self.ami = ami
-        self.spot = {}
@@ -1,29 +1,40 @@
-import boto
 import psycopg2
 import datetime
-from scrimp import logger, ProvisionerConfig
-from scrimp.cloud.aws import api
+from scrimp import logger, ProvisionerConfig, queries
+from scrimp.dbwriter import NOW
+from scrimp.cloud.aws.connections import tenant_connection
+from scrimp.cloud.aws.snapshot import (take_snapshots, get_snapshot,
+                                       credentials)
+from scrimp.cloud.aws.terminations import TerminationReconciler
+from scrimp.cloud.aws.tags import tag_queue
 
+# Remembers which terminated instances have been recorded for each account
+terminations = TerminationReconciler()
 
-def process_resources(tenants):
+
+def process_resources(tenants, executor=None):
     """
     This should manage all of the existing aws resources and requests.
+    The state of each account is described once (concurrently, if given an
+    executor) and shared by all of the phases below.
     """
+    snapshots = take_snapshots(tenants, executor=executor)
+
     # Update the DB with newly fulfilled instances
-    update_database(tenants)
+    update_database(tenants, snapshots)
 
     # Migrate any requests that still exist for a resource that is not
     # going to use them
     migrate_reqs = True
     if migrate_reqs:
-        migrate_requests(tenants)
+        migrate_requests(tenants, snapshots)
 
     # Stop any unnecessary spot requests (still launching without any idle
     # jobs)
-    cancel_unmigrated_requests(tenants)
+    cancel_unmigrated_requests(tenants, snapshots)
 
 
-def update_database(tenants):
+def update_database(tenants, snapshots=None):
     """
     Record when an instance is started in the database. This should also
     try and record when an instance is terminated.
@@ -32,69 +43,79 @@ def update_database(tenants):
     """
 
     for tenant in tenants:
-        conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
+        snapshot = get_snapshot(snapshots, tenant)
+        if snapshot is None:
+            continue
         try:
-            # First get all operating instances (instances probably are not
-            # yet tagged, so don't filter them yet.)
-            reservations = conn.get_all_instances()
+            # First get all operating instances (instances probably are
+            # not yet tagged, so don't filter them yet.)
+            reservations = snapshot.reservations
             instance_spot_ids = []
             # Go over the fulfilled spot requests
             for r in reservations:
                 for i in r.instances:
                     if i.spot_instance_request_id is not None:
                         instance_spot_ids.append(
-                            "'%s'" % i.spot_instance_request_id)
+                            i.spot_instance_request_id)
                     # Also include ondemand instances which tag as the id.
                     else:
-                        instance_spot_ids.append(
-                            "'%s'" % i.id)
+                        instance_spot_ids.append(i.id)
 
-            # Get the entry in the instance_request table for each of these
-            # requests
-            check_for_new_instances(reservations, instance_spot_ids,
-                                    conn, tenant)
-            check_for_terminated_instances(reservations)
+            # Get the entry in the instance_request table for each of
+            # these requests
+            check_for_new_instances(reservations, instance_spot_ids, tenant)
+            check_for_terminated_instances(reservations, tenant)
 
         except:
-            logger.exception("Error updating database. Or, more likely, the " +
-                             "instance wasn't yet registered by amazon, so " +
-                             "skip this error this time.")
+            logger.exception("Error updating database. Or, more " +
+                             "likely, the instance wasn't yet " +
+                             "registered by amazon, so skip this " +
+                             "error this time.")
 
 
-def check_for_terminated_instances(reservations):
-    for r in reservations:
-        for i in r.instances:
-            if i.state == 'terminated':
-                # Sadly, I can't seem to get the actual shutdown time
-                # i.state_reason does not contain it and i.state does not
-                # exist. So instead, we will just flag it as now and sort
-                # out determining the full hour when computing cost.
-                ProvisionerConfig().dbconn.execute(
-                    ("update instance set terminate_time = NOW(), reason = '%s' " +
-                     "where instance_id = '%s' and terminate_time is null;") % (i.state_reason['message'], i.id))
+def check_for_terminated_instances(reservations, tenant):
+    """
+    Record the instances that have been terminated since the last cycle.
+    """
+    # The instances being terminated must be in the database already
+    ProvisionerConfig().dbwriter.barrier()
+    terminations.reconcile(credentials(tenant), reservations)
 
 
-def check_for_new_instances(reservations, instance_spot_ids, conn, tenant):
+def check_for_new_instances(reservations, instance_spot_ids, tenant):
     if len(instance_spot_ids) > 0:
+        # Make sure the queued requests and instances have been written
+        ProvisionerConfig().dbwriter.barrier()
         # Check that it isn't already in the instance table
-        rows = ProvisionerConfig().dbconn.execute(
-            ("select instance_request.id, instance_request.job_runner_id, " +
-             "instance_request.request_id from instance_request left join " +
-             "instance on instance_request.id = instance.request_id where " +
-             "instance.request_id is null and instance_request.request_id " +
-             "in (%s) and tenant = %s") %
-            (",".join(instance_spot_ids), tenant.db_id))
+        rows = queries.execute('unacquired_requests', instance_spot_ids,
+                               tenant.db_id)
 
+        by_request, by_id = index_reservations(reservations)
         for row in rows:
-            for r in reservations:
-                # Match the instance_request entry to an instance request
-                # returned from aws
-                for i in r.instances:
-                    if i.spot_instance_request_id == row['request_id']:
-                        # If one is found then update the database
-                        instance_acquired(i, row, tenant, conn)
-                    if i.id in row['request_id']:
-                        instance_acquired(i, row, tenant, conn)
+            # Match the instance_request entry to an instance request
+            # returned from aws. Ondemand requests are recorded with the
+            # instance id.
+            inst = by_request.get(row['request_id'])
+            if inst is None:
+                inst = by_id.get(row['request_id'])
+            if inst is not None:
+                # If one is found then update the database
+                instance_acquired(inst, row, tenant)
+
+
+def index_reservations(reservations):
+    """
+    Index the instances in a set of reservations by their spot request id
+    and by their instance id.
+    """
+    by_request = {}
+    by_id = {}
+    for r in reservations:
+        for i in r.instances:
+            if i.spot_instance_request_id is not None:
+                by_request[i.spot_instance_request_id] = i
+            by_id[i.id] = i
+    return by_request, by_id
 
 
 def request_ids_dict(reqs):
@@ -107,7 +128,7 @@ def request_ids_dict(reqs):
     return id_to_req
 
 
-def migrate_requests(tenants):
+def migrate_requests(tenants, snapshots=None):
     """
     If requests exist for a job that is no longer in the idle queue
     (e.g. it has been fulfilled or scheduled on other resources)
@@ -116,10 +137,10 @@ def migrate_requests(tenants):
     all existing requests tagged by a tenant.
     """
     for tenant in tenants:
-        conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
-        reqs = conn.get_all_spot_instance_requests(
-            filters={"tag-value": tenant.name,
-                     "state": "open"})
+        snapshot = get_snapshot(snapshots, tenant)
+        if snapshot is None:
+            continue
+        reqs = snapshot.open_requests(tenant.name)
 
         # Get a list of ids that can be used in a db query
         ids_to_check = []
@@ -166,31 +187,13 @@ def get_orphaned_requests(tenant, ids_to_check, idle_job_numbers):
     res = []
 
     if len(ids_to_check) > 0:
+        # Wait for any queued migrations to be written
+        ProvisionerConfig().dbwriter.barrier()
         try:
-            # Add quotes and commas to the list items for psql.
-            sir_ids = (', '.join('\'' + item + '\'' for item in ids_to_check))
             # Get any requests that do not belong to an idle job
-            rows = []
-            if len(idle_job_numbers) > 0:
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.id, instance_type.type, " +
-                     "instance_request.job_runner_id, " +
-                     "instance_request.request_id from instance_request, " +
-                     "instance_type where instance_request.instance_type = " +
-                     "instance_type.id and job_runner_id not in (%s) and " +
-                     "request_id in (%s) and request_type = 'spot' and " +
-                     "tenant = %s") %
-                    (",".join(idle_job_numbers), sir_ids,
-                     tenant.db_id))
-            else:
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.id, instance_type.type, " +
-                     "instance_request.job_runner_id, " +
-                     "instance_request.request_id from instance_request, " +
-                     "instance_type where instance_request.instance_type = " +
-                     "instance_type.id and " +
-                     "request_id in (%s) and request_type = 'spot' and " +
-                     "tenant = %s") % (sir_ids, tenant.db_id))
+            rows = queries.execute(
+                'orphaned_requests', [int(j) for j in idle_job_numbers],
+                ids_to_check, tenant.db_id)
             # I had some issues with the rows object closing after
             # returning it, so this just builds a dict for it
             for row in rows:
@@ -213,28 +216,24 @@ def migrate_request_to_job(request, job):
     # Check to see if the job can be fulfilled by the requested instance
     if check_requirements(request['type'], job):
         next_idle_job_id = job.id
-        try:
-            logger.debug(
-                ("Migrating instance request  %s, from job " +
-                 "%s to job %s.") %
-                (request['id'], request['job_runner_id'],
-                 next_idle_job_id))
-            ProvisionerConfig().dbconn.execute(
-                ("update instance_request set job_runner_id = '%s' " +
-                 "where id = %s") %
-                (next_idle_job_id, request['id']))
-            ProvisionerConfig().dbconn.execute(
-                ("insert into request_migration " +
-                 "(request_id, from_job, to_job, migration_time) " +
-                 "values (%s, %s, %s, NOW())") %
-                (request['id'], request['job_runner_id'],
-                 next_idle_job_id))
-            return True
-        except psycopg2.Error:
-            logger.exception("Error performing migration in database.")
-
-
-def cancel_unmigrated_requests(tenants):
+        logger.debug(
+            ("Migrating instance request  %s, from job " +
+             "%s to job %s.") %
+            (request['id'], request['job_runner_id'],
+             next_idle_job_id))
+        # The writes are queued, so errors are logged by the writer
+        ProvisionerConfig().dbwriter.update(
+            'instance_request', ('id', request['id']),
+            [('job_runner_id', next_idle_job_id)])
+        ProvisionerConfig().dbwriter.insert('request_migration', [
+            ('request_id', request['id']),
+            ('from_job', request['job_runner_id']),
+            ('to_job', next_idle_job_id),
+            ('migration_time', NOW)])
+        return True
+
+
+def cancel_unmigrated_requests(tenants, snapshots=None):
     """
     There are two cases to handle here. Either there are no idle jobs, so
     all requests should be cancelled.
@@ -243,9 +242,10 @@ def cancel_unmigrated_requests(tenants):
     """
     for tenant in tenants:
         # start by grabbing all of the open spot requests for this tenant
-        conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
-        reqs = conn.get_all_spot_instance_requests(
-            filters={"tag-value": tenant.name, "state": "open"})
+        snapshot = get_snapshot(snapshots, tenant)
+        if snapshot is None:
+            continue
+        reqs = snapshot.open_requests(tenant.name)
 
         # Get a list of ids that can be used in a db query
         ids_to_check = []
@@ -271,7 +271,8 @@ def cancel_unmigrated_requests(tenants):
             if len(reqs_to_cancel) > 0:
                 logger.debug("Cancelling unmigrated requests: %s" %
                              reqs_to_cancel)
-                conn.cancel_spot_instance_requests(ids_to_check)
+                with tenant_connection(tenant) as conn:
+                    conn.cancel_spot_instance_requests(ids_to_check)
         except Exception as e:
             logger.exception("Error removing spot instance requests.")
             raise e
@@ -286,9 +287,9 @@ def cancel_unnecessary_requests(tenants):
     """
     for tenant in tenants:
         # start by grabbing all of the open spot requests for this tenant
-        conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
-        reqs = conn.get_all_spot_instance_requests(
-            filters={"tag-value": tenant.name, "state": "open"})
+        with tenant_connection(tenant) as conn:
+            reqs = conn.get_all_spot_instance_requests(
+                filters={"tag-value": tenant.name, "state": "open"})
         # That should be sufficient, but just because spot requests are
         # scary lets double check and kill anything if there are no idle
         # jobs.
@@ -310,10 +311,11 @@ def cancel_unnecessary_requests(tenants):
                 logger.error("This should be deprecated if the other " +
                              "cancel function is working correctly.")
                 logger.debug("Cancelling spot requests: %s" % to_cancel)
-                conn.cancel_spot_instance_requests(to_cancel)
+                with tenant_connection(tenant) as conn:
+                    conn.cancel_spot_instance_requests(to_cancel)
 
 
-def instance_acquired(inst, request, tenant, conn):
+def instance_acquired(inst, request, tenant):
     """
     A new instance has been acquired, so insert a record into the instance
     table and tag it with the tenant name
@@ -321,20 +323,21 @@ def instance_acquired(inst, request, tenant, conn):
     launch_time = datetime.datetime.strptime(inst.launch_time,
                                              "%Y-%m-%dT%H:%M:%S.000Z")
     # insert it into the database
-    ProvisionerConfig().dbconn.execute(
-        ("insert into instance (request_id, instance_id, fulfilled_time, " +
-         "public_dns, private_dns) values ('%s', '%s', '%s', '%s', '%s')") %
-        (request['id'], inst.id, launch_time,
-         inst.public_dns_name, inst.private_dns_name))
+    ProvisionerConfig().dbwriter.insert('instance', [
+        ('request_id', request['id']),
+        ('instance_id', inst.id),
+        ('fulfilled_time', launch_time),
+        ('public_dns', inst.public_dns_name),
+        ('private_dns', inst.private_dns_name)])
     logger.debug("An instance has been acquired. " +
                  "Tenant={0}; Request={1}, Instance={2}".format(
                      tenant.name, repr(request), repr(inst)))
 
     # Update the launch stats table too.
-    update_launch_stats(inst, request, conn)
+    update_launch_stats(inst, request)
 
-    # now tag the request
-    api.tag_requests(inst.id, tenant.name, conn)
+    # now tag the instance
+    tag_queue.add(tenant, [inst.id])
 
     # if the job is still in the idle queue, we should remove it as the
     # instance was now launched for it
@@ -346,20 +349,16 @@ def instance_acquired(inst, request, tenant, conn):
             job.fulfilled = True
 
 
-def update_launch_stats(inst, request, conn):
+def update_launch_stats(inst, request):
     """
     Update the launch stats so we record how long instances take to be spun up.
     """
 
-    cmd = "update launch_stats set instance_id = '%s' where request_id = '%s'" % (
-        inst.id, request['request_id'])
-    ProvisionerConfig().dbconn.execute(cmd)
-    cmd = "update launch_stats set fulfilled_time = '%s' where request_id = '%s'" % (
-        inst.launch_time, request['request_id'])
-    ProvisionerConfig().dbconn.execute(cmd)
-    cmd = "update launch_stats set private_dns = '%s' where request_id = '%s'" % (
-        inst.private_dns_name, request['request_id'])
-    ProvisionerConfig().dbconn.execute(cmd)
+    ProvisionerConfig().dbwriter.update(
+        'launch_stats', ('request_id', request['request_id']),
+        [('instance_id', inst.id),
+         ('fulfilled_time', inst.launch_time),
+         ('private_dns', inst.private_dns_name)])
 
 
 def migrate_instance():
@@ -377,17 +376,5 @@ def check_requirements(instance, job):
     accepts both an Instance or str (aws instance type name
     e.g. m2.4xlarge)
     """
-    if isinstance(instance, basestring):
-        for ins in ProvisionerConfig().instance_types:
-            if ins.type == instance:
-                instance = ins
-                break
-
-    if int(instance.cpus) < int(job.req_cpus):
-        return False
-
-    if int(instance.memory) < int(job.req_mem):
-        return False
-
-    # It seems to meet the requirements
-    return True
+    return ProvisionerConfig().instance_catalog.check_requirements(
+        instance, job)
@@ -0,0 +1,113 @@
+import time
+import datetime
+import threading
+from pytz import timezone
+
+from scrimp import logger
+from scrimp.cloud.aws.connections import tenant_connection
+
+PRODUCT = "Linux/UNIX (Amazon VPC)"
+
+
+class SpotPriceView(object):
+    """
+    A read-only view of a spot price snapshot for a tenant, restricted to
+    the zones of its subnets.
+    """
+
+    def __init__(self, prices, zones):
+        self._prices = prices
+        self._zones = list(zones)
+
+    def __repr__(self):
+        return "SpotPriceView(%s)" % ', '.join(self._zones)
+
+    def get(self, ins_type):
+        """
+        Get the current spot price in each of the tenant's zones for an
+        instance type, as a new {zone: price} dict.
+        """
+        prices = self._prices.get(ins_type, {})
+        return dict((zone, prices[zone]) for zone in self._zones
+                    if zone in prices)
+
+
+def fetch_prices(conn, instance_types, when=None):
+    """
+    Get the spot price of each instance type in each zone at a time (now
+    by default) with a single, paginated, spot price history query.
+    Returns {instance type: {zone: price}}.
+    """
+    if when is None:
+        when = datetime.datetime.now(timezone('UTC'))
+    time_str = when.strftime('%Y-%m-%dT%H:%M:%SZ')
+    types = set(instance_types)
+    prices = {}
+    latest = {}
+    next_token = None
+    while True:
+        history = conn.get_spot_price_history(
+            start_time=time_str, end_time=time_str,
+            product_description=PRODUCT,
+            filters={'instance-type': sorted(types)},
+            next_token=next_token)
+        for price in history:
+            if price.instance_type not in types:
+                continue
+            key = (price.instance_type, price.availability_zone)
+            # keep the most recent price for each type and zone
+            if key in latest and latest[key] > price.timestamp:
+                continue
+            latest[key] = price.timestamp
+            prices.setdefault(price.instance_type, {})[
+                price.availability_zone] = price.price
+        next_token = getattr(history, 'next_token', None)
+        if not next_token:
+            break
+    return prices
+
+
+class SpotPriceService(object):
+    """
+    Snapshots of the current spot prices, shared by all tenants. The prices
+    of every configured instance type are fetched with one query per
+    account and region and cached for ttl seconds, and each tenant is given
+    a view of the snapshot for its own subnets.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def snapshot(self, tenant, instance_types):
+        """
+        Get the {instance type: {zone: price}} snapshot for a tenant's
+        account and region, fetching it if the cached one has expired.
+        """
+        types = tuple(sorted(set(ins.type for ins in instance_types)))
+        key = (tenant.access_key, getattr(tenant, 'region', None), types)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and time.time() - cached[0] < self.ttl:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        with tenant_connection(tenant) as conn:
+            prices = fetch_prices(conn, types)
+        with self.lock:
+            self.cache[key] = (time.time(), prices)
+        return prices
+
+    def view(self, tenant, instance_types):
+        """
+        Get a view of the current spot prices for a tenant's subnets.
+        """
+        return SpotPriceView(self.snapshot(tenant, instance_types),
+                             tenant.subnets)
+
+    def log_stats(self):
+        logger.debug("Spot price cache: %s hits, %s misses" %
+                     (self.hits, self.misses))
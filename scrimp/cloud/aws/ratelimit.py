@@ -0,0 +1,167 @@
+import time
+import threading
+
+import boto
+
+from scrimp import logger
+
+# The errors EC2 returns when an account's calls are being throttled
+THROTTLE_ERRORS = ('RequestLimitExceeded', 'Throttling')
+
+
+class TokenBucket(object):
+    """
+    Allow calls at rate per second, with bursts of up to burst calls. The
+    rate adapts to throttling: it is halved each time a call is throttled,
+    and grows by increase for each call that succeeds, back up to
+    max_rate (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, rate, burst, min_rate=0.5, increase=0.05):
+        self.rate = float(rate)
+        self.max_rate = float(rate)
+        self.min_rate = min_rate
+        self.increase = increase
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.time()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.waited = 0.0
+        self.throttles = 0
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available, and return how long
+        was waited. Tokens are reserved in order, so waiting callers are
+        spaced out rather than woken together.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = 0.0
+            if self.tokens < 0:
+                wait = -self.tokens / self.rate
+            self.calls += 1
+            self.waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            # stop the rest of the burst too
+            self.tokens = min(self.tokens, 0)
+            self.throttles += 1
+
+
+def mutating(method):
+    """
+    Whether a boto EC2Connection method changes anything (as opposed to a
+    describe), as EC2 limits the two separately.
+    """
+    return not method.startswith(('get_', 'describe_'))
+
+
+class RateLimiter(object):
+    """
+    A pair of token buckets for each AWS account (and region): one for
+    mutating calls and one for describes, like EC2's own limits.
+    """
+
+    def __init__(self, mutating_rate=5, mutating_burst=50,
+                 describe_rate=20, describe_burst=100, retries=2):
+        self.limits = {True: (mutating_rate, mutating_burst),
+                       False: (describe_rate, describe_burst)}
+        self.retries = retries
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def bucket(self, account, method):
+        key = (account, mutating(method))
+        with self.lock:
+            if key not in self.buckets:
+                self.buckets[key] = TokenBucket(*self.limits[key[1]])
+            return self.buckets[key]
+
+    def call(self, account, method, fn, *args, **kwargs):
+        """
+        Make a call once the account's bucket allows it. A throttled call
+        slows the bucket down and is retried.
+        """
+        bucket = self.bucket(account, method)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                res = fn(*args, **kwargs)
+            except boto.exception.BotoServerError as e:
+                if e.error_code not in THROTTLE_ERRORS:
+                    raise
+                bucket.throttled()
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                logger.warn("EC2 %s throttled, slowing to %.2f calls/s." %
+                            (method, bucket.rate))
+                continue
+            bucket.succeeded()
+            return res
+
+    def wrap(self, conn, account):
+        return RateLimitedConnection(conn, account, self)
+
+    def log_stats(self, reset=True):
+        """
+        Log the current rate, calls, time waited and throttles of each
+        bucket.
+        """
+        with self.lock:
+            buckets = sorted(self.buckets.items())
+        for (account, is_mutating), bucket in buckets:
+            with bucket.lock:
+                stats = (bucket.rate, bucket.calls, bucket.waited,
+                         bucket.throttles)
+                if reset:
+                    bucket.calls = 0
+                    bucket.waited = 0.0
+                    bucket.throttles = 0
+            logger.debug("EC2 rate %s %s: %.2f calls/s, %s calls, %.3fs "
+                         "waited, %s throttled" % (
+                             (account[0] or '')[-4:],
+                             'mutating' if is_mutating else 'describe',
+                             stats[0], stats[1], stats[2], stats[3]))
+
+
+class RateLimitedConnection(object):
+    """
+    A proxy for a boto EC2 connection that passes each method call through
+    the account's rate limiter.
+    """
+
+    def __init__(self, conn, account, limiter):
+        self._conn = conn
+        self._account = account
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name.startswith('_') or name == 'close' or not callable(attr):
+            return attr
+
+        def limited(*args, **kwargs):
+            return self._limiter.call(self._account, name, attr, *args,
+                                      **kwargs)
+        return limited
+
+
+# Limits the calls made with the shared connection pool
+rate_limits = RateLimiter()
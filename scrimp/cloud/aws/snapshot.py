@@ -0,0 +1,73 @@
+import boto
+from scrimp import logger
+from scrimp.cloud.aws.connections import tenant_connection
+
+
+class EC2Snapshot(object):
+    """
+    The state of an AWS account at the start of a provisioning cycle: its
+    reservations and open spot requests (with their tags). Tenants that
+    share credentials share a snapshot, so each account is described once
+    per cycle rather than once per tenant for each manager phase.
+    """
+
+    def __init__(self, conn):
+        # Instances probably are not yet tagged, so get all of them.
+        self.reservations = conn.get_all_instances()
+        self.spot_requests = conn.get_all_spot_instance_requests(
+            filters={"state": "open"})
+
+    def __repr__(self):
+        return "EC2Snapshot(%s reservations, %s open requests)" % (
+            len(self.reservations), len(self.spot_requests))
+
+    def open_requests(self, tag):
+        """
+        Get the open spot requests with a tag value of tag (e.g. the
+        tenant name), like the "tag-value" filter of the EC2 API.
+        """
+        return [r for r in self.spot_requests
+                if tag in getattr(r, 'tags', {}).values()]
+
+
+def credentials(tenant):
+    return (tenant.access_key, tenant.secret_key)
+
+
+def take_snapshot(tenant, connections=None):
+    try:
+        with tenant_connection(tenant, connections) as conn:
+            return EC2Snapshot(conn)
+    except boto.exception.EC2ResponseError:
+        logger.exception("There was an error communicating with EC2.")
+    return None
+
+
+def take_snapshots(tenants, connections=None, executor=None):
+    """
+    Take one snapshot for each set of credentials used by the tenants. If
+    an executor is given, the accounts are described concurrently.
+    """
+    accounts = {}
+    for tenant in tenants:
+        accounts.setdefault(credentials(tenant), tenant)
+    if executor is None:
+        taken = [take_snapshot(t, connections) for t in accounts.values()]
+    else:
+        taken = executor.map('describe',
+                             lambda t: take_snapshot(t, connections),
+                             accounts.values())
+    return dict((key, snapshot) for key, snapshot in
+                zip(accounts.keys(), taken) if snapshot is not None)
+
+
+def get_snapshot(snapshots, tenant):
+    """
+    Get the snapshot for a tenant's account, taking a new one if it is not
+    in snapshots (or snapshots is None).
+    """
+    if snapshots is None:
+        snapshots = {}
+    if credentials(tenant) not in snapshots:
+        snapshots.update(take_snapshots([tenant]))
+    return snapshots.get(credentials(tenant))
@@ -0,0 +1,182 @@
+import time
+import random
+import threading
+
+from scrimp import logger
+from scrimp.cloud.aws.connections import tenant_connection
+
+
+class TagBatch(object):
+    """
+    Resources to tag with a tenant's name in one call.
+    """
+
+    def __init__(self, tenant, ids):
+        self.tenant = tenant
+        self.ids = ids
+        self.attempts = 0
+        self.due = 0
+
+    def __repr__(self):
+        return "TagBatch(%s, %s ids, %s attempts)" % (
+            self.tenant.name, len(self.ids), self.attempts)
+
+
+class TagQueue(object):
+    """
+    Tag new spot requests and instances with their tenant's name in the
+    background, so tagging never holds up the provisioning loop. Ids are
+    accumulated for each tenant for interval seconds and then tagged with
+    both tags in multi-resource create_tags calls. A call that fails is
+    retried after a jittered exponential backoff, up to max_attempts times,
+    before the batch is split.
+    """
+
+    def __init__(self, interval=1, batch_size=200, max_attempts=6,
+                 base_delay=1, max_delay=60):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending = {}
+        self.retries = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.running = False
+        self.tagged = 0
+        self.retried = 0
+        self.failed = 0
+
+    def add(self, tenant, resource_ids):
+        """
+        Queue resources to be tagged with the tenant's name.
+        """
+        if len(resource_ids) == 0:
+            return
+        key = (tenant.access_key, tenant.secret_key,
+               getattr(tenant, 'region', None), tenant.name)
+        with self.lock:
+            self.pending.setdefault(key, (tenant, []))[1].extend(
+                resource_ids)
+
+    def __len__(self):
+        """
+        The number of ids waiting to be tagged, including retries.
+        """
+        with self.lock:
+            return (sum(len(ids) for t, ids in self.pending.values()) +
+                    sum(len(b.ids) for b in self.retries))
+
+    def due(self, now):
+        """
+        Take the batches to tag now: everything newly queued, and the
+        retries whose backoff has passed.
+        """
+        with self.lock:
+            batches = []
+            for tenant, ids in self.pending.values():
+                for i in range(0, len(ids), self.batch_size):
+                    batches.append(TagBatch(tenant,
+                                            ids[i:i + self.batch_size]))
+            self.pending = {}
+            waiting = []
+            for batch in self.retries:
+                if batch.due <= now:
+                    batches.append(batch)
+                else:
+                    waiting.append(batch)
+            self.retries = waiting
+        return batches
+
+    def backoff(self, attempts):
+        """
+        How long to wait before the next attempt: a random time up to an
+        exponentially increasing limit, so retries from many batches (and
+        provisioners) are spread out.
+        """
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempts))
+
+    def tag(self, batch):
+        """
+        Tag a batch, putting it back to be retried if the call fails. A
+        batch that keeps failing is split in half, so one bad id does not
+        stop the rest being tagged, and a single id is dropped.
+        """
+        name = batch.tenant.name
+        try:
+            with tenant_connection(batch.tenant) as conn:
+                conn.create_tags(batch.ids, {"tenant": name,
+                                             "Name": 'worker@%s' % name})
+            with self.lock:
+                self.tagged += len(batch.ids)
+            return
+        except Exception as e:
+            batch.attempts += 1
+            if batch.attempts < self.max_attempts:
+                batch.due = time.time() + self.backoff(batch.attempts)
+                retries = [batch]
+                logger.debug("Failed to tag %s, retrying: %s" % (batch, e))
+            elif len(batch.ids) > 1:
+                half = len(batch.ids) // 2
+                retries = [TagBatch(batch.tenant, batch.ids[:half]),
+                           TagBatch(batch.tenant, batch.ids[half:])]
+                logger.debug("Failed to tag %s, splitting it: %s" %
+                             (batch, e))
+            else:
+                with self.lock:
+                    self.failed += len(batch.ids)
+                logger.error("Failed to tag %s for %s after %s attempts: %s" %
+                             (batch.ids, name, batch.attempts, e))
+                return
+            with self.lock:
+                self.retried += len(batch.ids)
+                self.retries.extend(retries)
+
+    def flush(self):
+        """
+        Tag everything that is due.
+        """
+        for batch in self.due(time.time()):
+            self.tag(batch)
+
+    def run(self):
+        while self.running:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Tag queue failed to tag.")
+
+    def start(self):
+        """
+        Start the background tagging thread.
+        """
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='tagqueue')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, tagging anything that is due.
+        """
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def log_stats(self):
+        logger.debug("Tags: %s pending, %s tagged, %s retried, %s failed" %
+                     (len(self), self.tagged, self.retried, self.failed))
+
+
+# Tags the requests and instances made by the provisioner
+tag_queue = TagQueue()
@@ -0,0 +1,50 @@
+import threading
+from scrimp import logger, queries
+
+
+class TerminationReconciler(object):
+    """
+    Record terminated instances in the instance table. AWS keeps reporting
+    terminated instances for a while, so the ids already recorded for each
+    account are remembered and only newly terminated instances are written,
+    all in one statement. The remembered ids are pruned to those AWS still
+    reports, so the set stays bounded.
+    """
+
+    def __init__(self):
+        self.recorded = {}
+        self.lock = threading.Lock()
+
+    def terminated(self, reservations):
+        """
+        Get the {instance id: reason} of the terminated instances.
+        """
+        res = {}
+        for r in reservations:
+            for i in r.instances:
+                if i.state == 'terminated':
+                    reason = i.state_reason
+                    res[i.id] = reason['message'] if reason else ''
+        return res
+
+    def reconcile(self, account, reservations):
+        """
+        Set the terminate time of any newly terminated instances in an
+        account. Returns the ids that were written.
+        """
+        terminated = self.terminated(reservations)
+        with self.lock:
+            recorded = self.recorded.get(account, set())
+            new = [i for i in terminated if i not in recorded]
+        if len(new) > 0:
+            # Sadly, I can't seem to get the actual shutdown time
+            # i.state_reason does not contain it and i.state does not
+            # exist. So instead, we will just flag it as now and sort
+            # out determining the full hour when computing cost.
+            queries.execute('record_terminations', new,
+                            [terminated[i] for i in new])
+            logger.debug("Recorded terminated instances: %s" % new)
+        with self.lock:
+            self.recorded[account] = (recorded | set(new)) & set(terminated)
+        return new
+
@@ -1,5 +1,7 @@
 from scrimp.cloud.simaws.sim_resource import SimResource
 from scrimp.cloud.simaws.sim_request import SimRequest
+from scrimp.cloud.simaws.sim_events import SimEventQueue
+from scrimp.cloud.simaws.sim_prices import SpotPriceTrace
 
 from . import api
 from . import manager
@@ -1,24 +1,27 @@
 import boto
-from scrimp import ProvisionerConfig, logger
+from scrimp import ProvisionerConfig, logger, queries
+from scrimp.cloud.aws.connections import tenant_connection
+from scrimp.cloud.aws.prices import SpotPriceView, fetch_prices
 
 
 def get_spot_prices(instances, tenant):
     """
-    Get the current spot price for each instance type.
+    Get the spot price for each instance type at the simulated time.
     """
     new_time = ProvisionerConfig().simulate_time
-    now = new_time.strftime('%Y-%m-%d %H:%M:%S')
-    conn = boto.connect_ec2(tenant.access_key, tenant.secret_key)
-    timeStr = str(now).replace(" ", "T") + "Z"
-    for ins in instances:
-        prices = conn.get_spot_price_history(
-            instance_type=ins.type,
-            product_description="Linux/UNIX (Amazon VPC)",
-            end_time=timeStr, start_time=timeStr)
-        for price in prices:
+    trace = ProvisionerConfig().simulator.spot_prices
+    prices = {}
+    if trace is not None:
+        for ins in instances:
             for key, val in tenant.subnets.iteritems():
-                if price.availability_zone == key:
-                    ins.spot.update({price.availability_zone: price.price})
+                price = trace.price_at(ins.type, key, new_time)
+                if price is not None:
+                    prices.setdefault(ins.type, {})[key] = price
+    else:
+        with tenant_connection(tenant) as conn:
+            prices = fetch_prices(conn, [ins.type for ins in instances],
+                                  new_time)
+    tenant.spot_prices = SpotPriceView(prices, tenant.subnets)
 
 
 def tag_requests(req, tag, conn):
@@ -59,28 +62,20 @@ def launch_spot_request(conn, request, tenant, job):
             # tag each request
             tag_requests(req, tenant.name, conn)
 
-            ProvisionerConfig().dbconn.execute(
-                ("insert into instance_request (tenant, instance_type, " +
-                 "price, job_runner_id, request_type, request_id, " +
-                 "subnet, cost_aware_ins, cost_aware_bid, " +
-                 "cost_aware_subnet, " +
-                 "drafts_ins, drafts_bid, drafts_subnet, selected_avg_price, "
-                 "cost_aware_avg_price, drafts_avg_price, drafts_avg_ins, " +
-                 "drafts_avg_bid, drafts_avg_subnet, drafts_avg_avg_price) " +
-                 "values ('%s', '%s', %s, '%s', '%s', '%s', %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)") %
-                (tenant.db_id, request.instance.db_id, request.OraclePrice,
-                 job.id,
-                 "spot", req, tenant.subnets_db_id[request.zone],
-                 cost_aware_req.instance.db_id, cost_aware_req.bid,
-                 tenant.subnets_db_id[cost_aware_req.zone],
-                 drafts_req.instance.db_id,
-                 drafts_req.DrAFTS, tenant.subnets_db_id[drafts_req.zone],
-                 request.AvgPrice, cost_aware_req.AvgPrice,
-                 drafts_req.AvgPrice,
-                 drafts_avg.instance.db_id, drafts_avg.DrAFTS,
-                 tenant.subnets_db_id[
-                     drafts_avg.zone],
-                 drafts_avg.AvgPrice))
+            queries.execute(
+                'insert_spot_request',
+                tenant.db_id, request.instance.db_id, request.OraclePrice,
+                job.id,
+                "spot", req, tenant.subnets_db_id[request.zone],
+                cost_aware_req.instance.db_id, cost_aware_req.bid,
+                tenant.subnets_db_id[cost_aware_req.zone],
+                drafts_req.instance.db_id,
+                drafts_req.DrAFTS, tenant.subnets_db_id[drafts_req.zone],
+                request.AvgPrice, cost_aware_req.AvgPrice,
+                drafts_req.AvgPrice,
+                drafts_avg.instance.db_id, drafts_avg.DrAFTS,
+                tenant.subnets_db_id[drafts_avg.zone],
+                drafts_avg.AvgPrice)
 
         return my_req_ids
     except boto.exception.EC2ResponseError:
@@ -1,9 +1,11 @@
 import sys
 from scrimp import SimpleStringifiable
-from scrimp import logger, ProvisionerConfig
+from scrimp import logger, ProvisionerConfig, queries
 import boto
 from sim_request import SimRequest
-from sim_resource import SimResource
+from sim_resource import SimResource, SimResourceTable
+from sim_prices import SpotPriceTrace
+import sim_resource
 import datetime
 import threading
 import random
@@ -22,8 +24,13 @@ class AWSSimulator(SimpleStringifiable):
         self.kill_time = 1400000
         self.already_terminated = []
         self.requests = []
+        # The open requests for each job, kept in step with self.requests
+        self.job_requests = {}
 
         self.resources = []
+        # The state of every resource is kept in columns so that each tick
+        # can be evaluated with array operations
+        self.resource_table = SimResourceTable(ProvisionerConfig().sim_time)
 
         self.finished_jobs = []
         self.executing_jobs = []
@@ -35,6 +42,12 @@ class AWSSimulator(SimpleStringifiable):
 
         self.make_distributions()
 
+        # Recorded spot prices to use instead of the AWS API, if given
+        self.spot_prices = None
+        if ProvisionerConfig().spot_price_file:
+            self.spot_prices = SpotPriceTrace(
+                ProvisionerConfig().spot_price_file)
+
         # read the resource fulfillment times into a list
         self.fulfill_time = [0]
 
@@ -42,10 +55,7 @@ class AWSSimulator(SimpleStringifiable):
         self.turn = 0
 
     def make_distributions(self):
-        cmd = ("select extract(epoch from(exec_start_time - join_time)) from"
-               " launch_stats where exec_start_time is not null and "
-               "extract(epoch from(exec_start_time - join_time)) < 300;")
-        data = ProvisionerConfig().dbconn.execute(cmd)
+        data = queries.execute('negotiate_times')
         neg_list = []
         for r in data:
             neg_list.append(r['date_part'])
@@ -57,10 +67,7 @@ class AWSSimulator(SimpleStringifiable):
         mu, sigma = 7.118134, 0.895632  # mean and standard deviation
         self.fulfilled_time_dist = list(np.random.normal(mu, sigma, 10000))
 
-        cmd = ("select extract(epoch from(join_time - fulfilled_time)) from "
-               "launch_stats where exec_start_time is not null and "
-               "extract(epoch from(join_time - fulfilled_time)) < 300;")
-        data = ProvisionerConfig().dbconn.execute(cmd)
+        data = queries.execute('contextualise_times')
         context_list = []
         for r in data:
             context_list.append(r['date_part'])
@@ -79,14 +86,85 @@ class AWSSimulator(SimpleStringifiable):
                 len = len + 1
                 if job.sim_status != 'FINISHED':
                     return False
-        for res in self.resources:
-            len = len + 1
-            if res.state != 'TERMINATED':
-                return False
+        states = self.resource_table.column('state')
+        len = len + states.size
+        if np.any(states != sim_resource.TERMINATED):
+            return False
         if len == 0:
             return False
         return True
 
+    def schedule_events(self, events):
+        """
+        Add the times at which the simulated AWS resources and requests
+        will next change state to the event queue.
+        """
+        current_time = ProvisionerConfig().simulate_time
+        terminate = ProvisionerConfig().terminate
+
+        # Stop the simulation at the kill time even if nothing else is due
+        events.push(ProvisionerConfig().sim_time + datetime.timedelta(
+            seconds=self.kill_time), 'kill', strict=True)
+
+        for request in self.requests:
+            events.push(request.ready_time, 'request ready')
+
+        table = self.resource_table
+        now = table.to_seconds(current_time)
+        state = table.column('state')
+
+        def push_first(mask, seconds, kind, strict=False):
+            if np.any(mask):
+                events.push(table.to_time(np.min(seconds[mask])), kind,
+                            strict)
+
+        # run_condor checks the finish time of any resource with a job, even
+        # one that has since been terminated.
+        job_finish = table.column('job_finish')
+        push_first(~np.isnan(job_finish) &
+                   ((state == sim_resource.EXECUTING) |
+                    ~table.due('job_finish', now, strict=True)),
+                   job_finish, 'job finish', strict=True)
+        # and simulate() frees, on the next run, any resource still executing
+        # a job that has finished on another resource.
+        for i in np.flatnonzero(state == sim_resource.EXECUTING):
+            if self.resources[i].job_id not in self.executing_jobs:
+                events.push(current_time, 'job finish', strict=True)
+                break
+
+        live = state != sim_resource.TERMINATED
+        if not np.any(live):
+            return
+
+        push_first(state == sim_resource.CONTEXTUALIZING,
+                   table.column('context_time'), 'contextualized')
+        push_first(state == sim_resource.UNCLAIMED,
+                   table.column('claimed_time'), 'claimed')
+
+        # Idle resources are handed any waiting job on the next run
+        if np.any(state == sim_resource.IDLE):
+            for t in self.tenants:
+                if any(job.sim_status == 'IDLE' for job in t.jobs):
+                    events.push(current_time, 'deploy', strict=True)
+                    break
+
+        # The times at which the termination policy will apply
+        launch = table.column('launch_time')
+        age = now - launch
+        if terminate == "hourly":
+            hours = np.floor(age / 3600) + ((age % 3600) > 3480)
+            push_first(live, launch + hours * 3600 + 3481, 'terminate')
+        elif terminate == "1hour":
+            push_first(live & (age <= 3480), launch + 3480, 'terminate',
+                       strict=True)
+        elif terminate == "idle":
+            push_first(live & (age <= 600), launch + 600, 'terminate',
+                       strict=True)
+
+        # Running resources have their bid checked against the spot price
+        # every minute.
+        events.push_every(current_time, 60, 'price check')
+
     def run_condor(self, tenants):
         """
         Be the condor agent. This will manage putting jobs on
@@ -113,31 +191,34 @@ class AWSSimulator(SimpleStringifiable):
                     job.sim_status = "EXECUTING"
                     if job in t.idle_jobs:
                         t.idle_jobs.remove(job)
+            # Find the resources whose jobs have finished by now
+            table = self.resource_table
+            finishing = {}
+            for i in np.flatnonzero(table.due(
+                    'job_finish', table.to_seconds(current_time),
+                    strict=True)):
+                resource = self.resources[i]
+                finishing.setdefault(resource.job_id, []).append(resource)
             for t in tenants:
                 for job in t.jobs:
-                    for resource in self.resources:
-                        if (job.id == resource.job_id and
-                            resource.job_finish is not None and
-                                resource.job_finish < current_time):
-                            # Mark it as all done
-                            job.sim_status = "FINISHED"
-                            resource.state = "IDLE"
-                            if job.id in self.executing_jobs:
-                                self.executing_jobs.remove(job.id)
-                            if job.id not in self.finished_jobs:
-
-                                self.finished_jobs = self.finished_jobs + \
-                                    [job.id]
-                                logger.debug(
-                                    "SIMULATION CONDOR: Finished " +
-                                    "job %s." % (job.id))
-                                # resource.state = "IDLE"
-                                ProvisionerConfig().dbconn.execute(
-                                    ("update jobs set end_time = '%s' " +
-                                     "where job_id = %s and test = '%s';") % (
-                                        ProvisionerConfig().simulate_time,
-                                        int(job.id),
-                                        ProvisionerConfig().run_name))
+                    for resource in finishing.get(job.id, []):
+                        # Mark it as all done
+                        job.sim_status = "FINISHED"
+                        resource.state = "IDLE"
+                        if job.id in self.executing_jobs:
+                            self.executing_jobs.remove(job.id)
+                        if job.id not in self.finished_jobs:
+
+                            self.finished_jobs = self.finished_jobs + \
+                                [job.id]
+                            logger.debug(
+                                "SIMULATION CONDOR: Finished " +
+                                "job %s." % (job.id))
+                            # resource.state = "IDLE"
+                            queries.execute(
+                                'finish_job',
+                                ProvisionerConfig().simulate_time,
+                                int(job.id), ProvisionerConfig().run_name)
 
             logger.debug("SIMULATION CONDOR: deploying new jobs.")
             for t in tenants:
@@ -162,6 +243,8 @@ class AWSSimulator(SimpleStringifiable):
     def run_aws(self):
         """
         This is the aws loop. Check if instances should be fulfilled etc.
+        The resource state transitions and termination rules are evaluated
+        for every resource at once using the columns of the resource table.
         """
         logger.debug("SIMULATION AWS: starting.")
 
@@ -181,7 +264,8 @@ class AWSSimulator(SimpleStringifiable):
                     logger.debug("SIMULATION AWS: creating a new resource " +
                                  "for request %s, has slept %s" % (
                                      request, request.sleep_time))
-                    new_resource = SimResource(request.price, request.subnet,
+                    new_resource = SimResource(self.resource_table,
+                                               request.price, request.subnet,
                                                request.type,
                                                request.request_time,
                                                request.reqid, insid,
@@ -191,123 +275,133 @@ class AWSSimulator(SimpleStringifiable):
                     self.resources = self.resources + [new_resource]
                     # and remove the request since it is done
                     self.instance_acquired(new_resource)
-                    self.requests.remove(request)
+                    self.remove_request(request)
+
+            table = self.resource_table
+            now = table.to_seconds(current_time)
+            state = table.column('state')
 
             # Now check to see if any instances should have booted by now.
             # This handles working out when the instance joins the HTCondor
             # queue and when jobs get dispatched.
-            for resource in self.resources:
-                # First check if the resource is in the contextualzing state.
-                if (resource.state == 'CONTEXTUALIZING' and
-                        current_time >= resource.context_time):
-                    # Switch it over to Starting with a neg time
-                    resource.state = 'UNCLAIMED'
-                    wait_time = int(random.choice(self.negotiate_time_dist))
-                    resource.claimed_time = current_time + \
-                        datetime.timedelta(seconds=wait_time)
-
-                elif resource.state == 'UNCLAIMED':
-                    # check if the timer has passed:
-                    logger.debug('SIMULATION: trying to become ' +
-                                 'unclaimed %s seconds remaining' % (
-                                     resource.claimed_time - current_time).total_seconds())
-                    if (resource.claimed_time -
-                            current_time).total_seconds() <= 0:
-                        # check if any jobs are in an idle state
-                        new_claim = self.check_claim(resource)
-                        if new_claim:
-                            resource.state = 'IDLE'
-                            logger.debug('Set resource to idle')
-                            continue
-                        else:
-                            # otherwise, set it back to 'starting so it
-                            # becomes unclaimed again'
-                            resource.claimed_time = current_time + \
-                                datetime.timedelta(seconds=int(
-                                    random.choice(self.negotiate_time_dist)))
-                            resource.state = 'UNCLAIMED'
-                            logger.debug(
-                                'SIMULATION no idle job found, setting ' +
-                                'back to UNCLAIMED')
+            # Resources that have finished contextualizing start waiting to
+            # be claimed
+            contextualized = ((state == sim_resource.CONTEXTUALIZING) &
+                              table.due('context_time', now))
+            # and those that have waited long enough become idle if there is
+            # an idle job that could use them.
+            unclaimed = ((state == sim_resource.UNCLAIMED) &
+                         table.due('claimed_time', now))
+            claimable = np.zeros(len(table.types), dtype=bool)
+            for type_index in np.unique(table.column('type_index')[unclaimed]):
+                claimable[type_index] = self.check_claim(
+                    self.resources[np.flatnonzero(
+                        unclaimed & (table.column('type_index') ==
+                                     type_index))[0]])
+            claimed = unclaimed & claimable[table.column('type_index')]
+            state[claimed] = sim_resource.IDLE
+
+            # otherwise, set it back to 'starting so it becomes unclaimed
+            # again'. The waits are drawn in resource order.
+            waiting = np.flatnonzero(contextualized | (unclaimed & ~claimed))
+            waits = [int(random.choice(self.negotiate_time_dist))
+                     for i in waiting]
+            table.column('claimed_time')[waiting] = now + np.array(
+                waits, dtype=np.float64)
+            state[contextualized] = sim_resource.UNCLAIMED
+            logger.debug("SIMULATION: %s resources contextualized, %s set to "
+                         "idle, %s found no idle job" % (
+                             np.count_nonzero(contextualized),
+                             np.count_nonzero(claimed),
+                             np.count_nonzero(unclaimed & ~claimed)))
 
             # check if any instances should terminate due to time
-            terminate_resources = {}
-            for resource in self.resources:
-                if ProvisionerConfig().terminate == "hourly":
-                    if (resource.state != 'EXECUTING' and
-                        (int((current_time -
-                              resource.launch_time).total_seconds() % 3600) >
-                         3480) and resource.state != 'TERMINATED'):
-                        # now checking this when killing anything
-                        # over 3480 secs...
-                        logger.debug("SIMULATION AWS. Terminating resource "
-                                     "due to time: %s" % resource)
-                        # terminate the job
-                        resource.reason = "time related"
-                        resource.state = "TERMINATED"
-                        resource.terminate_time = self.get_fake_time()
-                elif ProvisionerConfig().terminate == "1hour":
-                    # now checking this when killing anything over 3480 secs...
-                    if (resource.state != 'EXECUTING' and
-                        (current_time - resource.launch_time).total_seconds()
-                            > 3480 and resource.state != 'TERMINATED'):
-                        logger.debug("SIMULATION AWS. Terminating resource "
-                                     "due to time: %s" % resource)
-                        # terminate the job
-                        resource.reason = "time related"
-                        resource.state = "TERMINATED"
-                        resource.terminate_time = self.get_fake_time()
-                elif ProvisionerConfig().terminate == "idle":
-                    if (resource.state == 'IDLE' and
-                        resource.state != 'TERMINATED' and
-                        (int((current_time -
-                              resource.launch_time).total_seconds()) > 600)):
-                        # now checking this when killing anything over
-                        # 3480 secs...
-                        logger.debug(
-                            "SIMULATION AWS. Terminating resource due "
-                            "to time: %s" % resource)
-                        # terminate the job
-                        resource.reason = "time related"
-                        resource.state = "TERMINATED"
-                        resource.terminate_time = self.get_fake_time()
-
-                # Sort out the job that was running on this instance,
-                # put it back to idle.
-                if resource.state != "TERMINATED":
-                    # only do this every 10 seconds
-                    if (ProvisionerConfig().simulate_time -
-                            ProvisionerConfig().sim_time).total_seconds() % 60 == 0:
-                        for t in self.tenants:
-                            if resource.type in terminate_resources:
-                                if terminate_resources[resource.type] is False:
-                                    continue
-                            if (float(resource.price) <
-                                    float(self.get_spot_prices(resource, t))):
-                                logger.debug(
-                                    "SIMULATION: terminating resource "
-                                    "due to price %s" % resource)
-
-                                for job in t.jobs:
-                                    if job.id == resource.job_id:
-
-                                        job.sim_status = 'IDLE'
-                                        if job.id in self.executing_jobs:
-                                            self.executing_jobs.remove(job.id)
-                                        if job not in t.idle_jobs:
-                                            t.idle_jobs = t.idle_jobs + [job]
-                                # now terminate the instance
-                                logger.debug('terminating instance due '
-                                             'to price: %s %s' % (
-                                                 resource.price,
-                                                 self.get_spot_prices(resource, t)))
-                                resource.state = "TERMINATED"
-                                resource.reason = ("spot instance termination "
-                                                   "due to spot price")
-                                resource.terminate_time = self.get_fake_time()
-                                # self.resources.remove(resource)
-                            else:
-                                terminate_resources[resource.type] = False
+            age = now - table.column('launch_time')
+            live = state != sim_resource.TERMINATED
+            expired = np.zeros(table.size, dtype=bool)
+            if ProvisionerConfig().terminate == "hourly":
+                expired = (live & (state != sim_resource.EXECUTING) &
+                           ((age % 3600).astype(np.int64) > 3480))
+            elif ProvisionerConfig().terminate == "1hour":
+                # now checking this when killing anything over 3480 secs...
+                expired = (live & (state != sim_resource.EXECUTING) &
+                           (age > 3480))
+            elif ProvisionerConfig().terminate == "idle":
+                expired = ((state == sim_resource.IDLE) &
+                           (np.trunc(age) > 600))
+            for i in np.flatnonzero(expired):
+                logger.debug("SIMULATION AWS. Terminating resource "
+                             "due to time: %s" % self.resources[i])
+                self.resources[i].reason = "time related"
+            state[expired] = sim_resource.TERMINATED
+            table.column('terminate_time')[expired] = now
+
+            # Sort out the job that was running on this instance,
+            # put it back to idle.
+            # only do this every 60 seconds
+            if (ProvisionerConfig().simulate_time -
+                    ProvisionerConfig().sim_time).total_seconds() % 60 == 0:
+                self.check_spot_prices(state != sim_resource.TERMINATED)
+
+    def check_spot_prices(self, live):
+        """
+        Terminate resources whose bid is below the current spot price and
+        put the jobs that were running on them back to idle.
+        Resources are checked in order for each tenant, and once one
+        resource of a type survives the check, the remaining resources of
+        that type are assumed to be safe too.
+        """
+        table = self.resource_table
+        now = table.to_seconds(ProvisionerConfig().simulate_time)
+        type_index = table.column('type_index')
+        subnet_index = table.column('subnet_index')
+        price = table.column('price')
+        hits = np.zeros((table.size, len(self.tenants)), dtype=bool)
+        spots = np.zeros((table.size, len(self.tenants)))
+        for ins_type in np.unique(type_index[live]):
+            rows = np.flatnonzero(live & (type_index == ins_type))
+            # the spot price of each subnet this type is running in
+            subnets, inverse = np.unique(subnet_index[rows],
+                                         return_inverse=True)
+            below = np.zeros((rows.size, len(self.tenants)), dtype=bool)
+            for k, t in enumerate(self.tenants):
+                spots[rows, k] = np.array([self.get_spot_price(
+                    table.types[ins_type], table.subnets[s], t)
+                    for s in subnets])[inverse]
+                below[:, k] = price[rows] < spots[rows, k]
+
+            # Everything up to the first resource/tenant pair that survives
+            # is terminated.
+            checked = below.ravel()
+            survivors = np.flatnonzero(~checked)
+            first = survivors[0] if survivors.size > 0 else checked.size
+            hit = np.zeros(checked.size, dtype=bool)
+            hit[:first] = True
+            hits[rows] = hit.reshape(below.shape)
+
+        # Put the jobs back to idle in resource order, as they would be if
+        # each resource were checked in turn
+        for n, k in zip(*np.nonzero(hits)):
+            resource = self.resources[n]
+            t = self.tenants[k]
+            logger.debug("SIMULATION: terminating resource "
+                         "due to price %s" % resource)
+            for job in t.jobs:
+                if job.id == resource.job_id:
+
+                    job.sim_status = 'IDLE'
+                    if job.id in self.executing_jobs:
+                        self.executing_jobs.remove(job.id)
+                    if job not in t.idle_jobs:
+                        t.idle_jobs = t.idle_jobs + [job]
+            # now terminate the instance
+            logger.debug('terminating instance due '
+                         'to price: %s %s' % (resource.price, spots[n, k]))
+            resource.reason = ("spot instance termination "
+                               "due to spot price")
+        terminated = np.any(hits, axis=1)
+        table.column('state')[terminated] = sim_resource.TERMINATED
+        table.column('terminate_time')[terminated] = now
 
     def simulate(self, _tenants):
         """
@@ -326,29 +420,20 @@ class AWSSimulator(SimpleStringifiable):
                     idle_jobs = idle_jobs + [job.id]
 
         # get some counts to print out
-        terminated_time_instances = []
-        terminated_price_instances = []
-        starting_instances = []
-        unclaimed_instances = []
-        idle_instances = []
-        executing_instances = []
-
-        for res in self.resources:
-            if res.state == "IDLE":
-                idle_instances = idle_instances + [res.id]
-            elif res.state == "EXECUTING":
-                executing_instances = executing_instances + [res.id]
-            elif res.state == "STARTING" or res.state == "CONTEXTUALIZING":
-                starting_instances = starting_instances + [res.id]
-            elif res.state == "UNCLAIMED":
-                unclaimed_instances = unclaimed_instances + [res.id]
-            elif res.state == "TERMINATED":
-                if 'time' in res.reason:
-                    terminated_time_instances = terminated_time_instances + \
-                        [res.id]
-                if 'price' in res.reason:
-                    terminated_price_instances = terminated_price_instances + \
-                        [res.id]
+        state = self.resource_table.column('state')
+        starting_instances = np.count_nonzero(
+            (state == sim_resource.STATE_CODES['STARTING']) |
+            (state == sim_resource.CONTEXTUALIZING))
+        unclaimed_instances = np.count_nonzero(state == sim_resource.UNCLAIMED)
+        idle_instances = np.count_nonzero(state == sim_resource.IDLE)
+        executing_instances = np.count_nonzero(state == sim_resource.EXECUTING)
+        terminated_time_instances = 0
+        terminated_price_instances = 0
+        for i in np.flatnonzero(state == sim_resource.TERMINATED):
+            if 'time' in self.resources[i].reason:
+                terminated_time_instances = terminated_time_instances + 1
+            if 'price' in self.resources[i].reason:
+                terminated_price_instances = terminated_price_instances + 1
 
         logger.debug("\nSIMULATION OVERVIEW: requests (cur: %s -- total: %s), "
                      "resources (%s), jobs (%s)\n" %
@@ -363,10 +448,10 @@ class AWSSimulator(SimpleStringifiable):
         logger.debug("\nSIMULATION RESOURCE OVERVIEW: starting (%s), "
                      "idle (%s), unclaimed (%s), executing (%s), "
                      "terminated-time (%s), terminated-price (%s)\n" % (
-                         len(starting_instances), len(idle_instances),
-                         len(unclaimed_instances), len(executing_instances),
-                         len(terminated_time_instances),
-                         len(terminated_price_instances)))
+                         starting_instances, idle_instances,
+                         unclaimed_instances, executing_instances,
+                         terminated_time_instances,
+                         terminated_price_instances))
         total_run_seconds = (ProvisionerConfig().simulate_time -
                              ProvisionerConfig().sim_time).total_seconds()
         logger.debug("\nSIMULATION TIME OVERVIEW: start time (%s), "
@@ -394,9 +479,9 @@ class AWSSimulator(SimpleStringifiable):
                         t.idle_jobs.remove(job)
 
         # try cleaning up the instance state too
-        for res in self.resources:
-            if (res.state == "EXECUTING" and
-                    res.job_id not in self.executing_jobs):
+        executing = np.flatnonzero(state == sim_resource.EXECUTING)
+        for res in [self.resources[i] for i in executing]:
+            if res.job_id not in self.executing_jobs:
                 # somehow this one should have finished...
                 # try to just wrap it up now
                 res.job_id = None
@@ -420,37 +505,38 @@ class AWSSimulator(SimpleStringifiable):
     def deploy_job(self, job):
         current_time = ProvisionerConfig().simulate_time
         instance_types = ProvisionerConfig().instance_types
-        for resource in self.resources:
-            if resource.state == "IDLE":
-                for instance in instance_types:
-                    # check that it fits this instance
-                    if (resource.type == instance.type and
-                            self.check_requirements(instance, job)):
-
-                        # this is now good, so lets put it on there.
-                        resource.job_id = job.id
-                        # set the time for the job to finish
-                        # first convert the exec time to the instance
-                        exec_seconds = self.exec_time(job, resource.type)
-
-                        logger.debug("SIMULATION CONDOR: Deploying " +
-                                     "job %s to resource %s for %s" % (
-                                         job.id, resource.id, exec_seconds))
-                        # convert the jobs request time into a timestamp
-
-                        req_time = job.req_time
-                        ProvisionerConfig().dbconn.execute(
-                            ("insert into jobs (test, job_id, start_time, "
-                             "req_time) values ('%s', %s, '%s', '%s');" % (
-                                 ProvisionerConfig().run_name,  int(job.id),
-                                 self.get_fake_time(), req_time)))
-
-                        resource.job_finish = current_time + \
-                            datetime.timedelta(seconds=exec_seconds)
-                        resource.state = "EXECUTING"
-                        job.sim_status = "EXECUTING"
-                        self.executing_jobs = self.executing_jobs + [job.id]
-                        return
+        idle = np.flatnonzero(
+            self.resource_table.column('state') == sim_resource.IDLE)
+        for i in idle:
+            resource = self.resources[i]
+            for instance in instance_types:
+                # check that it fits this instance
+                if (resource.type == instance.type and
+                        self.check_requirements(instance, job)):
+
+                    # this is now good, so lets put it on there.
+                    resource.job_id = job.id
+                    # set the time for the job to finish
+                    # first convert the exec time to the instance
+                    exec_seconds = self.exec_time(job, resource.type)
+
+                    logger.debug("SIMULATION CONDOR: Deploying " +
+                                 "job %s to resource %s for %s" % (
+                                     job.id, resource.id, exec_seconds))
+                    # convert the jobs request time into a timestamp
+
+                    req_time = job.req_time
+                    queries.execute('insert_job',
+                                    ProvisionerConfig().run_name,
+                                    int(job.id), self.get_fake_time(),
+                                    req_time)
+
+                    resource.job_finish = current_time + \
+                        datetime.timedelta(seconds=exec_seconds)
+                    resource.state = "EXECUTING"
+                    job.sim_status = "EXECUTING"
+                    self.executing_jobs = self.executing_jobs + [job.id]
+                    return
 
     def exec_time(self, job, res_type):
         """
@@ -498,20 +584,13 @@ class AWSSimulator(SimpleStringifiable):
     def instance_acquired(self, resource):
         launch_time = ProvisionerConfig().simulator.get_fake_time()
 
-        data = ProvisionerConfig().dbconn.execute(
-            'select id from instance_request where ' +
-            'request_id = \'' + resource.reqid + '\';')
+        data = queries.execute('request_db_id', resource.reqid)
         reqid = 0
         for r in data:
             reqid = r['id']
         # insert it into the database
-        ProvisionerConfig().dbconn.execute(
-            ("insert into instance (request_id, instance_id, " +
-             "fulfilled_time, " +
-             "public_dns, private_dns) values " +
-             "('%s', '%s', '%s', '%s', '%s')") %
-            (reqid, resource.id, resource.launch_time,
-             'pubdns', 'privdns'))
+        queries.execute('insert_instance', reqid, resource.id,
+                        resource.launch_time, 'pubdns', 'privdns')
 
     def request_spot_instances(self, price, image_id, subnet_id,
                                count, key_name,
@@ -525,7 +604,7 @@ class AWSSimulator(SimpleStringifiable):
         self.reqid = self.reqid + 1
         new_request = SimRequest(
             price, subnet_id, instance_type, simid, int(sleep_time), job.id)
-        self.requests.append(new_request)
+        self.add_request(new_request)
         # moved this sleep to a different spot so now the requests are
         # done as a batch too
         # time.sleep(ProvisionerConfig().overhead_time)
@@ -540,7 +619,32 @@ class AWSSimulator(SimpleStringifiable):
         """
         for kill in to_kill:
             logger.debug("SIMULATION: Killing requests %s" % kill)
-            self.requests = [r for r in self.requests if r.reqid != kill]
+        for request in [r for r in self.requests if r.reqid in to_kill]:
+            self.remove_request(request)
+
+    def add_request(self, request):
+        """
+        Add a new open request.
+        """
+        self.requests.append(request)
+        self.job_requests.setdefault(request.job_runner_id, []).append(
+            request)
+
+    def remove_request(self, request):
+        """
+        Remove a request that has been fulfilled or cancelled.
+        """
+        self.requests.remove(request)
+        job_reqs = self.job_requests[request.job_runner_id]
+        job_reqs.remove(request)
+        if len(job_reqs) == 0:
+            del self.job_requests[request.job_runner_id]
+
+    def get_job_requests(self, job_id):
+        """
+        Get the open requests for a job.
+        """
+        return self.job_requests.get(job_id, [])
 
     def get_all_instances(self):
         """
@@ -555,10 +659,7 @@ class AWSSimulator(SimpleStringifiable):
         """
         return the set of spot instances that are fulfilled from aws
         """
-        res = []
-        for ins in self.resources:
-            res = res + ["'%s'" % ins.reqid]
-        return res
+        return [ins.reqid for ins in self.resources]
 
     def get_open_requests(self):
         """
@@ -573,6 +674,25 @@ class AWSSimulator(SimpleStringifiable):
         """
         Get the current spot price for each instance type.
         """
+        return self.get_spot_price(resource.type, resource.subnet, tenant)
+
+    def get_spot_price(self, ins_type, subnet, tenant):
+        """
+        Get the lowest spot price for an instance type in a subnet over the
+        last minute.
+        """
+        if self.spot_prices is not None:
+            lowest_price = 1000000
+            end_time = ProvisionerConfig().simulate_time
+            start_time = end_time - datetime.timedelta(seconds=60)
+            for key, val in tenant.subnets.iteritems():
+                if val != subnet:
+                    continue
+                price = self.spot_prices.lowest_price(ins_type, key,
+                                                      start_time, end_time)
+                if price is not None and price < lowest_price:
+                    lowest_price = price
+            return lowest_price
 
         new_time = ProvisionerConfig().simulate_time
         now = new_time.strftime('%Y-%m-%d %H:%M:%S')
@@ -585,14 +705,14 @@ class AWSSimulator(SimpleStringifiable):
         timeStr = str(now).replace(" ", "T") + "Z"
         startTimeStr = str(start_time_z).replace(" ", "T") + "Z"
         prices = conn.get_spot_price_history(
-            instance_type=resource.type,
+            instance_type=ins_type,
             product_description="Linux/UNIX (Amazon VPC)",
             end_time=timeStr, start_time=startTimeStr)
         lowest_price = 1000000
         for price in prices:
             for key, val in tenant.subnets.iteritems():
                 if (price.availability_zone == key and
-                    val == resource.subnet and
+                    val == subnet and
                         float(price.price) < lowest_price):
                     lowest_price = float(price.price)
         return lowest_price
@@ -605,18 +725,5 @@ class AWSSimulator(SimpleStringifiable):
         accepts both an Instance or str (aws instance type name
         e.g. m2.4xlarge)
         """
-        if isinstance(instance, basestring):
-            for ins in ProvisionerConfig().instance_types:
-                if ins.type == instance:
-                    instance = ins
-                    break
-
-        # Check it meets cpu requirements
-        if int(instance.cpus) < int(job.req_cpus):
-            return False
-        # Check it meets memory requirements
-        if int(instance.memory) < int(job.req_mem):
-            return False
-
-        # It seems to meet the requirements
-        return True
+        return ProvisionerConfig().instance_catalog.check_requirements(
+            instance, job)
@@ -1,6 +1,6 @@
 import boto
 import psycopg2
-from scrimp import logger, ProvisionerConfig
+from scrimp import logger, ProvisionerConfig, queries
 from scrimp.cloud.simaws import api
 
 
@@ -58,9 +58,9 @@ def check_for_terminated_instances(reservations):
                 # i.state_reason does not contain it and i.state does not
                 # exist. So instead, we will just flag it as now and sort
                 # out determining the full hour when computing cost.
-                ProvisionerConfig().dbconn.execute(
-                    ("update instance set terminate_time = '%s', reason = '%s' " +
-                     "where instance_id = '%s' and terminate_time is null;") % (ProvisionerConfig().simulator.get_fake_time(), r.reason, r.id))
+                queries.execute('record_termination',
+                                ProvisionerConfig().simulator.get_fake_time(),
+                                r.reason, r.id)
                 print ("update instance set terminate_time = '%s', reason = '%s' " +
                        "where instance_id = '%s' and terminate_time is null;") % (ProvisionerConfig().simulator.get_fake_time(), r.reason, r.id)
 
@@ -68,13 +68,8 @@ def check_for_terminated_instances(reservations):
 def check_for_new_instances(reservations, instance_spot_ids, conn, tenant):
     if len(instance_spot_ids) > 0:
         # Check that it isn't already in the instance table
-        rows = ProvisionerConfig().dbconn.execute(
-            ("select instance_request.id, instance_request.job_runner_id, " +
-             "instance_request.request_id from instance_request left join " +
-             "instance on instance_request.id = instance.request_id where " +
-             "instance.request_id is null and instance_request.request_id " +
-             "in (%s) and tenant = %s") %
-            (",".join(instance_spot_ids), tenant.db_id))
+        rows = queries.execute('unacquired_requests', instance_spot_ids,
+                               tenant.db_id)
 
         for row in rows:
             for r in reservations:
@@ -148,33 +143,12 @@ def get_orphaned_requests(tenant, ids_to_check, idle_job_numbers):
 
     if len(ids_to_check) > 0:
         try:
-            # Add quotes and commas to the list items for psql.
-            sir_ids = (', '.join('\'' + item + '\'' for item in ids_to_check))
             # Get any requests that do not belong to an idle job
-            rows = []
-            print sir_ids
-            print idle_job_numbers
-            if len(idle_job_numbers) > 0:
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.id, instance_type.type, " +
-                     "instance_request.job_runner_id, " +
-                     "instance_request.request_id from instance_request, " +
-                     "instance_type where instance_request.instance_type = " +
-                     "instance_type.id and job_runner_id not in (%s) and " +
-                     "request_id in (%s) and request_type = 'spot' and " +
-                     "tenant = %s") %
-                    (",".join('\'' + num + '\'' for num in idle_job_numbers),
-                     sir_ids,
-                     tenant.db_id))
-            else:
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.id, instance_type.type, " +
-                     "instance_request.job_runner_id, " +
-                     "instance_request.request_id from instance_request, " +
-                     "instance_type where instance_request.instance_type = " +
-                     "instance_type.id and " +
-                     "request_id in (%s) and request_type = 'spot' and " +
-                     "tenant = %s") % (sir_ids, tenant.db_id))
+            logger.debug("Open requests %s, idle jobs %s" %
+                         (ids_to_check, idle_job_numbers))
+            rows = queries.execute(
+                'orphaned_requests', [int(j) for j in idle_job_numbers],
+                ids_to_check, tenant.db_id)
             # I had some issues with the rows object closing after
             # returning it, so this just builds a dict for it
             for row in rows:
@@ -203,17 +177,11 @@ def migrate_request_to_job(request, job):
                  "%s to job %s.") %
                 (request['id'], request['job_runner_id'],
                  next_idle_job_id))
-            ProvisionerConfig().dbconn.execute(
-                ("update instance_request set job_runner_id = '%s' " +
-                 "where id = %s") %
-                (next_idle_job_id, request['id']))
-            ProvisionerConfig().dbconn.execute(
-                ("insert into request_migration " +
-                 "(request_id, from_job, to_job, migration_time) " +
-                 "values (%s, %s, %s, '%s')") %
-                (request['id'], request['job_runner_id'],
-                 next_idle_job_id,
-                 ProvisionerConfig().simulator.get_fake_time()))
+            queries.execute('migrate_request', next_idle_job_id,
+                            request['id'])
+            queries.execute('insert_migration', request['id'],
+                            request['job_runner_id'], next_idle_job_id,
+                            ProvisionerConfig().simulator.get_fake_time())
             return True
         except psycopg2.Error:
             logger.exception("Error performing migration in database.")
@@ -300,11 +268,8 @@ def instance_acquired(inst, request, tenant, conn):
 
     launch_time = ProvisionerConfig().simulator.get_fake_time()
     # insert it into the database
-    ProvisionerConfig().dbconn.execute(
-        ("insert into instance (request_id, instance_id, fulfilled_time, " +
-         "public_dns, private_dns) values ('%s', '%s', '%s', '%s', '%s')") %
-        (request['id'], inst.id, launch_time,
-         'pubdns', 'privdns'))
+    queries.execute('insert_instance', request['id'], inst.id, launch_time,
+                    'pubdns', 'privdns')
     logger.debug("An instance has been acquired. " +
                  "Tenant={0}; Request={1}, Instance={2}".format(
                      tenant.name, repr(request), repr(inst)))
@@ -337,18 +302,5 @@ def check_requirements(instance, job):
     accepts both an Instance or str (aws instance type name
     e.g. m2.4xlarge)
     """
-
-    if isinstance(instance, basestring):
-        for ins in ProvisionerConfig().instance_types:
-            if ins.type == instance:
-                instance = ins
-                break
-    # Check it meets cpu requirements
-    if int(instance.cpus) < int(job.req_cpus):
-        return False
-    # Check it meets memory requirements
-    if int(instance.memory) < int(job.req_mem):
-        return False
-
-    # It seems to meet the requirements
-    return True
+    return ProvisionerConfig().instance_catalog.check_requirements(
+        instance, job)
@@ -0,0 +1,79 @@
+import heapq
+import math
+import datetime
+
+
+class SimEventQueue(object):
+    """
+    A queue of the simulated times at which something is due to happen.
+
+    The simulator used to advance the clock by a fixed step and re-run every
+    phase on each tick. Instead, each phase pushes the times it is waiting
+    on (a request becoming ready, a resource finishing contextualisation,
+    a job finishing, etc.) and the run loop jumps straight to the first
+    tick that is due. Events are mapped onto the same grid of ticks the
+    fixed-step loop used, so a run visits every tick on which anything
+    could change and produces the same outcomes, just without the idle
+    ticks in between.
+    """
+
+    def __init__(self, start, step):
+        self.start = start
+        self.step = step
+        self._heap = []
+        self._seq = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def clear(self):
+        self._heap = []
+
+    def push(self, when, kind, strict=False):
+        """
+        Add an event. A strict event is one tested with '<' or '>' by the
+        simulator, so it only fires on a tick after `when`, never on it.
+        """
+        if when is None:
+            return
+        self._seq = self._seq + 1
+        heapq.heappush(self._heap, (self.to_tick(when, strict),
+                                    self._seq, kind))
+
+    def push_every(self, now, period, kind):
+        """
+        Add an event for the next time the elapsed simulation time is a
+        multiple of period seconds (e.g. the periodic price checks).
+        """
+        elapsed = (now - self.start).total_seconds()
+        periods = int(math.floor(elapsed / period)) + 1
+        self.push(self.start + datetime.timedelta(seconds=periods * period),
+                  kind)
+
+    def to_tick(self, when, strict=False):
+        """
+        Round a time up to the tick on which the simulator will see it.
+        """
+        elapsed = (when - self.start).total_seconds() / self.step
+        if strict:
+            ticks = int(math.floor(elapsed)) + 1
+        else:
+            ticks = int(math.ceil(elapsed))
+        return self.start + datetime.timedelta(seconds=ticks * self.step)
+
+    def next_tick(self, now):
+        """
+        Pop every event due on the next tick and return that tick along
+        with the kinds of event that are due. The next tick is always at
+        least one step after now, events in the past are due straight away.
+        """
+        earliest = now + datetime.timedelta(seconds=self.step)
+        if len(self._heap) == 0:
+            return earliest, []
+        tick = max(self._heap[0][0], earliest)
+        kinds = []
+        while len(self._heap) > 0 and self._heap[0][0] <= tick:
+            kind = heapq.heappop(self._heap)[2]
+            if kind not in kinds:
+                kinds.append(kind)
+        return tick, kinds
@@ -0,0 +1,136 @@
+import csv
+import datetime
+import pytz
+import numpy as np
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+
+
+def to_epoch(when):
+    """
+    Convert a datetime (naive ones are taken to be UTC) to epoch seconds.
+    """
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=pytz.utc)
+    return (when - EPOCH).total_seconds()
+
+
+def parse_timestamp(value):
+    """
+    Parse a spot price history timestamp, e.g. 2017-03-25T03:14:00.000Z
+    """
+    value = value.strip().rstrip('Z').split('.')[0]
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').replace(
+        tzinfo=pytz.utc)
+
+
+class SpotPriceTrace(object):
+    """
+    A store of recorded spot prices so the simulator can look prices up
+    without calling the AWS API.
+    The trace is read from either a CSV file, with the Timestamp,
+    InstanceType, AvailabilityZone and SpotPrice columns of the spot price
+    history, or an NPZ file written by save(). Prices are indexed by
+    (instance type, zone) with a sorted array of times for each, so a lookup
+    is a binary search.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.npz'):
+            data = np.load(path)
+            times = data['timestamp'].astype(np.float64)
+            types = data['instance_type'].astype(str)
+            zones = data['zone'].astype(str)
+            prices = data['price'].astype(np.float64)
+        else:
+            times, types, zones, prices = self.read_csv(path)
+        self.index(times, types, zones, prices)
+
+    def __repr__(self):
+        return "SpotPriceTrace(%s, %s series)" % (self.path,
+                                                 len(self.series))
+
+    def read_csv(self, path):
+        times = []
+        types = []
+        zones = []
+        prices = []
+        with open(path) as data_file:
+            for row in csv.DictReader(data_file):
+                times.append(to_epoch(parse_timestamp(row['Timestamp'])))
+                types.append(row['InstanceType'].strip())
+                zones.append(row['AvailabilityZone'].strip())
+                prices.append(float(row['SpotPrice']))
+        return (np.array(times, dtype=np.float64), np.array(types, dtype=str),
+                np.array(zones, dtype=str),
+                np.array(prices, dtype=np.float64))
+
+    def index(self, times, types, zones, prices):
+        """
+        Split the records into a sorted series per (instance type, zone).
+        """
+        self.series = {}
+        if len(times) == 0:
+            return
+        order = np.lexsort((times, zones, types))
+        times = times[order]
+        types = types[order]
+        zones = zones[order]
+        prices = prices[order]
+        # the start of each (instance type, zone) run in the sorted records
+        starts = np.flatnonzero((types[1:] != types[:-1]) |
+                                (zones[1:] != zones[:-1])) + 1
+        starts = np.concatenate(([0], starts, [len(times)]))
+        for start, end in zip(starts[:-1], starts[1:]):
+            self.series[(types[start], zones[start])] = (times[start:end],
+                                                         prices[start:end])
+
+    def save(self, path):
+        """
+        Write the trace to an NPZ file, which is much faster to load than
+        the CSV.
+        """
+        times = []
+        types = []
+        zones = []
+        prices = []
+        for (ins_type, zone), (t, p) in self.series.iteritems():
+            times.append(t)
+            prices.append(p)
+            types.append(np.repeat(ins_type, len(t)))
+            zones.append(np.repeat(zone, len(t)))
+        if len(times) == 0:
+            times = prices = types = zones = [np.array([])]
+        np.savez(path, timestamp=np.concatenate(times),
+                 instance_type=np.concatenate(types),
+                 zone=np.concatenate(zones), price=np.concatenate(prices))
+
+    def price_at(self, ins_type, zone, when):
+        """
+        Get the spot price in effect at a time, or None if the trace has no
+        price for the instance type and zone by then.
+        """
+        if (ins_type, zone) not in self.series:
+            return None
+        times, prices = self.series[(ins_type, zone)]
+        i = np.searchsorted(times, to_epoch(when), side='right')
+        if i == 0:
+            return None
+        return float(prices[i - 1])
+
+    def lowest_price(self, ins_type, zone, start_time, end_time):
+        """
+        Get the lowest spot price in effect at any point between two times.
+        Like the spot price history API, this includes the price in effect
+        at the start of the window as well as any changes within it.
+        """
+        if (ins_type, zone) not in self.series:
+            return None
+        times, prices = self.series[(ins_type, zone)]
+        first = max(np.searchsorted(times, to_epoch(start_time),
+                                    side='right') - 1, 0)
+        last = np.searchsorted(times, to_epoch(end_time), side='right')
+        if last <= first:
+            return None
+        return float(prices[first:last].min())
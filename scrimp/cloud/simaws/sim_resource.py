@@ -1,15 +1,139 @@
 from scrimp import SimpleStringifiable
 from scrimp import ProvisionerConfig
 import datetime
+import numpy as np
+
+# The states a simulated resource moves through, stored as small integer
+# codes in the resource table.
+STATES = ['CONTEXTUALIZING', 'UNCLAIMED', 'IDLE', 'EXECUTING', 'STARTING',
+          'TERMINATED']
+STATE_CODES = dict((s, code) for code, s in enumerate(STATES))
+
+CONTEXTUALIZING = STATE_CODES['CONTEXTUALIZING']
+UNCLAIMED = STATE_CODES['UNCLAIMED']
+IDLE = STATE_CODES['IDLE']
+EXECUTING = STATE_CODES['EXECUTING']
+TERMINATED = STATE_CODES['TERMINATED']
+
+
+class SimResourceTable(object):
+    """
+    Columnar storage for the state of every simulated resource, so that the
+    simulator can evaluate state transitions and termination rules for all
+    resources at once with array operations.
+    Times are stored as seconds since the start of the simulation, with
+    NaN standing in for None.
+    """
+
+    time_columns = ['launch_time', 'context_time', 'claimed_time',
+                    'job_finish', 'terminate_time']
+
+    def __init__(self, epoch, capacity=64):
+        self.epoch = epoch
+        self.size = 0
+        self.types = []
+        self.subnets = []
+        self._type_ids = {}
+        self._subnet_ids = {}
+
+        self._state = np.zeros(capacity, dtype=np.int8)
+        self._type_index = np.zeros(capacity, dtype=np.int32)
+        self._subnet_index = np.zeros(capacity, dtype=np.int32)
+        self._price = np.zeros(capacity, dtype=np.float64)
+        for column in self.time_columns:
+            setattr(self, '_' + column, np.full(capacity, np.nan))
+
+    def __repr__(self):
+        return "SimResourceTable(size=%s)" % self.size
+
+    def _grow(self):
+        """
+        Double the capacity of every column.
+        """
+        capacity = len(self._state) * 2
+        for name in (['state', 'type_index', 'subnet_index', 'price'] +
+                     self.time_columns):
+            old = getattr(self, '_' + name)
+            if name in self.time_columns:
+                new = np.full(capacity, np.nan)
+            else:
+                new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, '_' + name, new)
+
+    def _lookup(self, ids, names, name):
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def add(self, ins_type, subnet, price):
+        """
+        Add a row for a new resource and return its index.
+        """
+        if self.size == len(self._state):
+            self._grow()
+        index = self.size
+        self.size = self.size + 1
+        self._type_index[index] = self._lookup(self._type_ids, self.types,
+                                               ins_type)
+        self._subnet_index[index] = self._lookup(self._subnet_ids,
+                                                 self.subnets, subnet)
+        self._price[index] = float(price)
+        return index
+
+    def column(self, name):
+        """
+        Return a (writable) view of the populated part of a column.
+        """
+        return getattr(self, '_' + name)[:self.size]
+
+    def due(self, name, seconds, strict=False):
+        """
+        Return a mask of the rows whose time column is at (or strictly
+        before) seconds. Rows with no time set are never due.
+        """
+        values = self.column(name)
+        with np.errstate(invalid='ignore'):
+            if strict:
+                return values < seconds
+            return values <= seconds
+
+    def to_seconds(self, time):
+        if time is None:
+            return np.nan
+        return (time - self.epoch).total_seconds()
+
+    def to_time(self, seconds):
+        if np.isnan(seconds):
+            return None
+        return self.epoch + datetime.timedelta(seconds=float(seconds))
+
+
+def _time_property(name):
+    """
+    A SimResource attribute backed by one of the table's time columns.
+    """
+    def fget(self):
+        return self._table.to_time(self._table.column(name)[self._index])
+
+    def fset(self, value):
+        self._table.column(name)[self._index] = self._table.to_seconds(value)
+
+    return property(fget, fset)
 
 
 class SimResource(SimpleStringifiable):
     """
     A class to manage AWS instance types.
+    The state and times of the resource live in the simulator's
+    SimResourceTable, this object is a view onto its row.
     """
 
-    def __init__(self, price, subnet, ins_type, req_time,
+    def __init__(self, table, price, subnet, ins_type, req_time,
                  reqid, insid, context_time, jobid):
+        self._table = table
+        self._index = table.add(ins_type, subnet, price)
         self.type = ins_type
         self.price = price
         self.subnet = subnet
@@ -26,3 +150,39 @@ class SimResource(SimpleStringifiable):
         self.busy_to = None
         self.job_id = None
         self.reason = ""
+
+    launch_time = _time_property('launch_time')
+    context_time = _time_property('context_time')
+    claimed_time = _time_property('claimed_time')
+    job_finish = _time_property('job_finish')
+    terminate_time = _time_property('terminate_time')
+
+    def fields(self):
+        """
+        The resource's attributes, with its state and times read from its
+        row of the table.
+        """
+        values = dict((k, v) for k, v in self.__dict__.iteritems()
+                      if not k.startswith('_'))
+        values['state'] = self.state
+        for name in SimResourceTable.time_columns:
+            values[name] = getattr(self, name)
+        return sorted(values.iteritems())
+
+    def __repr__(self):
+        return "SimResource(%s)" % ','.join(
+            "%s=%r" % (k, v) for k, v in self.fields())
+
+    def __str__(self):
+        output = "SimResource:"
+        for k, v in self.fields():
+            output = "%s\n    %s: %r" % (output, k, v)
+        return output
+
+    @property
+    def state(self):
+        return STATES[self._table.column('state')[self._index]]
+
+    @state.setter
+    def state(self, value):
+        self._table.column('state')[self._index] = STATE_CODES[value]
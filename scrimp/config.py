@@ -1,10 +1,11 @@
 import ConfigParser
-import sqlalchemy
 import psycopg2
 import pytz
 import datetime
 import ggprovisioner
 from scrimp import Singleton, logger
+from scrimp.database import Database, create_engine
+from scrimp.dbwriter import DBWriter
 import random
 
 
@@ -44,15 +45,24 @@ class ProvisionerConfig(object):
         port = config.get('Database', 'port')
         database = config.get('Database', 'database')
 
-        # create a connection and keep it as a config attribute
+        # create a connection pool and keep it as a config attribute
+        pool_size = 5
+        if config.has_option('Database', 'PoolSize'):
+            pool_size = int(config.get('Database', 'PoolSize'))
         try:
-            engine = sqlalchemy.create_engine(
-                'postgresql://%s:%s@%s:%s/%s' %
-                (user, password, host, port, database),
-                isolation_level="AUTOCOMMIT")
-            self.dbconn = engine.connect()
+            engine = create_engine(user, password, host, port, database,
+                                   pool_size=pool_size)
+            self.dbconn = Database(engine)
+            # Queues the writes made while provisioning
+            self.dbwriter = DBWriter(engine)
         except psycopg2.Error:
             logger.exception("Failed to connect to database.")
+        # Whether the frequently used queries are prepared on the
+        # connection (turn this off behind a transaction pooler)
+        self.prepare_statements = True
+        if config.has_option('Database', 'PrepareStatements'):
+            self.prepare_statements = config.get(
+                'Database', 'PrepareStatements') == 'True'
 
         # Get some provisioner specific config settings
         self.ondemand_price_threshold = float(
@@ -63,7 +73,48 @@ class ProvisionerConfig(object):
         self.DrAFTS = config.get('Provision', 'DrAFTS')
         self.DrAFTSAvgPrice = config.get('Provision', 'DrAFTSAvgPrice')
         self.DrAFTSProfiles = config.get('Provision', 'DrAFTSProfiles')
+        # Whether DrAFTS predictions are read from the drafts_price table
+        # rather than fetched from the DrAFTS service
+        self.drafts_stored_db = False
+        if config.has_option('Provision', 'DrAFTSStoredDB'):
+            self.drafts_stored_db = config.get('Provision',
+                                               'DrAFTSStoredDB') == 'True'
+        # Where to fetch DrAFTS predictions from when they are not stored
+        self.drafts_url = 'http://128.111.84.183/vpc'
+        if config.has_option('Provision', 'DrAFTSURL'):
+            self.drafts_url = config.get('Provision', 'DrAFTSURL')
+        # How long (in seconds) a snapshot of the spot prices is reused
+        self.spot_price_ttl = 60
+        if config.has_option('Provision', 'SpotPriceTTL'):
+            self.spot_price_ttl = int(config.get('Provision',
+                                                 'SpotPriceTTL'))
+        # How many tenants are provisioned for at once, and how long (in
+        # seconds) each is waited for in a cycle
+        self.tenant_threads = 1
+        if config.has_option('Provision', 'TenantThreads'):
+            self.tenant_threads = int(config.get('Provision',
+                                                 'TenantThreads'))
+        self.tenant_timeout = 300
+        if config.has_option('Provision', 'TenantTimeout'):
+            self.tenant_timeout = int(config.get('Provision',
+                                                 'TenantTimeout'))
+        # The most seconds the tenants are cached for, even if their
+        # version has not changed
+        self.tenant_cache_age = 300
+        if config.has_option('Provision', 'TenantCacheAge'):
+            self.tenant_cache_age = int(config.get('Provision',
+                                                   'TenantCacheAge'))
+        # How many calls to AWS can be in flight at once
+        self.aws_concurrency = 10
+        if config.has_option('Provision', 'AWSConcurrency'):
+            self.aws_concurrency = int(config.get('Provision',
+                                                  'AWSConcurrency'))
+        # this must be imported here to avoid a circular import
+        from scrimp.cloud.aws.catalog import InstanceCatalog
+        # Instance types are only loaded from the database when simulating,
+        # so start with an empty catalog rather than none at all
         self.instance_types = []
+        self.instance_catalog = InstanceCatalog(self.instance_types)
         if self.DrAFTS == 'True':
             self.DrAFTS = True
         else:
@@ -91,11 +142,15 @@ class ProvisionerConfig(object):
         self.simulate_jobs = (config.get('Simulation', 'JobFile'))
         self.run_name = config.get('Simulation', 'RunName')
 
+        # A file of recorded spot prices (csv or npz) for the simulator to
+        # use instead of querying AWS
+        self.spot_price_file = None
+        if config.has_option('Simulation', 'SpotPriceFile'):
+            self.spot_price_file = config.get('Simulation', 'SpotPriceFile')
+
         # things for the simulator
         self.first_job_time = None
 
-        # drafts_stored_db = True
-
         # self.simulate = True
         self.sim_time = datetime.datetime.strptime('2017-03-25T03:14:00Z',
                                                    '%Y-%m-%dT%H:%M:%SZ')
@@ -142,6 +197,7 @@ class ProvisionerConfig(object):
         """
         # this must be imported here to avoid a circular import
         from ggprovisioner.cloud import aws
+        from scrimp import queries
 
         def get_instance_types():
             """
@@ -149,8 +205,7 @@ class ProvisionerConfig(object):
             """
             instances = []
             try:
-                rows = self.dbconn.execute(
-                    "select * from instance_type where available = True")
+                rows = queries.execute('instance_types')
                 for row in rows:
                     instances.append(aws.Instance(
                         row['id'], row['type'], row['ondemand_price'],
@@ -161,3 +216,4 @@ class ProvisionerConfig(object):
             return instances
 
         self.instance_types = get_instance_types()
+        self.instance_catalog = aws.InstanceCatalog(self.instance_types)
@@ -0,0 +1,108 @@
+import time
+import threading
+
+import sqlalchemy
+from sqlalchemy import exc
+
+from scrimp import logger
+
+
+def create_engine(user, password, host, port, database, pool_size=5,
+                  max_overflow=10):
+    """
+    Create a pooled engine for the provisioner's database. Connections are
+    pinged when they are checked out of the pool, so dropped connections
+    are replaced rather than handed out.
+    """
+    return sqlalchemy.create_engine(
+        'postgresql://%s:%s@%s:%s/%s' % (user, password, host, port,
+                                         database),
+        isolation_level="AUTOCOMMIT", pool_size=pool_size,
+        max_overflow=max_overflow, pool_pre_ping=True)
+
+
+class Database(object):
+    """
+    Access to the database for any number of threads. Each thread checks
+    out its own connection from the engine's pool and keeps it until it
+    calls release(). If a statement fails because the connection was lost,
+    the connection is replaced and the statement retried. The time taken
+    by each (named) statement is recorded.
+    """
+
+    def __init__(self, engine, retries=2):
+        self.engine = engine
+        self.retries = retries
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def connection(self):
+        """
+        Get this thread's connection, checking one out if needed.
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or conn.closed:
+            conn = self.engine.connect()
+            self.local.conn = conn
+        return conn
+
+    def release(self):
+        """
+        Return this thread's connection to the pool.
+        """
+        conn = getattr(self.local, 'conn', None)
+        self.local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def run(self, work, name='sql'):
+        """
+        Call work with this thread's connection and return its result,
+        reconnecting and retrying if the connection has been lost.
+        """
+        attempt = 0
+        while True:
+            conn = self.connection()
+            start = time.time()
+            try:
+                res = work(conn)
+                self.record(name, time.time() - start)
+                return res
+            except exc.DBAPIError as e:
+                if not e.connection_invalidated:
+                    raise
+                # don't keep the lost connection, even if giving up
+                self.release()
+                if attempt >= self.retries:
+                    raise
+                attempt += 1
+                logger.warn("Lost the database connection, reconnecting "
+                            "(attempt %s)." % attempt)
+
+    def execute(self, sql, *params):
+        """
+        Execute a statement, as Connection.execute does.
+        """
+        return self.run(lambda conn: conn.execute(sql, *params))
+
+    def record(self, name, seconds):
+        with self.lock:
+            count, total, longest = self.stats.get(name, (0, 0.0, 0.0))
+            self.stats[name] = (count + 1, total + seconds,
+                                max(longest, seconds))
+
+    def log_stats(self, reset=True):
+        """
+        Log the number of executions and the mean and max latency of each
+        statement, slowest first.
+        """
+        with self.lock:
+            stats = self.stats
+            if reset:
+                self.stats = {}
+        for name, (count, total, longest) in sorted(
+                stats.items(), key=lambda s: -s[1][1]):
+            logger.debug("DB %s: %s calls, %.4fs total, %.4fs mean, "
+                         "%.4fs max" % (name, count, total, total / count,
+                                        longest))
@@ -0,0 +1,268 @@
+import time
+import threading
+from collections import OrderedDict
+from sqlalchemy import exc
+
+from scrimp import logger
+
+
+class Now(object):
+    """
+    A value to be set to the time a write was queued. It is written as
+    NOW() less however long the write waited in the queue, so the
+    database's clock is still used.
+    """
+
+    def __init__(self, queued=None):
+        self.queued = queued
+
+    def __repr__(self):
+        return "NOW()"
+
+
+# Use in place of NOW() in queued writes
+NOW = Now()
+
+
+class Write(object):
+    """
+    A queued insert, or an update of the row with a given key.
+    """
+
+    def __init__(self, table, values, key=None):
+        self.table = table
+        self.key = key
+        self.values = OrderedDict()
+        self.merge(values)
+
+    def __repr__(self):
+        return "Write(%s, %s, %s)" % (self.table, self.key,
+                                      dict(self.values))
+
+    def merge(self, values):
+        """
+        Add (or replace) values, fixing the time of any NOW values.
+        """
+        if isinstance(values, dict):
+            values = values.items()
+        for column, value in values:
+            if value is NOW:
+                value = Now(time.time())
+            self.values[column] = value
+
+    def row(self, now):
+        """
+        Get the (column, placeholder) pairs and bound parameters of the
+        values.
+        """
+        columns = []
+        params = []
+        for column, value in self.values.items():
+            if isinstance(value, Now):
+                columns.append((column, "NOW() - %s::interval"))
+                params.append("%.3f second" % (now - value.queued))
+            else:
+                columns.append((column, "%s"))
+                params.append(value)
+        return columns, params
+
+    def statement(self, now):
+        """
+        Get the SQL and bound parameters for the write.
+        """
+        columns, params = self.row(now)
+        if self.key is None:
+            sql = "insert into %s (%s) values (%s)" % (
+                self.table, ", ".join(c for c, p in columns),
+                ", ".join(p for c, p in columns))
+        else:
+            sql = "update %s set %s where %s = %%s" % (
+                self.table, ", ".join("%s = %s" % c for c in columns),
+                self.key[0])
+            params.append(self.key[1])
+        return sql, tuple(params)
+
+
+def insert_statements(inserts, now, max_rows=500):
+    """
+    Get multi-row insert statements for a list of inserts, one for each
+    table and set of columns (and max_rows rows).
+    """
+    shapes = OrderedDict()
+    for w in inserts:
+        columns, params = w.row(now)
+        shape = (w.table, tuple(columns))
+        shapes.setdefault(shape, []).append(params)
+    statements = []
+    for (table, columns), rows in shapes.items():
+        for i in range(0, len(rows), max_rows):
+            batch = rows[i:i + max_rows]
+            sql = "insert into %s (%s) values %s" % (
+                table, ", ".join(c for c, p in columns),
+                ", ".join(["(%s)" % ", ".join(p for c, p in columns)] *
+                          len(batch)))
+            statements.append((sql, tuple(v for row in batch for v in row)))
+    return statements
+
+
+def batch_statements(writes, now):
+    """
+    Get the statements for a batch of writes. The inserts queued between
+    updates are combined into multi-row inserts.
+    """
+    statements = []
+    inserts = []
+    for w in writes:
+        if w.key is None:
+            inserts.append(w)
+            continue
+        statements.extend(insert_statements(inserts, now))
+        inserts = []
+        statements.append(w.statement(now))
+    statements.extend(insert_statements(inserts, now))
+    return statements
+
+
+class DBWriter(object):
+    """
+    A write-behind queue for the provisioner's side effects (recording
+    requests, instances and migrations), so they don't hold up the calls to
+    EC2. Updates to a row that is already queued are merged into one
+    statement, and inserts into the same table are combined into multi-row
+    inserts. Queued writes are written in a single transaction by a
+    background thread every interval seconds, and by barrier(), which is
+    called at the end of each cycle and before any read that depends on
+    the writes.
+    """
+
+    def __init__(self, engine, interval=5):
+        self.engine = engine
+        self.interval = interval
+        self.conn = None
+        self.pending = []
+        self.updates = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.running = False
+        self.written = 0
+        self.merged = 0
+
+    def insert(self, table, values):
+        """
+        Queue the insert of a row. values is a list of (column, value)
+        pairs.
+        """
+        with self.lock:
+            self.pending.append(Write(table, values))
+
+    def update(self, table, key, values):
+        """
+        Queue an update of the row where the key column, key[0], is key[1].
+        values is a dict or a list of (column, value) pairs.
+        """
+        with self.lock:
+            write = self.updates.get((table, key))
+            if write is not None:
+                write.merge(values)
+                self.merged += 1
+                return
+            write = Write(table, values, key)
+            self.updates[(table, key)] = write
+            self.pending.append(write)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def connection(self):
+        if self.conn is None:
+            self.conn = self.engine.connect().execution_options(
+                isolation_level="READ COMMITTED")
+        return self.conn
+
+    def write(self, writes):
+        """
+        Write a batch in one transaction. If the transaction fails, write
+        each statement separately so that one bad write does not lose the
+        rest of the batch.
+        """
+        now = time.time()
+        statements = batch_statements(writes, now)
+        conn = self.connection()
+        trans = conn.begin()
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            trans.commit()
+            return
+        except Exception as e:
+            trans.rollback()
+            logger.exception("Failed to write a batch of %s statements. "
+                             "Retrying them separately." % len(writes))
+            statements = [w.statement(now) for w in writes]
+            if (isinstance(e, exc.DBAPIError) and
+                    e.connection_invalidated):
+                # the connection was lost, so check out another
+                self.conn.close()
+                self.conn = None
+                conn = self.connection()
+        for sql, params in statements:
+            trans = conn.begin()
+            try:
+                conn.execute(sql, params)
+                trans.commit()
+            except Exception:
+                trans.rollback()
+                logger.exception("Failed to write: %s %s" % (sql, params))
+
+    def barrier(self):
+        """
+        Write everything that has been queued and wait for it to be in the
+        database.
+        """
+        with self.flush_lock:
+            with self.lock:
+                writes = self.pending
+                self.pending = []
+                self.updates = {}
+            if len(writes) == 0:
+                return
+            t1 = time.time()
+            self.write(writes)
+            self.written += len(writes)
+            logger.debug("DB writer: wrote %s statements in %.3f seconds "
+                         "(%s updates merged)" % (len(writes),
+                                                  time.time() - t1,
+                                                  self.merged))
+
+    def run(self):
+        while self.running:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.barrier()
+            except Exception:
+                logger.exception("DB writer failed to write.")
+
+    def start(self):
+        """
+        Start the background writer thread.
+        """
+        if self.thread is not None:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='dbwriter')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the background writer, writing anything still queued.
+        """
+        self.running = False
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.barrier()
@@ -0,0 +1,135 @@
+import time
+import bisect
+import threading
+from decimal import Decimal
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from scrimp import logger
+
+
+class Prediction(object):
+    """
+    The parsed DrAFTS prediction graph for an instance type in a zone.
+    Each line of a graph is a duration (in hours) and the bid needed to
+    last that long. Lookups want the first line that lasts longer than a
+    given duration, so the durations are kept as a running maximum which
+    can be binary searched.
+    """
+
+    def __init__(self, text):
+        self.costs = []
+        self.max_times = []
+        self.oracle_costs = []
+        self.oracle_max_times = []
+        # whether the graph ends with a short (blank) line, in which case
+        # oracle lookups fall back to the last prediction
+        self.oracle_end = False
+
+        in_oracle = True
+        for line in text.split("\n"):
+            if len(line) <= 5 and in_oracle:
+                in_oracle = False
+                self.oracle_end = True
+            try:
+                cur_time = float(line.split(" ")[0])
+                cost = line.split(" ")[1]
+            except (IndexError, ValueError):
+                continue
+            self.add(self.max_times, self.costs, cur_time, cost)
+            if in_oracle:
+                self.add(self.oracle_max_times, self.oracle_costs, cur_time,
+                         cost)
+
+    def add(self, max_times, costs, cur_time, cost):
+        if len(max_times) > 0:
+            cur_time = max(cur_time, max_times[-1])
+        max_times.append(cur_time)
+        costs.append(cost)
+
+    def drafts_bid(self, hours=1):
+        """
+        The bid for the first prediction lasting longer than hours.
+        """
+        i = bisect.bisect_right(self.max_times, hours)
+        if i == len(self.costs):
+            return None
+        return Decimal(str(self.costs[i]))
+
+    def oracle_bid(self, hours):
+        """
+        The bid for the first prediction lasting longer than hours, or the
+        longest prediction if none are long enough.
+        """
+        i = bisect.bisect_right(self.oracle_max_times, hours)
+        if i < len(self.oracle_costs):
+            return Decimal(str(self.oracle_costs[i]))
+        if self.oracle_end and len(self.oracle_costs) > 0:
+            return Decimal(str(self.oracle_costs[-1]))
+        return None
+
+
+class DrAFTSClient(object):
+    """
+    Fetch DrAFTS prediction graphs from the DrAFTS service.
+    Requests share a pooled HTTP session, the graphs for many zones and
+    instance types can be fetched concurrently, and parsed graphs are
+    cached for ttl seconds.
+    """
+
+    def __init__(self, url, ttl=300, timeout=10, workers=8, retries=2):
+        self.url = url.rstrip('/')
+        self.ttl = ttl
+        self.timeout = timeout
+        self.workers = workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers,
+                              pool_maxsize=workers, max_retries=retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def graph_url(self, zone, ins_type):
+        # example: http://128.111.84.183/vpc/us-east-1a-c3.2xlarge.pgraph
+        return '%s/%s-%s.pgraph' % (self.url, zone, ins_type)
+
+    def get(self, zone, ins_type):
+        """
+        Get the prediction for an instance type in a (DrAFTS) zone, or None
+        if it could not be fetched.
+        """
+        key = (zone, ins_type)
+        with self.lock:
+            cached = self.cache.get(key)
+        if cached is not None and time.time() - cached[0] < self.ttl:
+            return cached[1]
+
+        addr = self.graph_url(zone, ins_type)
+        try:
+            req = self.session.get(addr, timeout=self.timeout)
+            req.raise_for_status()
+        except requests.RequestException as e:
+            logger.error("drafts: failed to fetch %s: %s" % (addr, e))
+            return None
+        prediction = Prediction(req.text)
+        with self.lock:
+            self.cache[key] = (time.time(), prediction)
+        return prediction
+
+    def prefetch(self, keys):
+        """
+        Fetch the predictions for a set of (zone, instance type) pairs
+        concurrently so that later lookups are served from the cache.
+        """
+        keys = list(set(keys))
+        if len(keys) == 0:
+            return
+        pool = ThreadPool(min(self.workers, len(keys)))
+        try:
+            pool.map(lambda key: self.get(*key), keys)
+        finally:
+            pool.close()
+            pool.join()
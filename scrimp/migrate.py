@@ -0,0 +1,151 @@
+"""
+Apply the schema migrations in scrimp/migrations to an existing database.
+Each migration is a numbered SQL file, and the versions that have been
+applied are recorded in the schema_version table. Statements are run one
+at a time outside a transaction (so indexes can be built CONCURRENTLY),
+and must be safe to run again if a migration is interrupted. A migration
+on a table that does not exist yet is left unrecorded, and is applied
+again on a later run.
+"""
+import os
+import re
+import logging
+import argparse
+import ConfigParser
+
+from scrimp import logger
+from scrimp.database import create_engine
+
+MIGRATIONS = os.path.join(os.path.dirname(__file__), 'migrations')
+
+
+class MigrationError(Exception):
+    pass
+
+
+def migrations(path=MIGRATIONS):
+    """
+    Get the (version, name, filename) of each migration, in order.
+    """
+    found = []
+    for filename in os.listdir(path):
+        match = re.match(r'(\d+)_(\w+)\.sql$', filename)
+        if match:
+            found.append((int(match.group(1)), match.group(2),
+                          os.path.join(path, filename)))
+    return sorted(found)
+
+
+def statements(sql):
+    """
+    Split a migration into its statements, without comments. Semicolons
+    inside $$ quoted bodies (e.g. of functions) do not end a statement.
+    """
+    lines = [l for l in sql.splitlines() if not l.strip().startswith('--')]
+    found = ['']
+    for i, part in enumerate("\n".join(lines).split('$$')):
+        if i % 2 == 1:
+            found[-1] = found[-1] + '$$' + part + '$$'
+            continue
+        pieces = part.split(';')
+        found[-1] = found[-1] + pieces[0]
+        found.extend(pieces[1:])
+    return [s.strip() for s in found if s.strip()]
+
+
+def applied(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version("
+                 "version integer primary key, "
+                 "name varchar(255) not null, "
+                 "applied_time timestamp default now())")
+    return set(row[0] for row in
+               conn.execute("select version from schema_version"))
+
+
+def missing_table(conn, stmt):
+    """
+    Get the table a statement is on, if it is not in this database.
+    """
+    match = re.search(r'\bON\s+(\w+)', stmt, re.IGNORECASE)
+    if match is None:
+        return None
+    table = match.group(1)
+    if conn.execute("select to_regclass(%s)", (table,)).scalar() is None:
+        return table
+    return None
+
+
+def invalid_indexes(conn):
+    """
+    Get the indexes left invalid by a failed concurrent build.
+    """
+    return [row[0] for row in conn.execute(
+        "select c.relname from pg_index i, pg_class c, pg_namespace n "
+        "where c.oid = i.indexrelid and n.oid = c.relnamespace and "
+        "n.nspname = current_schema() and not i.indisvalid")]
+
+
+def migrate(conn, path=MIGRATIONS, target=None):
+    """
+    Apply the migrations that have not been, up to the target version, and
+    return the versions applied. conn must be in autocommit mode.
+    """
+    done = applied(conn)
+    ran = []
+    for version, name, filename in migrations(path):
+        if version in done or (target is not None and version > target):
+            continue
+        logger.info("Applying migration %s (%s)." % (version, name))
+        with open(filename) as f:
+            sql = f.read()
+        skipped = []
+        for stmt in statements(sql):
+            table = missing_table(conn, stmt)
+            if table is not None:
+                logger.warn("Skipping a statement on %s, which does not "
+                            "exist." % table)
+                skipped.append(table)
+                continue
+            conn.execute(stmt)
+        invalid = invalid_indexes(conn)
+        if invalid:
+            raise MigrationError(
+                "Migration %s left invalid indexes; drop them and migrate "
+                "again: %s" % (version, ", ".join(invalid)))
+        if skipped:
+            # Leave it to be applied again once the tables exist
+            logger.warn("Migration %s is incomplete without %s, not "
+                        "recording it." % (version, ", ".join(skipped)))
+            continue
+        conn.execute("insert into schema_version (version, name) "
+                     "values (%s, %s)", (version, name))
+        ran.append(version)
+    return ran
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Apply SCRIMP's schema migrations.")
+    parser.add_argument('--config', default='scrimp/provisioner.ini',
+                        help="a config file with a [Database] section")
+    parser.add_argument('--target', type=int, default=None,
+                        help="the version to migrate to (default: latest)")
+    args = parser.parse_args()
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+    config = ConfigParser.ConfigParser()
+    config.read(args.config)
+    engine = create_engine(*[config.get('Database', option) for option in
+                             ('user', 'password', 'host', 'port',
+                              'database')])
+    conn = engine.connect()
+    try:
+        ran = migrate(conn, target=args.target)
+    finally:
+        conn.close()
+    print "Applied migrations: %s" % (ran or "none")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,18 @@
+-- Indexes for the queries the provisioner runs every cycle. They are
+-- built CONCURRENTLY so that a running provisioner is not blocked.
+
+-- fulfilled_requests, request_counts and existing_requests
+CREATE INDEX CONCURRENTLY IF NOT EXISTS instance_request_tenant_job_idx
+ON instance_request (tenant, job_runner_id, request_time);
+
+-- unacquired_requests, orphaned_requests and request_db_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS instance_request_request_id_idx
+ON instance_request (request_id, tenant);
+
+-- the instance joins in fulfilled_requests and unacquired_requests
+CREATE INDEX CONCURRENTLY IF NOT EXISTS instance_request_id_idx
+ON instance (request_id);
+
+-- record_terminations
+CREATE INDEX CONCURRENTLY IF NOT EXISTS instance_instance_id_idx
+ON instance (instance_id);
@@ -0,0 +1,6 @@
+-- launch_stats is not created by db-create.sql, so its index is kept
+-- apart from the others; it is applied once the table exists.
+
+-- the launch stats updates when an instance is fulfilled
+CREATE INDEX CONCURRENTLY IF NOT EXISTS launch_stats_request_id_idx
+ON launch_stats (request_id);
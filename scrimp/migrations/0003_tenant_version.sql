@@ -0,0 +1,39 @@
+-- A version number for the tenant tables, bumped by a trigger whenever
+-- one of them changes. The provisioner only reloads its tenants when it
+-- moves. The bump commits with the change, so unlike Postgres' statistics
+-- counters it is never late, lost or reset.
+
+CREATE TABLE IF NOT EXISTS tenant_version(
+  id integer primary key default 1 check (id = 1),
+  version bigint not null default 0
+);
+
+INSERT INTO tenant_version (id, version)
+SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM tenant_version);
+
+CREATE OR REPLACE FUNCTION bump_tenant_version() RETURNS trigger AS $$
+BEGIN
+  UPDATE tenant_version SET version = version + 1;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS tenant_version_bump ON tenant;
+CREATE TRIGGER tenant_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tenant
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_tenant_version();
+
+DROP TRIGGER IF EXISTS tenant_version_bump ON tenant_settings;
+CREATE TRIGGER tenant_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tenant_settings
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_tenant_version();
+
+DROP TRIGGER IF EXISTS tenant_version_bump ON aws_credentials;
+CREATE TRIGGER tenant_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON aws_credentials
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_tenant_version();
+
+DROP TRIGGER IF EXISTS tenant_version_bump ON subnet_mapping;
+CREATE TRIGGER tenant_version_bump
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON subnet_mapping
+FOR EACH STATEMENT EXECUTE PROCEDURE bump_tenant_version();
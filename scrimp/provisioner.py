@@ -2,11 +2,16 @@ import psycopg2
 import datetime
 import calendar
 import time
+import bisect
+import copy
+import threading
 # import sys
 from decimal import *
-import requests
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
 
-from scrimp import logger, ProvisionerConfig, tenant, scheduler
+from scrimp import logger, ProvisionerConfig, tenant, scheduler, queries
+from scrimp.drafts import DrAFTSClient
 from scrimp.cloud import aws
 from scrimp.cloud import simaws
 from scrimp.scheduler.condor.condor_scheduler import CondorScheduler
@@ -21,6 +26,8 @@ class Provisioner(object):
 
     def __init__(self):
         self.tenants = []
+        # The tenants, reloaded only when they change
+        self.tenant_cache = tenant.TenantCache()
 
         self.drafts_mapping = {'us-east-1a': 'us-east-1e',
                                'us-east-1b': 'us-east-1d',
@@ -28,9 +35,29 @@ class Provisioner(object):
                                'us-east-1d': 'us-east-1b',
                                'us-east-1e': 'us-east-1c', }
 
+        # The resolution of the simulated clock, in seconds
+        self.sim_step = 2
+
         # Read in any config data and set up the database connection
         ProvisionerConfig()
 
+        # Fetches and caches the DrAFTS predictions
+        self.drafts = DrAFTSClient(ProvisionerConfig().drafts_url)
+        # The stored DrAFTS predictions, once loaded
+        self.drafts_index = {}
+        # Fetches and caches the current spot prices
+        self.spot_prices = aws.SpotPriceService(
+            ProvisionerConfig().spot_price_ttl)
+
+        # Sends the calls to AWS concurrently
+        self.ec2 = aws.EC2Executor(ProvisionerConfig().aws_concurrency)
+
+        # Runs each tenant's cycle concurrently, if configured to
+        self.tenant_pool = None
+        # The tenants whose cycles are still running, by id
+        self.running_tenants = set()
+        self.running_lock = threading.Lock()
+
     def run(self):
         """
         Run the provisioner. This should execute periodically and
@@ -42,6 +69,8 @@ class Provisioner(object):
             self.sched = SimScheduler()
             ProvisionerConfig().load_instance_types()
             self.load_drafts_data()
+            events = simaws.SimEventQueue(ProvisionerConfig().sim_time,
+                                          self.sim_step)
             while True:
                 self.run_iterations = self.run_iterations + 1
                 # Load jobs
@@ -84,11 +113,15 @@ class Provisioner(object):
                 manage_time = (t6 - t5).total_seconds()
                 prov_time = (t7 - t6).total_seconds()
 
-                # Otherwise, step through time
-                ProvisionerConfig().simulate_time = ProvisionerConfig(
-                ).simulate_time + datetime.timedelta(seconds=2)
+                # Otherwise, step through time to the next tick on which
+                # something is due to happen
+                next_time, due = self.next_sim_event(events)
+                step = (next_time -
+                        ProvisionerConfig().simulate_time).total_seconds()
+                ProvisionerConfig().simulate_time = next_time
                 logger.debug("RUN ID: %s. SIMULATION: advancing time "
-                             "2 second" % ProvisionerConfig().run_id)
+                             "%s seconds (%s)" % (ProvisionerConfig().run_id,
+                                                  step, ', '.join(due)))
 
                 logger.debug("SIMULATION times: load (%s), sim (%s),"
                              " proc_idle (%s), condor (%s), aws (%s),"
@@ -99,6 +132,10 @@ class Provisioner(object):
 
         else:
             self.sched = CondorScheduler()
+            # Write the provisioner's side effects in the background
+            ProvisionerConfig().dbwriter.start()
+            # Tag new requests and instances in the background
+            aws.tags.tag_queue.start()
             while True:
                 self.run_iterations = self.run_iterations + 1
                 # Get the tenants from the database and process the current
@@ -107,14 +144,25 @@ class Provisioner(object):
                 self.load_tenants_and_jobs()
                 # provisioning will fail if there are no tenants
                 if len(self.tenants) > 0:
-                    # Handle all of the existing requests. This will cancel
-                    # or migrate excess requests and update the database to
-                    # reflect the state of the environment
-                    self.manage_resources()
-
-                    # Work out the price for each instance type and acquire
-                    # resources for jobs
-                    self.provision_resources()
+                    if ProvisionerConfig().tenant_threads > 1:
+                        # Run each tenant's cycle independently
+                        self.process_tenants()
+                    else:
+                        # Handle all of the existing requests. This will
+                        # cancel or migrate excess requests and update the
+                        # database to reflect the state of the environment
+                        self.manage_resources()
+
+                        # Work out the price for each instance type and
+                        # acquire resources for jobs
+                        self.provision_resources()
+
+                # Write everything queued during this cycle
+                ProvisionerConfig().dbwriter.barrier()
+                ProvisionerConfig().dbconn.log_stats()
+                self.ec2.log_stats()
+                aws.tags.tag_queue.log_stats()
+                aws.ratelimit.rate_limits.log_stats()
 
                 # wait "run_rate" seconds before trying again
                 end_time = datetime.datetime.now()
@@ -125,6 +173,24 @@ class Provisioner(object):
                 if diff < ProvisionerConfig().run_rate:
                     time.sleep(ProvisionerConfig().run_rate - diff)
 
+    def next_sim_event(self, events):
+        """
+        Work out when the simulation next needs to run. Rather than stepping
+        through every tick, ask the simulator and scheduler for the times
+        they are waiting on and skip to the first of them.
+        """
+        now = ProvisionerConfig().simulate_time
+        events.clear()
+        ProvisionerConfig().simulator.schedule_events(events)
+        self.sched.schedule_events(events, self.tenants)
+        # Jobs still in the idle queue are provisioned for on the next run
+        for t in self.tenants:
+            if len(t.idle_jobs) > 0:
+                events.push_every(now, ProvisionerConfig().run_rate,
+                                  'provision')
+                break
+        return events.next_tick(now)
+
     def load_tenants_and_jobs(self):
         """
         Get all of the tenants from the database and then read the condor
@@ -142,9 +208,74 @@ class Provisioner(object):
             self.sched.only_load_jobs(self.tenants)
 
         else:
-            self.tenants = tenant.load_from_db()
+            tenants = self.tenant_cache.load()
+            # The cache hands back the same tenant objects each cycle, so
+            # leave out any tenant whose previous cycle is still running in
+            # the pool rather than reset its jobs underneath it.
+            with self.running_lock:
+                running = set(self.running_tenants)
+            if running:
+                tenants = [t for t in tenants if t.db_id not in running]
+            self.tenants = tenants
             self.sched.load_jobs(self.tenants)
 
+    def process_tenants(self):
+        """
+        Manage and provision for each tenant in a pool of threads, so that
+        a slow tenant does not hold up the others. Each tenant is waited
+        for for up to tenant_timeout seconds from the start; a tenant that
+        is still running is skipped in the following cycles until it
+        finishes.
+        """
+        if self.tenant_pool is None:
+            self.tenant_pool = ThreadPool(ProvisionerConfig().tenant_threads)
+        self.load_drafts_for_cycle()
+        start = time.time()
+        results = []
+        for t in self.tenants:
+            with self.running_lock:
+                if t.db_id in self.running_tenants:
+                    logger.warn("Tenant %s is still running from a previous "
+                                "cycle, skipping it." % t.name)
+                    continue
+                self.running_tenants.add(t.db_id)
+            results.append(
+                (t, self.tenant_pool.apply_async(self.process_tenant, (t,))))
+
+        # Merge the results of the tenants that finish in time
+        timings = []
+        for t, result in results:
+            remaining = start + ProvisionerConfig().tenant_timeout - \
+                time.time()
+            try:
+                timings.append("%s: %.2fs" % (
+                    t.name, result.get(max(remaining, 0))))
+            except TimeoutError:
+                timings.append("%s: timed out" % t.name)
+                logger.error("Tenant %s did not finish within %s seconds." %
+                             (t.name, ProvisionerConfig().tenant_timeout))
+            except Exception:
+                timings.append("%s: failed" % t.name)
+                logger.exception("Failed to process tenant %s." % t.name)
+        self.spot_prices.log_stats()
+        logger.debug("Tenant cycles: %s" % ", ".join(timings))
+
+    def process_tenant(self, t):
+        """
+        Run the manage, price, select and request pipeline for one tenant,
+        and return how long it took.
+        """
+        t1 = time.time()
+        try:
+            aws.manager.process_resources([t], self.ec2)
+            scheduler.base_scheduler.ignore_fulfilled_jobs([t])
+            if len(t.idle_jobs) > 0:
+                self.provision_tenant(t)
+        finally:
+            with self.running_lock:
+                self.running_tenants.discard(t.db_id)
+        return time.time() - t1
+
     def manage_resources(self):
         """
         Use the resource manager to keep the database up to date and manage
@@ -156,7 +287,7 @@ class Provisioner(object):
         if ProvisionerConfig().simulate:
             simaws.manager.process_resources(self.tenants)
         else:
-            aws.manager.process_resources(self.tenants)
+            aws.manager.process_resources(self.tenants, self.ec2)
 
             scheduler.base_scheduler.ignore_fulfilled_jobs(self.tenants)
 
@@ -170,50 +301,105 @@ class Provisioner(object):
             cur_time = ProvisionerConfig().simulator.get_fake_time()
 
         minus_ten = cur_time - datetime.timedelta(seconds=600)
-        query = ("select * from drafts_price where timestamp < "
-                 "'%s'::TIMESTAMP and timestamp > '%s'::TIMESTAMP") % (
-            cur_time.strftime("%Y-%m-%d %H:%M"),
-            minus_ten.strftime("%Y-%m-%d %H:%M"))
-        self.drafts_data = []
-        logger.debug('getting drafts data: ' + query)
-        rows = ProvisionerConfig().dbconn.execute(query)
+        logger.debug('getting drafts data: %s - %s' % (minus_ten, cur_time))
+        rows = queries.execute('drafts_prices',
+                               cur_time.strftime("%Y-%m-%d %H:%M"),
+                               minus_ten.strftime("%Y-%m-%d %H:%M"))
+        # Group the predictions by (instance type, zone)
+        predictions = {}
         for row in rows:
-            data = {'time': row['time'], 'price': row['price'],
-                    'zone': row['zone'], 'type': row['type']}
-            self.drafts_data.append(data)
+            predictions.setdefault((row['type'], row['zone']), []).append(
+                (float(row['price']), float(row['time']), row['price']))
+        # and sort each group by price once, so bids can be looked up
+        # without scanning all of the data
+        self.drafts_index = {}
+        for key, rows in predictions.iteritems():
+            rows.sort()
+            # the longest time predicted at each price or any higher one
+            longest = [0.0] * len(rows)
+            for i in range(len(rows) - 1, -1, -1):
+                longest[i] = rows[i][1]
+                if i + 1 < len(rows):
+                    longest[i] = max(longest[i], longest[i + 1])
+            self.drafts_index[key] = ([r[0] for r in rows],
+                                      [r[1] for r in rows],
+                                      [r[2] for r in rows], longest)
+
+    def get_drafts_price(self, ins, mapped_zone, threshold, cur_price):
+        """
+        Get the cheapest DrAFTS price above the current spot price that is
+        predicted to last longer than threshold hours.
+        The prices above the spot price are found by binary search, and
+        then checked in order for one that lasts long enough.
+        """
+        if (ins, mapped_zone) not in self.drafts_index:
+            return None
+        prices, times, orig, longest = self.drafts_index[(ins, mapped_zone)]
+        i = bisect.bisect_right(prices, float(cur_price))
+        # stop as soon as no higher price lasts long enough
+        while i < len(prices) and longest[i] > threshold:
+            if times[i] > threshold:
+                return Decimal(str(orig[i]))
+            i += 1
+        return None
+
+    def load_drafts_for_cycle(self):
+        """
+        Load the DrAFTS data when it is due, before any tenant is
+        provisioned for, so that it is not replaced while in use.
+        """
+        if not (ProvisionerConfig().DrAFTS or
+                ProvisionerConfig().DrAFTSProfiles):
+            return
+        if not any(len(t.idle_jobs) > 0 for t in self.tenants):
+            return
+        if ProvisionerConfig().simulate:
+            # when simulating only load it every 5 mins.
+            if ((ProvisionerConfig().simulate_time -
+                 ProvisionerConfig().sim_time).total_seconds() %
+                    300 == 0):
+                self.load_drafts_data()
+        else:
+            if self.run_iterations % 300 == 0:
+                self.load_drafts_data()
 
     def provision_resources(self):
-        # This passes tenant[0] (a test tenant with my credentials) to use its
-        # credentials to query the AWS API for price data
-        # price data is stored in the Instance objects
+        self.load_drafts_for_cycle()
         for t in self.tenants:
             if len(t.idle_jobs) == 0:
                 continue
-            if (ProvisionerConfig().DrAFTS or
-                    ProvisionerConfig().DrAFTSProfiles):
-                if ProvisionerConfig().simulate:
-                    # when simulating only load it every 5 mins.
-                    if ((ProvisionerConfig().simulate_time -
-                         ProvisionerConfig().sim_time).total_seconds() %
-                            300 == 0):
-                        self.load_drafts_data()
-                else:
-                    if self.run_iterations % 300 == 0:
-                        self.load_drafts_data()
-            # Get the spot prices for this tenant's AZ's
-            if ProvisionerConfig().simulate:
-                simaws.api.get_spot_prices(
-                    ProvisionerConfig().instance_types, t)
-            else:
-                aws.api.get_spot_prices(ProvisionerConfig().instance_types,
-                                        t)
-            # Select a request to make for each job
-            self.select_instance_type(ProvisionerConfig().instance_types)
-            # Make the requests for the resources
-            if ProvisionerConfig().simulate:
-                simaws.api.request_resources(t)
-            else:
-                aws.api.request_resources(t)
+            self.provision_tenant(t)
+        if not ProvisionerConfig().simulate:
+            self.spot_prices.log_stats()
+
+    def provision_tenant(self, t):
+        """
+        Price, select and request resources for a tenant's idle jobs.
+        """
+        if ((ProvisionerConfig().DrAFTS or
+                ProvisionerConfig().DrAFTSProfiles) and
+                not ProvisionerConfig().drafts_stored_db):
+            # Fetch the predictions for every zone and type at once
+            self.drafts.prefetch(
+                [(self.drafts_mapping[zone], ins.type)
+                 for ins in ProvisionerConfig().instance_types
+                 for zone in t.subnets
+                 if zone in self.drafts_mapping])
+        # The tenant's credentials are used to query the AWS API for price
+        # data, which is stored as a view of its zones in the Tenant
+        if ProvisionerConfig().simulate:
+            simaws.api.get_spot_prices(
+                ProvisionerConfig().instance_types, t)
+        else:
+            aws.api.get_spot_prices(ProvisionerConfig().instance_types,
+                                    t, self.spot_prices)
+        # Select a request to make for each job
+        self.select_instance_type(ProvisionerConfig().instance_types, t)
+        # Make the requests for the resources
+        if ProvisionerConfig().simulate:
+            simaws.api.request_resources(t)
+        else:
+            aws.api.request_resources(t, self.ec2)
 
     def get_potential_instances(self, eligible_instances, job, tenant):
         """
@@ -236,22 +422,19 @@ class Provisioner(object):
                 DrAFTS = None
                 AvgPrice = None
                 OraclePrice = None
-                for zone, price in ins.spot.iteritems():
+                for zone, price in tenant.spot_prices.get(
+                        ins.type).iteritems():
                     # if zone == 'us-east-1c':
                     if (ProvisionerConfig().DrAFTS or
                             ProvisionerConfig().DrAFTSProfiles):
                         DrAFTS, OraclePrice = self.get_DrAFTS_bid(
                             ins.type, zone, job, price)
-                        if DrAFTS is None or OraclePrice is None:
-                            # try it again, if it doesn't find them its
-                            # because the price doesn't exist. so add a big
-                            # value to skip it
-                            DrAFTS, OraclePrice = self.get_DrAFTS_bid(
-                                ins.type, zone, job, price)
-                            if DrAFTS is None:
-                                DrAFTS = 1000
-                            if OraclePrice is None:
-                                OraclePrice = 1000
+                        # if it doesn't find them its because the price
+                        # doesn't exist. so add a big value to skip it
+                        if DrAFTS is None:
+                            DrAFTS = 1000
+                        if OraclePrice is None:
+                            OraclePrice = 1000
                         if ProvisionerConfig().DrAFTS:
                             unsorted_instances.append(aws.Request(
                                 ins, ins.type, zone, ins.ami, 1, 0, False,
@@ -299,68 +482,21 @@ class Provisioner(object):
                 # clear the tenant's current avg prices
                 mapped_zone = self.drafts_mapping[zone]
                 logger.debug('drafts zone: %s' % mapped_zone)
-                for row in self.drafts_data:
-                    if (row['type'] == ins and mapped_zone == row['zone'] and
-                            float(row['price']) > float(cur_price)):
-                        time = row['time']
-                        cost = row['price']
-                        if ret_drafts is None and float(time) > 1:
-                            ret_drafts = Decimal(str(cost))
-                        if (ret_oracle is None and float(time) >
-                                (float(job.duration) / 3600)):
-                            ret_oracle = Decimal(str(cost))
+                ret_drafts = self.get_drafts_price(ins, mapped_zone, 1,
+                                                   cur_price)
+                ret_oracle = self.get_drafts_price(
+                    ins, mapped_zone, float(job.duration) / 3600, cur_price)
 
                 return ret_drafts, ret_oracle
             else:
                 # use the mapping between AZs to pick a zone name
                 mapped_zone = self.drafts_mapping[zone]
-
-                addr = 'http://128.111.84.183/vpc/%s-%s.pgraph' % (
-                    mapped_zone, ins)
-                req = requests.get(addr)
-                output = req.text
-                # Split the result by line
-                lines = output.split("\n")
-                ret_drafts = None
-                # define these out here so if it goes over the line,
-                # when the request length is too long, it can use the
-                # previous ones.
-                cost = None
-                time = None
-                for line in lines:
-                    # Extract the time and cost
-                    try:
-                        time = line.split(" ")[0]
-                        cost = line.split(" ")[1]
-                    except Exception, y:
-                        logger.error("drafts: Failed here: %s %s" % (y, line))
-                   # Split the line in half to get the time and cost
-                    if float(time) > 1:
-                        # this is the one we want to use
-                        ret_drafts = Decimal(str(cost))
-                        break
-                # now do the oracle ones
-                ret_oracle = None
-                last = False
-                for line in lines:
-                    # Extract the time and cost
-                    try:
-                        if len(line) > 5:
-                            time = line.split(" ")[0]
-                            cost = line.split(" ")[1]
-                        else:
-                            last = True
-                            logger.debug("No prediction long enough in "
-                                         "%s, using last one. %s %s" % (addr,
-                                                                        time,
-                                                                        cost))
-                    except Exception, z:
-                        logger.error("oracle: failed here: %s %s" % (z, line))
-                    # Split the line in half to get the time and cost
-                    if last or float(time) > (float(job.duration) / 3600):
-                        # this is the one we want to use
-                        ret_oracle = Decimal(str(cost))
-                        break
+                prediction = self.drafts.get(mapped_zone, ins)
+                if prediction is None:
+                    return None, None
+                ret_drafts = prediction.drafts_bid(1)
+                ret_oracle = prediction.oracle_bid(
+                    float(job.duration) / 3600)
                 return ret_drafts, ret_oracle
         except Exception, e:
             logger.debug("Failed to find DrAFTS price for %s. %s" % (ins, e))
@@ -432,7 +568,7 @@ class Provisioner(object):
 
         # if the cheapest option is ondemand
         elif cheapest.ondemand and cheapest.odp < tenant.max_bid_price:
-            job.launch = cheapest
+            job.launch = copy.copy(cheapest)
             logger.debug("Selected to launch on demand due to ondemand "
                          "being cheapest: %s" % repr(cheapest))
             needed = True
@@ -443,7 +579,7 @@ class Provisioner(object):
                 (ProvisionerConfig().ondemand_price_threshold *
                     float(cheapest.odp)) and
                 cheapest.price < tenant.max_bid_price):
-            job.launch = cheapest
+            job.launch = copy.copy(cheapest)
             logger.debug("Selected to launch on demand due to spot price "
                          "being close to ondemand price: %s" %
                          repr(cheapest))
@@ -451,119 +587,139 @@ class Provisioner(object):
 
         return needed
 
-    def select_instance_type(self, instances):
+    def select_instance_type(self, instances, tenant):
         """
-        Select the instance to launch for each idle job.
+        Select the instance to launch for each of a tenant's idle jobs.
         """
+        # The sorted options for each shape of job in this tenant's queue
+        shapes = {}
+        # Get the requests already made for all of the idle jobs
+        self.load_existing_requests(tenant)
+        for job in list(tenant.idle_jobs):
+            if ProvisionerConfig().simulate:
+                time.sleep(ProvisionerConfig().overhead_time)
+            # Get the set of instance types that can be used for this job
+            # and all potential pairs sorted
+            eligible_instances, sorted_instances = \
+                self.get_sorted_instances(job, tenant, shapes)
+            if len(eligible_instances) == 0:
+                logger.error("Failed to find any eligible instances "
+                             "for job %s" % job)
+                continue
+            if len(sorted_instances) == 0:
+                logger.error("Failed to find any sorted instances "
+                             "for job %s" % job)
+                continue
 
-        for tenant in self.tenants:
-            for job in list(tenant.idle_jobs):
-                if ProvisionerConfig().simulate:
-                    time.sleep(ProvisionerConfig().overhead_time)
-                # Get the set of instance types that can be used for this job
-                eligible_instances = self.restrict_instances(job)
-                if len(eligible_instances) == 0:
-                    logger.error("Failed to find any eligible instances "
-                                 "for job %s" % job)
-                    continue
-                # get all potential pairs and sort them
-                sorted_instances = self.get_potential_instances(
-                    eligible_instances, job, tenant)
-                if len(sorted_instances) == 0:
-                    logger.error("Failed to find any sorted instances "
-                                 "for job %s" % job)
-                    continue
+            # work out if an ondemand instance is needed
+            job.ondemand = self.check_ondemand_needed(tenant,
+                                                      sorted_instances,
+                                                      job)
 
-                # work out if an ondemand instance is needed
-                job.ondemand = self.check_ondemand_needed(tenant,
-                                                          sorted_instances,
-                                                          job)
+            # If ondemand is required, redo the sorted list with only
+            # ondemand requests and set that to be the launched instance
+            if job.ondemand:
+                eligible_instances, sorted_instances = \
+                    self.get_sorted_instances(job, tenant, shapes)
 
-                # If ondemand is required, redo the sorted list with only
-                # ondemand requests and set that to be the launched instance
-                if job.ondemand:
-                    sorted_instances = self.get_potential_instances(
-                        eligible_instances, job, tenant)
+                job.launch = copy.copy(sorted_instances[0])
+                logger.debug("Launching ondemand for this job. %s" %
+                             str(job.launch))
+                continue
 
-                    job.launch = sorted_instances[0]
-                    logger.debug("Launching ondemand for this job. %s" %
-                                 str(job.launch))
-                    continue
+            # otherwise we are now looking at launching a spot request
+            # print out the options we are looking at
+            self.print_cheapest_options(sorted_instances)
+            # filter out a job if it has had too many requests made
+            existing_requests = tenant.existing_requests.get(str(job.id),
+                                                             set())
+            if (tenant.existing_request_counts.get(str(job.id), 0) >=
+                    ProvisionerConfig().max_requests):
+                tenant.idle_jobs.remove(job)
+                continue
 
-                # otherwise we are now looking at launching a spot request
-                # print out the options we are looking at
-                self.print_cheapest_options(sorted_instances)
-                # filter out a job if it has had too many requests made
-                existing_requests = self.get_existing_requests(tenant, job)
-                if len(existing_requests) >= ProvisionerConfig().max_requests:
-                    tenant.idle_jobs.remove(job)
+            # Find the top request that hasn't already been requested
+            # (e.g. zone+type pair is not in existing_requests)
+            for req in sorted_instances:
+                # Skip this type if a matching request already exists
+                if (req.instance_type, req.zone) in existing_requests:
                     continue
+                # Launch this type.
+                # Hmm, this is getting more complciated with
+                # multuiple provisioning models.
+                if req.price < tenant.max_bid_price:
+                    # the sorted requests are shared by jobs of the same
+                    # shape, so take a copy to launch
+                    req = copy.copy(req)
+                    req.bid = self.get_bid_price(job, tenant, req)
+                    job.launch = req
+                    job.cost_aware = req
+                    break
+                else:
+                    logger.error(("Unable to launch request %s as "
+                                  "the price is higher than max bid "
+                                  "%s.") % (str(req),
+                                            tenant.max_bid_price))
 
-                # Find the top request that hasn't already been requested
-                # (e.g. zone+type pair is not in existing_requests)
-                for req in sorted_instances:
-                    if len(existing_requests) > 0:
-                        # Skip this type if a matching request already
-                        # exists
-                        exists = False
-                        for existing in existing_requests:
-                            if (req.instance_type == existing.instance_type and
-                                    req.zone == existing.zone):
-                                exists = True
-                        if exists:
-                            continue
-                    # Launch this type.
-                    # Hmm, this is getting more complciated with
-                    # multuiple provisioning models.
-                    if req.price < tenant.max_bid_price:
-                        req.bid = self.get_bid_price(job, tenant, req)
-                        job.launch = req
-                        job.cost_aware = req
-                        break
-                    else:
-                        logger.error(("Unable to launch request %s as "
-                                      "the price is higher than max bid "
-                                      "%s.") % (str(req),
-                                                tenant.max_bid_price))
-
-    def get_existing_requests(self, tenant, job):
-        # Get all of the outstanding requests from the db for this instance
-        existing_requests = []
+    def job_shape(self, job):
+        """
+        The requirements of a job that decide which instances it can use and
+        how they are ranked. The duration only matters when it is used to
+        look up oracle prices.
+        """
+        duration = None
+        if ProvisionerConfig().DrAFTS or ProvisionerConfig().DrAFTSProfiles:
+            duration = getattr(job, 'duration', None)
+        return (job.req_cpus, job.req_mem, bool(job.ondemand), duration)
+
+    def get_sorted_instances(self, job, tenant, shapes):
+        """
+        Get the eligible instances for a job and the sorted list of requests
+        it could make. These are only worked out once for each shape of job
+        and stored in shapes.
+        """
+        shape = self.job_shape(job)
+        if shape not in shapes:
+            eligible_instances = self.restrict_instances(job)
+            sorted_instances = []
+            if len(eligible_instances) > 0:
+                sorted_instances = self.get_potential_instances(
+                    eligible_instances, job, tenant)
+            shapes[shape] = (eligible_instances, sorted_instances)
+        return shapes[shape]
+
+    def load_existing_requests(self, tenant):
+        """
+        Get all of the outstanding requests from the db for the tenant's
+        idle jobs, and store the (instance type, zone) pairs requested for
+        each job on the tenant.
+        """
+        tenant.existing_requests = {}
+        tenant.existing_request_counts = {}
+        if len(tenant.idle_jobs) == 0:
+            return
+        if not ProvisionerConfig().simulate:
+            # Include the requests queued to be written
+            ProvisionerConfig().dbwriter.barrier()
         try:
-            rows = ProvisionerConfig().dbconn.execute(
-                ("select instance_request.instance_type, "
-                 "instance_request.request_type, "
-                 "instance_type.type, "
-                 "instance_request.subnet, subnet_mapping.zone "
-                 "from instance_request, subnet_mapping, instance_type "
-                 "where job_runner_id = '%s' and "
-                 "instance_request.tenant = %s and "
-                 "instance_request.instance_type = instance_type.id and "
-                 "subnet_mapping.id = instance_request.subnet") %
-                (job.id, tenant.db_id))
+            rows = queries.execute(
+                'existing_requests',
+                [int(job.id) for job in tenant.idle_jobs], tenant.db_id)
             for row in rows:
-                existing_requests.append(aws.Request(
-                    None, row['type'],
-                    row['zone'], None, None))
+                job_id = str(row['job_runner_id'])
+                tenant.existing_requests.setdefault(job_id, set()).add(
+                    (row['type'], row['zone']))
+                tenant.existing_request_counts[job_id] = \
+                    tenant.existing_request_counts.get(job_id, 0) + 1
         except psycopg2.Error:
             logger.exception("Error getting number of outstanding")
 
-        return existing_requests
-
     def restrict_instances(self, job):
         """
         Filter out instances that do not meet the requirements of a job then
         return a list of the eligible instances.
         """
-        eligible_instances = []
-
-        # Check if the instance is viable for the job
-        instance_types = ProvisionerConfig().instance_types
-        for instance in instance_types:
-            if aws.manager.check_requirements(instance, job):
-                eligible_instances.append(instance)
-
-        return eligible_instances
+        return ProvisionerConfig().instance_catalog.eligible(job)
 
     def get_bid_price(self, job, tenant, req):
         """
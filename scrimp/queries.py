@@ -0,0 +1,219 @@
+"""
+The SQL used by the provisioner, as named statements with bound
+parameters. Lists are passed as arrays (= ANY(%s)) so that each statement
+has the same text whatever the number of jobs or requests. Statements on
+the provisioning hot path are prepared once per database connection and
+then executed by name.
+"""
+import re
+
+from scrimp import ProvisionerConfig
+
+
+class Statement(object):
+    """
+    A named SQL statement, using %s for its parameters.
+    """
+
+    def __init__(self, name, sql, prepared=False):
+        self.name = name
+        self.sql = sql
+        self.prepared = prepared
+        self.params = sql.count('%s')
+
+    def __repr__(self):
+        return "Statement(%s)" % self.name
+
+    def numbered(self):
+        """
+        The statement with numbered ($1, $2, ...) parameters, for PREPARE.
+        """
+        count = [0]
+
+        def number(match):
+            count[0] += 1
+            return '$%s' % count[0]
+        return re.sub('%s', number, self.sql)
+
+
+STATEMENTS = {}
+
+
+def statement(name, sql, prepared=False):
+    STATEMENTS[name] = Statement(name, sql, prepared)
+
+
+# Configuration
+statement(
+    'instance_types',
+    "select * from instance_type where available = True")
+statement(
+    'tenants',
+    "SELECT tenant.id, tenant.name, tenant.public_address, "
+    "tenant.condor_address, tenant.public_ip, tenant.zone, tenant.vpc, "
+    "tenant.security_group, tenant.domain, tenant_settings.max_bid_price, "
+    "tenant_settings.bid_percent, tenant_settings.timeout_threshold, "
+    "aws_credentials.access_key_id, aws_credentials.secret_key, "
+    "aws_credentials.key_pair, subnet_mapping.subnet, "
+    "subnet_mapping.id as subnet_id, "
+    "(select json_agg(json_build_object('zone', s.zone, "
+    "'subnet', s.subnet, 'id', s.id)) from subnet_mapping s "
+    "where s.tenant = tenant.id) as subnets "
+    "FROM tenant, tenant_settings, aws_credentials, subnet_mapping "
+    "WHERE tenant_settings.tenant = tenant.id AND "
+    "tenant.credentials = aws_credentials.id AND "
+    "tenant.subscribed = TRUE AND subnet_mapping.tenant = tenant.id AND "
+    "subnet_mapping.zone = tenant.zone")
+statement(
+    'tenants_version',
+    "select version from tenant_version")
+statement(
+    'drafts_prices',
+    "select * from drafts_price where timestamp < %s::TIMESTAMP and "
+    "timestamp > %s::TIMESTAMP")
+
+# Provisioning
+statement(
+    'fulfilled_requests',
+    "select instance_request.job_runner_id, "
+    "sum(instance_type.cpus) as cpus, "
+    "(array_agg(EXTRACT(EPOCH FROM (Now() - "
+    "instance_request.request_time)) order by "
+    "instance_request.id desc))[1] as seconds, "
+    "bool_or(instance_request.request_type = 'ondemand') as ondemand "
+    "from instance_request, instance_type, instance where "
+    "instance_type.id = instance_request.instance_type "
+    "and instance.request_id = instance_request.id "
+    "and instance_request.job_runner_id = ANY(%s::integer[]) "
+    "and tenant = %s group by instance_request.job_runner_id",
+    prepared=True)
+statement(
+    'request_counts',
+    "select job_runner_id, count(*) as total, "
+    "sum(case when request_time >= Now() - %s * interval '1 second' "
+    "then 1 else 0 end) as recent from instance_request "
+    "where job_runner_id = ANY(%s::integer[]) and tenant = %s "
+    "group by job_runner_id",
+    prepared=True)
+statement(
+    'existing_requests',
+    "select instance_request.job_runner_id, "
+    "instance_request.instance_type, instance_request.request_type, "
+    "instance_type.type, instance_request.subnet, subnet_mapping.zone "
+    "from instance_request, subnet_mapping, instance_type "
+    "where job_runner_id = ANY(%s::integer[]) and "
+    "instance_request.tenant = %s and "
+    "instance_request.instance_type = instance_type.id and "
+    "subnet_mapping.id = instance_request.subnet",
+    prepared=True)
+statement(
+    'unacquired_requests',
+    "select instance_request.id, instance_request.job_runner_id, "
+    "instance_request.request_id from instance_request left join "
+    "instance on instance_request.id = instance.request_id where "
+    "instance.request_id is null and "
+    "instance_request.request_id = ANY(%s::varchar[]) and tenant = %s",
+    prepared=True)
+statement(
+    'orphaned_requests',
+    "select instance_request.id, instance_type.type, "
+    "instance_request.job_runner_id, instance_request.request_id "
+    "from instance_request, instance_type where "
+    "instance_request.instance_type = instance_type.id and "
+    "job_runner_id <> ALL(%s::integer[]) and "
+    "request_id = ANY(%s::varchar[]) and request_type = 'spot' and "
+    "tenant = %s",
+    prepared=True)
+statement(
+    'record_terminations',
+    "update instance set terminate_time = NOW(), reason = v.reason "
+    "from unnest(%s::varchar[], %s::varchar[]) as v(instance_id, reason) "
+    "where instance.instance_id = v.instance_id and "
+    "instance.terminate_time is null",
+    prepared=True)
+
+# Simulation
+statement(
+    'negotiate_times',
+    "select extract(epoch from(exec_start_time - join_time)) from "
+    "launch_stats where exec_start_time is not null and "
+    "extract(epoch from(exec_start_time - join_time)) < 300;")
+statement(
+    'contextualise_times',
+    "select extract(epoch from(join_time - fulfilled_time)) from "
+    "launch_stats where exec_start_time is not null and "
+    "extract(epoch from(join_time - fulfilled_time)) < 300;")
+statement(
+    'request_db_id',
+    "select id from instance_request where request_id = %s;")
+statement(
+    'insert_instance',
+    "insert into instance (request_id, instance_id, fulfilled_time, "
+    "public_dns, private_dns) values (%s, %s, %s, %s, %s)")
+statement(
+    'insert_spot_request',
+    "insert into instance_request (tenant, instance_type, "
+    "price, job_runner_id, request_type, request_id, "
+    "subnet, cost_aware_ins, cost_aware_bid, cost_aware_subnet, "
+    "drafts_ins, drafts_bid, drafts_subnet, selected_avg_price, "
+    "cost_aware_avg_price, drafts_avg_price, drafts_avg_ins, "
+    "drafts_avg_bid, drafts_avg_subnet, drafts_avg_avg_price) "
+    "values (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, "
+    "%s, %s, %s, %s, %s)")
+statement(
+    'migrate_request',
+    "update instance_request set job_runner_id = %s where id = %s")
+statement(
+    'insert_migration',
+    "insert into request_migration "
+    "(request_id, from_job, to_job, migration_time) "
+    "values (%s, %s, %s, %s)")
+statement(
+    'record_termination',
+    "update instance set terminate_time = %s, reason = %s "
+    "where instance_id = %s and terminate_time is null;")
+statement(
+    'insert_job',
+    "insert into jobs (test, job_id, start_time, req_time) "
+    "values (%s, %s, %s, %s);")
+statement(
+    'finish_job',
+    "update jobs set end_time = %s where job_id = %s and test = %s;")
+
+
+def prepare(conn, stmt):
+    """
+    Prepare a statement on a connection, if it has not been already.
+    """
+    prepared = conn.info.setdefault('prepared_statements', set())
+    if stmt.name not in prepared:
+        conn.execute("prepare %s as %s" % (stmt.name, stmt.numbered()))
+        prepared.add(stmt.name)
+
+
+def run(conn, stmt, params, prepared):
+    # The parameters are passed as a single parameter set, as SQLAlchemy
+    # would otherwise take a leading list as many sets (executemany).
+    if prepared:
+        prepare(conn, stmt)
+        sql = "execute %s (%s)" % (stmt.name,
+                                   ", ".join(['%s'] * stmt.params))
+        return conn.execute(sql, [params])
+    if len(params) == 0:
+        return conn.execute(stmt.sql)
+    return conn.execute(stmt.sql, [params])
+
+
+def execute(name, *params):
+    """
+    Execute a named statement with the given parameters, and return the
+    result.
+    """
+    stmt = STATEMENTS[name]
+    if len(params) != stmt.params:
+        raise ValueError("%s expects %s parameters, got %s" % (
+            name, stmt.params, len(params)))
+    prepared = stmt.prepared and ProvisionerConfig().prepare_statements
+    # the statement is prepared again if the connection is replaced
+    return ProvisionerConfig().dbconn.run(
+        lambda conn: run(conn, stmt, params, prepared), name)
@@ -1,7 +1,11 @@
 import datetime
 import psycopg2
 from pytz import timezone
-from scrimp import logger, ProvisionerConfig
+from scrimp import logger, ProvisionerConfig, queries
+
+# How long after a request is fulfilled before the job is considered to have
+# had its instance revoked (if it is back in the idle queue).
+REVOKED_TIME = 600
 
 
 class BaseScheduler():
@@ -116,63 +120,53 @@ def ignore_fulfilled_jobs(tenants):
     # after a job has been fulfilled. This catches jobs that have instances
     # revoked and return to the idle queue.
     fulfill_revoked = True
-    revoked_time = 600
+    revoked_time = REVOKED_TIME
+    if ProvisionerConfig().simulate:
+        # The last resource launched for each job decides whether it has
+        # been fulfilled
+        last_resource = {}
+        for i in ProvisionerConfig().simulator.resources:
+            last_resource[i.job_runner_id] = i
     for tenant in tenants:
         # Check to see if any entries have been made in the instance table
         # this indicates an instance has been fulfilled for a request.
         # Restrict the query to only looking at requests for a specific job
-        for job in list(tenant.idle_jobs):
-
-            if ProvisionerConfig().simulate:
+        if ProvisionerConfig().simulate:
+            for job in tenant.idle_jobs:
                 if job.sim_status != "IDLE":
                     continue
-                new_ins = ProvisionerConfig().simulator.resources
-                for i in new_ins:
-                    if i.job_runner_id == job.id:
-                        job.fulfilled = True
-                        diff = (ProvisionerConfig().simulate_time -
-                                i.launch_time).total_seconds()
-                        if diff >= revoked_time:
-                            job.fulfilled = False
-                        continue
-            else:
-
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.job_runner_id, "
-                        "instance_type.cpus, EXTRACT(EPOCH FROM (Now() - "
-                        "instance_request.request_time)) as seconds from "
-                        "instance_request, "
-                        "instance_type, instance where "
-                        "instance_type.id = instance_request.instance_type "
-                        "and instance.request_id = instance_request.id "
-                        "and instance_request.job_runner_id = '%s' "
-                        "and tenant = %s order by instance_request.id "
-                        "desc") % (job.id, tenant.db_id))
-
+                if job.id in last_resource:
+                    diff = (ProvisionerConfig().simulate_time -
+                            last_resource[job.id].launch_time).total_seconds()
+                    job.fulfilled = diff < revoked_time
+        elif len(tenant.idle_jobs) > 0:
+            # Include any instances that are queued to be written
+            ProvisionerConfig().dbwriter.barrier()
+            # Get the fulfilled requests for all of the idle jobs at once.
+            # For each job this gives the cpus acquired, the age of the
+            # latest request and whether an ondemand instance was acquired.
+            rows = queries.execute(
+                'fulfilled_requests',
+                [int(job.id) for job in tenant.idle_jobs], tenant.db_id)
+            fulfilled = {}
+            for row in rows:
+                fulfilled[str(row['job_runner_id'])] = row
+
+            for job in tenant.idle_jobs:
+                row = fulfilled.get(str(job.id))
                 fulfilled_cpus = 0
                 set_false = False
-                # Iterate over the fulfilled instance requests for this job
-                for row in rows:
+                if row is not None:
                     # Set fulfilled back to False if the revoked time
-                    # has passed.
+                    # has passed since the latest request.
                     # This should only happen if the instance is
                     # terminated early.
                     # This works as the job won't be in the idle queue
-                    # (we are iterating)
                     # if the job hasn't been kicked off an instance.
-                    if fulfilled_cpus == 0 and fulfill_revoked:
-                        if int(row['seconds']) > revoked_time:
-                            job.fulfilled = False
-                            set_false = True
-                            # logger.debug(("Found a revoked job, setting " +
-                            # "fulfilled back to false."))
-
-                    # Work out how many cpus this instance type has
-                    fulfilled_cpus = fulfilled_cpus + int(row['cpus'])
-
-                    # If this is being simulated I need to work out if an
-                    # instance would have been terminated?
-                    # maybe the easiest way is to just do it through the db?
+                    if fulfill_revoked and int(row['seconds']) > revoked_time:
+                        job.fulfilled = False
+                        set_false = True
+                    fulfilled_cpus = int(row['cpus'])
 
                 # If enough cpus have been acquired, flag the job as fulfilled
                 if fulfilled_cpus >= int(job.req_cpus) and set_false is False:
@@ -180,14 +174,7 @@ def ignore_fulfilled_jobs(tenants):
                     continue
 
                 # Also remove any that have an ondemand instance fulfilled
-                rows = ProvisionerConfig().dbconn.execute(
-                    ("select instance_request.job_runner_id "
-                        "from instance_request, instance where "
-                        "instance.request_id = instance_request.id "
-                        "and instance_request.job_runner_id = '%s' "
-                        "and tenant = %s and instance_request.request_type = "
-                        "'ondemand'") % (job.id, tenant.db_id))
-                for row in rows:
+                if row is not None and row['ondemand']:
                     job.fulfilled = True
         # Remove any jobs that have been set as fulfilled from the idle
         # queue
@@ -209,68 +196,50 @@ def stop_over_requesting(tenants):
         logger.debug("Tenant: %s. Request rate: %s" % (tenant.name,
             tenant.request_rate))
 
-        if ProvisionerConfig().simulate:
-            open_reqs = ProvisionerConfig().simulator.requests
+        # Count the recent and total requests for each idle job
+        recent_counts = {}
+        total_counts = {}
+        try:
+            if ProvisionerConfig().simulate:
+                simulator = ProvisionerConfig().simulator
+                for job in tenant.idle_jobs:
+                    if job.sim_status != "IDLE":
+                        continue
+                    open_reqs = simulator.get_job_requests(job.id)
+                    recent = 0
+                    for openreq in open_reqs:
+                        diff = (ProvisionerConfig().simulate_time -
+                                openreq.request_time).total_seconds()
+                        if diff <= tenant.request_rate:
+                            recent = 1
+                    recent_counts[str(job.id)] = recent
+                    total_counts[str(job.id)] = len(open_reqs)
+            elif len(tenant.idle_jobs) > 0:
+                ProvisionerConfig().dbwriter.barrier()
+                rows = queries.execute(
+                    'request_counts', tenant.request_rate,
+                    [int(job.id) for job in tenant.idle_jobs], tenant.db_id)
+                for row in rows:
+                    recent_counts[str(row['job_runner_id'])] = row['recent']
+                    total_counts[str(row['job_runner_id'])] = row['total']
+        except psycopg2.Error:
+            logger.exception("Error getting number of outstanding "
+                             "requests.")
 
         for job in list(tenant.idle_jobs):
             if ProvisionerConfig().simulate:
                 if job.sim_status != "IDLE":
                     continue
             # check to see if we are requesting too frequently
-            count = 0
-            try:
-                if ProvisionerConfig().simulate:
-                    open_reqs = ProvisionerConfig().simulator.requests
-                    for openreq in open_reqs:
-                        if openreq.job_runner_id == job.id:
-                            # found an existing job
-                            diff = (ProvisionerConfig().simulate_time -
-                                    openreq.request_time).total_seconds()
-                            if diff <= tenant.request_rate:
-
-                                count = 1
-                else:
-                    rows = ProvisionerConfig().dbconn.execute(
-                        ("select count(*) from instance_request " +
-                         "where job_runner_id = '%s' and " +
-                         "request_time >= Now() - " +
-                         "'%s second'::interval and tenant = %s;") %
-                        (job.id, tenant.request_rate, tenant.db_id))
-                    for row in rows:
-                        count = row['count']
-            except psycopg2.Error:
-                logger.exception("Error getting number of outstanding "
-                                 "requests within time frame.")
-            if count > 0:
+            if recent_counts.get(str(job.id), 0) > 0:
                 tenant.idle_jobs.remove(job)
                 logger.debug("Too many requests. Removed job %s" % job.id)
                 continue
 
             # now check to see if we already have too many requests for
             # this job
-            try:
-                if ProvisionerConfig().simulate:
-                    count = 0
-                    open_reqs = ProvisionerConfig().simulator.requests
-                    for openreq in open_reqs:
-                        if openreq.job_runner_id == job.id:
-                            count = count + 1
-                    if count > ProvisionerConfig().max_requests:
-                        logger.warn("Too many outstanding requests, " +
-                                    "removing idle job: %s" % repr(job))
-                        tenant.idle_jobs.remove(job)
-                else:
-                    rows = ProvisionerConfig().dbconn.execute(
-                        ("select count(*) from instance_request "
-                         "where job_runner_id = '%s' and tenant = %s;") %
-                        (job.id, tenant.db_id))
-                    count = 0
-                    for row in rows:
-                        count = row['count']
-                    if count > ProvisionerConfig().max_requests:
-                        logger.warn("Too many outstanding requests, "
-                                    "removing idle job: %s" % repr(job))
-                        tenant.idle_jobs.remove(job)
-            except psycopg2.Error:
-                logger.exception("Error getting number of outstanding "
-                                 "requests.")
+            if (total_counts.get(str(job.id), 0) >
+                    ProvisionerConfig().max_requests):
+                logger.warn("Too many outstanding requests, "
+                            "removing idle job: %s" % repr(job))
+                tenant.idle_jobs.remove(job)
@@ -2,6 +2,7 @@ import datetime
 import json
 
 from scrimp import logger, ProvisionerConfig
+from scrimp.scheduler import base_scheduler
 from scrimp.scheduler.base_scheduler import BaseScheduler
 from scrimp.scheduler import Job
 
@@ -19,10 +20,7 @@ class SimScheduler(BaseScheduler):
         Create a new job object for each then return a list of them.
         """
 
-        if self.job_data is None:
-            with open(ProvisionerConfig().jobs_file) as data_file:
-                logger.debug("SIMULATION: READING DATA")
-                self.job_data = json.load(data_file)
+        self.load_job_data()
 
         # NOTE: this now doesn't work for multiple tenants as this
         # is self.jobs. change it back
@@ -53,6 +51,59 @@ class SimScheduler(BaseScheduler):
 
         return self.jobs
 
+    def load_job_data(self):
+        """
+        Read the job trace in to memory if it has not been already.
+        """
+        if self.job_data is None:
+            with open(ProvisionerConfig().jobs_file) as data_file:
+                logger.debug("SIMULATION: READING DATA")
+                self.job_data = json.load(data_file)
+
+    def schedule_events(self, events, tenants):
+        """
+        Add the times at which the job queue will next change to the
+        simulation's event queue: job arrivals, jobs becoming old enough to
+        be idle, jobs timing out to ondemand, and the windows used to
+        filter idle jobs (recent requests and revoked instances).
+        """
+        now = ProvisionerConfig().simulate_time
+        # The next job to arrive from the trace (they are read in order).
+        self.load_job_data()
+        if len(self.job_data) > 0:
+            events.push(ProvisionerConfig().sim_time + datetime.timedelta(
+                seconds=int(self.job_data[0]['relative_time'])),
+                'job arrival', strict=True)
+
+        simulator = ProvisionerConfig().simulator
+        for tenant in tenants:
+            for job in tenant.jobs:
+                if job.sim_status != "IDLE":
+                    continue
+                job_idle_at = job.req_time + \
+                    datetime.timedelta(seconds=tenant.idle_time)
+                if job_idle_at >= now:
+                    events.push(job_idle_at, 'job idle', strict=True)
+                timeout_at = job.req_time + \
+                    datetime.timedelta(seconds=tenant.timeout)
+                if tenant.timeout > 0 and timeout_at >= now:
+                    events.push(timeout_at, 'job timeout', strict=True)
+
+            # Jobs are held back while they have a recent request
+            for request in simulator.requests:
+                rate_at = request.request_time + \
+                    datetime.timedelta(seconds=tenant.request_rate)
+                if rate_at >= now:
+                    events.push(rate_at, 'request rate', strict=True)
+
+        # and are treated as fulfilled until the instance could have been
+        # revoked.
+        table = simulator.resource_table
+        revoke_at = table.column('launch_time') + base_scheduler.REVOKED_TIME
+        revoke_at = revoke_at[revoke_at > table.to_seconds(now)]
+        if revoke_at.size > 0:
+            events.push(table.to_time(revoke_at.min()), 'revoked')
+
     def process_job_description(self, desc):
         """
         Convert the job description in to a dict that will be
@@ -1,5 +1,8 @@
+import time
 import psycopg2
+from sqlalchemy import exc
 from scrimp import logger, ProvisionerConfig, SimpleStringifiable
+from scrimp import queries
 
 
 class Tenant(SimpleStringifiable):
@@ -43,10 +46,47 @@ class Tenant(SimpleStringifiable):
         self.request_rate = 120
         self.jobs = []
         self.idle_jobs = []
+        # The (instance type, zone) pairs already requested for each idle
+        # job, and how many requests have been made for it
+        self.existing_requests = {}
+        self.existing_request_counts = {}
+        # The current spot prices in this tenant's zones (a SpotPriceView)
+        self.spot_prices = None
 
         self.AvgDrAFTSPrice = {}
 
 
+def read_tenants():
+    """
+    Read the subscribed tenants, with their subnets, in one query.
+    """
+    tenant_list = []
+    # Only get those that are subscribed
+    rows = queries.execute('tenants')
+    # Create a tenant object for each row returned
+    for row in rows:
+        t = Tenant(row['id'], row['name'], row['public_address'],
+                   row['condor_address'], row['public_ip'],
+                   row['zone'], row['subnet'], row['subnet_id'],
+                   row['vpc'], row['security_group'], row['domain'],
+                   row['max_bid_price'], row['bid_percent'],
+                   row['timeout_threshold'], row['access_key_id'],
+                   row['secret_key'], row['key_pair'])
+        # Create a dict for the subnets and add that to the tenant
+        # I later realised that I need the database id of the subnet to
+        # store the instance request in the database:
+        # Hello, subnets_db_id.
+        subnets = {}
+        subnets_db_id = {}
+        for sn in row['subnets'] or []:
+            subnets[str(sn['zone'])] = str(sn['subnet'])
+            subnets_db_id[str(sn['zone'])] = sn['id']
+        t.subnets = subnets
+        t.subnets_db_id = subnets_db_id
+        tenant_list.append(t)
+    return tenant_list
+
+
 def load_from_db():
     """
     Load all of the tenant data. This should let us iterate over the
@@ -54,62 +94,65 @@ def load_from_db():
     It should also let us shut down unnecessary requests across the board
     as this will load their aws credentials.
     """
-    tenant_list = []
-    # Pull all of the tenant data from the database
     try:
-        # Only get those that are subscribed
-        tenant_columns = ['id', 'name', 'public_address', 'condor_address',
-                          'public_ip', 'zone', 'vpc', 'security_group',
-                          'domain']
-        tenant_settings_columns = ['max_bid_price', 'bid_percent',
-                                   'timeout_threshold']
-        tenant_selection = ', '.join('tenant.' + c for c in tenant_columns)
-        tenant_settings_selection = ', '.join('tenant_settings.' + c for c
-                                              in tenant_settings_columns)
-        aws_creds_columns = ['access_key_id', 'secret_key', 'key_pair']
-        aws_creds_selection = ', '.join('aws_credentials.' + c for c in
-                                        aws_creds_columns)
-        subnet_columns = ['subnet', 'id as subnet_id']
-        subnet_selection = ', '.join('subnet_mapping.' + c for c in
-                                     subnet_columns)
-        full_selection = ', '.join((tenant_selection,
-                                    tenant_settings_selection,
-                                    aws_creds_selection, subnet_selection))
-
-        rows = ProvisionerConfig().dbconn.execute(
-            "SELECT " + full_selection + 
-            " FROM tenant, tenant_settings, aws_credentials, subnet_mapping"
-            " WHERE tenant_settings.tenant = tenant.id AND"
-            " tenant.credentials = aws_credentials.id AND"
-            " tenant.subscribed = TRUE AND subnet_mapping.tenant"
-            " = tenant.id AND subnet_mapping.zone = tenant.zone")
-        # Create a tenant object for each row returned
-        for row in rows:
-            t = Tenant(row['id'], row['name'], row['public_address'],
-                       row['condor_address'], row['public_ip'],
-                       row['zone'], row['subnet'], row['subnet_id'],
-                       row['vpc'], row['security_group'], row['domain'],
-                       row['max_bid_price'], row['bid_percent'],
-                       row['timeout_threshold'], row['access_key_id'],
-                       row['secret_key'], row['key_pair'])
-            # Pull the subnets for the tenant too
-            subnets = {}
-            subnets_db_id = {}
-            subs = ProvisionerConfig().dbconn.execute(
-                "select * "
-                "from subnet_mapping "
-                "where tenant = %s" % t.db_id)
-            # Create a dict for the subnets and add that to the tenant
-            # I later realised that I need the database id of the subnet to
-            # store the instance request in the database:
-            # Hello, subnets_db_id.
-            for sn in subs:
-                subnets.update({sn['zone']: sn['subnet']})
-                subnets_db_id.update({sn['zone']: sn['id']})
-            t.subnets = subnets
-            t.subnets_db_id = subnets_db_id
-            tenant_list.append(t)
+        return read_tenants()
     except psycopg2.Error:
         logger.exception("Failed to get tenant data.")
+    return []
 
-    return tenant_list
+
+class TenantCache(object):
+    """
+    The tenants, kept between cycles. The tenant tables are only read
+    again when the version in tenant_version, which triggers bump on every
+    change to them, has moved, which is much cheaper than reloading every
+    cycle. They are also read again once they are tenant_cache_age seconds
+    old, or whenever the version can not be read.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.tenants = None
+        self.loaded = None
+        self.loads = 0
+
+    def current_version(self):
+        """
+        Get the tenant tables' version, or None if it can not be read
+        (e.g. the migration adding it has not been applied).
+        """
+        try:
+            return queries.execute('tenants_version').scalar()
+        except (psycopg2.Error, exc.DBAPIError):
+            logger.exception("Failed to get the tenant version.")
+            return None
+
+    def stale(self, version, now):
+        if self.tenants is None or version is None:
+            return True
+        if now - self.loaded >= ProvisionerConfig().tenant_cache_age:
+            return True
+        return version != self.version
+
+    def load(self):
+        """
+        Get the tenants, reloading them if they have changed.
+        """
+        version = self.current_version()
+        now = time.time()
+        try:
+            if self.stale(version, now):
+                self.tenants = read_tenants()
+                self.version = version
+                self.loaded = now
+                self.loads += 1
+                logger.debug("Loaded %s tenants (version %s)." % (
+                    len(self.tenants), version))
+        except psycopg2.Error:
+            logger.exception("Failed to get tenant data.")
+        return self.tenants or []
+
+    def clear(self):
+        self.tenants = None
+        self.version = None
+        self.loaded = None
@@ -13,9 +13,10 @@ setup(
     packages=['scrimp',
               'scrimp.cloud', 'scrimp.cloud.aws', 'scrimp.cloud.simaws',
               'scrimp.scheduler', 'scrimp.scheduler.condor', 'scrimp.scheduler.simfile'],
-    package_data={'': ['*.ini']},
+    package_data={'': ['*.ini'], 'scrimp': ['migrations/*.sql']},
     entry_points={'console_scripts':
-                  ['scrimp = scrimp.cli:main']},
+                  ['scrimp = scrimp.cli:main',
+                   'scrimp-migrate = scrimp.migrate:main']},
 
     long_description=readme_text
 )
@@ -1,2 +1,3 @@
 from tests.helpers.exceptions import ensure_except
 from tests.helpers.mocked_io import MockedIO
+from tests.helpers.tenants import make_tenant
@@ -0,0 +1,16 @@
+import mock
+
+
+def make_tenant(name, access_key='key', db_id=None, idle_jobs=0):
+    """
+    A mock tenant with the name and AWS credentials the EC2 code keys on,
+    and optionally a database id and some idle jobs.
+    """
+    tenant = mock.Mock(spec=['name', 'access_key', 'secret_key', 'db_id',
+                             'idle_jobs'])
+    tenant.name = name
+    tenant.access_key = access_key
+    tenant.secret_key = 'secret'
+    tenant.db_id = db_id
+    tenant.idle_jobs = [mock.Mock() for i in range(idle_jobs)]
+    return tenant
@@ -0,0 +1,98 @@
+import threading
+from decimal import Decimal
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.drafts import DrAFTSClient
+
+
+GRAPH = "0.5 0.10\n1.0 0.12\n2.5 0.15\n6.0 0.30\n\n"
+
+
+class GraphHandler(BaseHTTPRequestHandler):
+    """
+    Serve a prediction graph for any instance type in us-east-1e, and a 404
+    for anything else.
+    """
+    requests = []
+
+    def do_GET(self):
+        GraphHandler.requests.append(self.path)
+        if not self.path.startswith('/vpc/us-east-1e-'):
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(GRAPH)))
+        self.end_headers()
+        self.wfile.write(GRAPH)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestRunner(MockedIO):
+    def setUp(self):
+        MockedIO.setUp(self)
+        GraphHandler.requests = []
+        self.server = HTTPServer(('127.0.0.1', 0), GraphHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/vpc' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        MockedIO.tearDown(self)
+
+    @istest
+    def fetch_and_parse_prediction(self):
+        """
+        Integration: DrAFTSClient Fetches And Parses A Prediction Graph
+        """
+        client = DrAFTSClient(self.url)
+        prediction = client.get('us-east-1e', 'c3.2xlarge')
+        assert prediction.drafts_bid(1) == Decimal('0.15')
+        assert prediction.oracle_bid(0.25) == Decimal('0.10')
+        assert prediction.oracle_bid(2) == Decimal('0.15')
+        # no prediction is long enough, so the last one is used
+        assert prediction.oracle_bid(10) == Decimal('0.30')
+        assert GraphHandler.requests == ['/vpc/us-east-1e-c3.2xlarge.pgraph']
+
+    @istest
+    def predictions_are_cached(self):
+        """
+        Integration: DrAFTSClient Serves Repeat Lookups From Its Cache
+        """
+        client = DrAFTSClient(self.url)
+        for i in range(5):
+            client.get('us-east-1e', 'c3.2xlarge')
+        assert len(GraphHandler.requests) == 1
+        # an expired cache entry is fetched again
+        client.ttl = 0
+        client.get('us-east-1e', 'c3.2xlarge')
+        assert len(GraphHandler.requests) == 2
+
+    @istest
+    def prefetch_fetches_each_graph_once(self):
+        """
+        Integration: DrAFTSClient Prefetches Every Graph Concurrently
+        """
+        client = DrAFTSClient(self.url)
+        keys = [('us-east-1e', t) for t in
+                ['c3.2xlarge', 'c3.4xlarge', 'm3.2xlarge', 'r3.2xlarge']]
+        client.prefetch(keys + keys)
+        assert len(GraphHandler.requests) == 4
+        for zone, ins_type in keys:
+            assert client.get(zone, ins_type) is not None
+        assert len(GraphHandler.requests) == 4
+
+    @istest
+    def missing_graph_returns_none(self):
+        """
+        Integration: DrAFTSClient Returns None For A Missing Graph
+        """
+        client = DrAFTSClient(self.url)
+        assert client.get('us-east-1a', 'c3.2xlarge') is None
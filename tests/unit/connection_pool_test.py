@@ -0,0 +1,53 @@
+import mock
+import socket
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws.connections import ConnectionPool
+
+
+class TestRunner(MockedIO):
+    @istest
+    def reuses_connections(self):
+        """
+        Unit: ConnectionPool Reuses Connections For The Same Account
+        """
+        pool = ConnectionPool()
+        with mock.patch('boto.connect_ec2') as connect:
+            connect.side_effect = lambda *args: mock.Mock()
+            with pool.checkout('key1', 'secret') as conn1:
+                pass
+            with pool.checkout('key1', 'secret') as conn2:
+                # a concurrent checkout gets its own connection
+                with pool.checkout('key1', 'secret') as conn3:
+                    pass
+            with pool.checkout('key2', 'secret') as conn4:
+                pass
+        assert conn1 is conn2
+        assert conn3 is not conn2
+        assert conn4 is not conn1
+        assert connect.call_count == 3
+        assert pool.reused == 1
+
+    @istest
+    def discards_broken_and_idle_connections(self):
+        """
+        Unit: ConnectionPool Discards Broken And Idle Connections
+        """
+        pool = ConnectionPool(max_idle=60)
+        with mock.patch('boto.connect_ec2') as connect:
+            connect.side_effect = lambda *args: mock.Mock()
+            try:
+                with pool.checkout('key1', 'secret') as conn1:
+                    raise socket.error()
+            except socket.error:
+                pass
+            with pool.checkout('key1', 'secret') as conn2:
+                pass
+            assert conn2 is not conn1
+            assert conn1.close.called
+
+            pool.idle[('key1', None)][0].last_used -= 120
+            assert pool.evict_idle() == 1
+            assert conn2.close.called
+            assert pool.idle == {}
@@ -0,0 +1,50 @@
+import mock
+from nose.tools import istest, assert_raises
+from sqlalchemy import exc
+from tests.helpers import MockedIO
+
+from scrimp.database import Database
+
+
+def lost_connection():
+    return exc.DBAPIError("select 1", None, Exception("server closed"),
+                          connection_invalidated=True)
+
+
+class TestRunner(MockedIO):
+    @istest
+    def reconnects_when_connection_lost(self):
+        """
+        Unit: Database Retries A Statement On A New Connection
+        """
+        first = mock.Mock(closed=False)
+        first.execute.side_effect = lost_connection()
+        second = mock.Mock(closed=False)
+        second.execute.return_value = 'rows'
+        engine = mock.Mock()
+        engine.connect.side_effect = [first, second]
+
+        db = Database(engine)
+        assert db.execute("select 1") == 'rows'
+        assert first.close.called
+        assert db.connection() is second
+        assert db.stats['sql'][0] == 1
+
+    @istest
+    def gives_up_after_retries(self):
+        """
+        Unit: Database Raises Errors That Are Not Lost Connections
+        """
+        conn = mock.Mock(closed=False)
+        conn.execute.side_effect = lost_connection()
+        engine = mock.Mock()
+        engine.connect.return_value = conn
+
+        db = Database(engine, retries=2)
+        assert_raises(exc.DBAPIError, db.execute, "select 1")
+        assert engine.connect.call_count == 3
+
+        conn.execute.side_effect = exc.DBAPIError(
+            "select 1", None, Exception("syntax error"))
+        assert_raises(exc.DBAPIError, db.execute, "select 1")
+        assert engine.connect.call_count == 4
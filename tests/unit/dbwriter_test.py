@@ -0,0 +1,83 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.dbwriter import DBWriter, NOW
+
+
+def make_writer():
+    engine = mock.Mock()
+    conn = engine.connect.return_value.execution_options.return_value
+    return DBWriter(engine), conn
+
+
+class TestRunner(MockedIO):
+    @istest
+    def merges_updates_to_a_row(self):
+        """
+        Unit: DBWriter Merges Queued Updates To The Same Row
+        """
+        writer, conn = make_writer()
+        writer.insert('launch_stats', [('request_id', 'sir-1'),
+                                       ('request_time', NOW)])
+        writer.update('launch_stats', ('request_id', 'sir-1'),
+                      [('instance_id', 'i-1')])
+        writer.update('launch_stats', ('request_id', 'sir-1'),
+                      [('private_dns', 'ip-10-0-0-1')])
+        assert len(writer) == 2
+        writer.barrier()
+        assert len(writer) == 0
+
+        calls = conn.execute.call_args_list
+        assert len(calls) == 2
+        sql, params = calls[0][0]
+        assert sql == ("insert into launch_stats (request_id, request_time) "
+                       "values (%s, NOW() - %s::interval)"), sql
+        assert params[0] == 'sir-1'
+        assert params[1].endswith(' second')
+        sql, params = calls[1][0]
+        assert sql == ("update launch_stats set instance_id = %s, "
+                       "private_dns = %s where request_id = %s"), sql
+        assert params == ('i-1', 'ip-10-0-0-1', 'sir-1')
+        assert conn.begin.return_value.commit.call_count == 1
+
+    @istest
+    def retries_failed_batches_separately(self):
+        """
+        Unit: DBWriter Writes Statements Separately When A Batch Fails
+        """
+        writer, conn = make_writer()
+        writer.insert('instance', [('instance_id', 'i-1')])
+        writer.insert('instance', [('instance_id', 'i-2')])
+        conn.execute.side_effect = [Exception('bad'), None, None]
+        writer.barrier()
+        assert conn.execute.call_count == 3
+        assert conn.begin.return_value.commit.call_count == 2
+        assert conn.begin.return_value.rollback.call_count == 1
+
+    @istest
+    def combines_inserts(self):
+        """
+        Unit: DBWriter Combines Inserts Into Multi-Row Inserts
+        """
+        writer, conn = make_writer()
+        for i in range(3):
+            writer.insert('launch_stats', [('request_id', 'sir-%s' % i)])
+            writer.insert('instance_request', [('request_id', 'sir-%s' % i),
+                                               ('price', 0.1)])
+        writer.update('launch_stats', ('request_id', 'sir-0'),
+                      [('instance_id', 'i-0')])
+        writer.insert('launch_stats', [('request_id', 'sir-3')])
+        writer.barrier()
+
+        calls = [c[0] for c in conn.execute.call_args_list]
+        assert calls == [
+            ("insert into launch_stats (request_id) values (%s), (%s), (%s)",
+             ('sir-0', 'sir-1', 'sir-2')),
+            ("insert into instance_request (request_id, price) values "
+             "(%s, %s), (%s, %s), (%s, %s)",
+             ('sir-0', 0.1, 'sir-1', 0.1, 'sir-2', 0.1)),
+            ("update launch_stats set instance_id = %s where "
+             "request_id = %s", ('i-0', 'sir-0')),
+            ("insert into launch_stats (request_id) values (%s)",
+             ('sir-3',))], calls
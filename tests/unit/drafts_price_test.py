@@ -0,0 +1,57 @@
+import random
+from decimal import Decimal
+
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp import provisioner
+from scrimp.provisioner import Provisioner
+
+
+def make_rows(count):
+    rows = []
+    for i in range(count):
+        rows.append({'type': random.choice(['c3.large', 'm3.large']),
+                     'zone': random.choice(['us-east-1a', 'us-east-1e']),
+                     'price': Decimal('%.4f' % random.uniform(0.01, 1)),
+                     'time': '%.2f' % random.uniform(0, 10)})
+    return rows
+
+
+def scan(rows, ins, zone, threshold, cur_price):
+    """
+    The cheapest price above cur_price lasting longer than threshold,
+    found by checking every row.
+    """
+    found = [row['price'] for row in rows
+             if row['type'] == ins and row['zone'] == zone and
+             float(row['price']) > float(cur_price) and
+             float(row['time']) > threshold]
+    if len(found) == 0:
+        return None
+    return Decimal(str(min(found)))
+
+
+class TestRunner(MockedIO):
+    @istest
+    def matches_linear_scan(self):
+        """
+        Unit: Indexed DrAFTS Prices Agree With Scanning Every Prediction
+        """
+        rows = make_rows(300)
+        prov = Provisioner.__new__(Provisioner)
+        with mock.patch.object(provisioner, 'ProvisionerConfig') as config, \
+                mock.patch.object(provisioner, 'queries') as queries:
+            config.return_value.simulate = False
+            queries.execute.return_value = rows
+            prov.load_drafts_data()
+        for i in range(500):
+            ins = random.choice(['c3.large', 'm3.large', 'r3.large'])
+            zone = random.choice(['us-east-1a', 'us-east-1e'])
+            threshold = random.choice([1, random.uniform(0, 11)])
+            cur_price = Decimal('%.4f' % random.uniform(0, 1.1))
+            expected = scan(rows, ins, zone, threshold, cur_price)
+            assert prov.get_drafts_price(ins, zone, threshold,
+                                         cur_price) == expected, (
+                ins, zone, threshold, cur_price)
@@ -0,0 +1,76 @@
+import time
+import threading
+
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import api
+from scrimp.cloud.aws.executor import EC2Executor
+
+
+class TestRunner(MockedIO):
+    @istest
+    def bounds_calls_in_flight(self):
+        """
+        Unit: EC2Executor Runs At Most workers Calls At Once
+        """
+        lock = threading.Lock()
+        state = {'running': 0, 'most': 0}
+
+        def call(i):
+            with lock:
+                state['running'] += 1
+                state['most'] = max(state['most'], state['running'])
+            time.sleep(0.02)
+            with lock:
+                state['running'] -= 1
+            return i * 2
+
+        executor = EC2Executor(3)
+        assert executor.map('request', call, range(10)) == range(0, 20, 2)
+        executor.close()
+        assert state['most'] == 3
+        wall, calls, total, longest = executor.stats['request']
+        assert calls == 10
+        # the calls overlapped
+        assert wall < total
+
+    @istest
+    def requests_then_tags_concurrently(self):
+        """
+        Unit: request_resources Launches And Queues Tags For Each Job
+        """
+        tenant = mock.Mock()
+        tenant.name = 'tenant'
+        jobs = []
+        for i in range(4):
+            job = mock.Mock()
+            job.id = i
+            job.fulfilled = False
+            job.req_cpus = 1
+            job.launch.count = 1
+            job.launch.ondemand = False
+            jobs.append(job)
+        jobs[3].fulfilled = True
+        tenant.idle_jobs = jobs
+
+        executor = EC2Executor(2)
+        with mock.patch.object(api, 'tenant_connection'), \
+                mock.patch.object(api, 'customise_cloudinit') as cloudinit, \
+                mock.patch.object(api, 'launch_spot_request') as launch, \
+                mock.patch.object(api, 'tag_queue') as tag_queue:
+            # each job has different user data, so is requested separately
+            cloudinit.side_effect = lambda t, job: job.id
+            launch.side_effect = lambda conn, req, t, jobs, user_data: [
+                (job, ['sir-%s' % job.id]) for job in jobs]
+            tagged = []
+            tag_queue.add = lambda t, ids: tagged.append(ids)
+            api.request_resources(tenant, executor)
+        executor.close()
+        assert len(launch.call_args_list) == 3
+        # each batch's requests are queued for tagging as it is made
+        assert len(tagged) == 3
+        assert sorted(req for ids in tagged
+                      for req in ids) == ['sir-0', 'sir-1', 'sir-2']
+        assert executor.stats['request'][1] == 3
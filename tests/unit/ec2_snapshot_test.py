@@ -0,0 +1,56 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO, make_tenant
+
+from scrimp.cloud.aws.connections import ConnectionPool
+from scrimp.cloud.aws.executor import EC2Executor
+from scrimp.cloud.aws.snapshot import EC2Snapshot, take_snapshots
+
+
+def make_request(req_id, tags):
+    req = mock.Mock(spec=['id', 'tags'])
+    req.id = req_id
+    req.tags = tags
+    return req
+
+
+class TestRunner(MockedIO):
+    @istest
+    def filters_open_requests_by_tag(self):
+        """
+        Unit: EC2Snapshot Filters Open Requests By Tag Value
+        """
+        conn = mock.Mock()
+        conn.get_all_instances.return_value = []
+        conn.get_all_spot_instance_requests.return_value = [
+            make_request('sir-1', {'tenant': 'a', 'Name': 'worker@a'}),
+            make_request('sir-2', {'tenant': 'b'}),
+            make_request('sir-3', {})]
+        snapshot = EC2Snapshot(conn)
+        assert [r.id for r in snapshot.open_requests('a')] == ['sir-1']
+        assert [r.id for r in snapshot.open_requests('c')] == []
+        conn.get_all_spot_instance_requests.assert_called_once_with(
+            filters={'state': 'open'})
+
+    @istest
+    def one_snapshot_per_account(self):
+        """
+        Unit: take_snapshots Describes Each Account Once
+        """
+        tenants = [make_tenant('a', 'key1'), make_tenant('b', 'key1'),
+                   make_tenant('c', 'key2')]
+        with mock.patch('boto.connect_ec2') as connect:
+            snapshots = take_snapshots(tenants, ConnectionPool())
+        assert connect.call_count == 2
+        assert sorted(snapshots.keys()) == [('key1', 'secret'),
+                                            ('key2', 'secret')]
+
+        # the accounts can be described concurrently
+        executor = EC2Executor(2)
+        with mock.patch('boto.connect_ec2') as connect:
+            snapshots = take_snapshots(tenants, ConnectionPool(), executor)
+        executor.close()
+        assert connect.call_count == 2
+        assert sorted(snapshots.keys()) == [('key1', 'secret'),
+                                            ('key2', 'secret')]
+        assert executor.stats['describe'][1] == 2
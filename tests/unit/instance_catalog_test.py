@@ -0,0 +1,126 @@
+import os
+import random
+import shutil
+import tempfile
+
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp import config, provisioner
+from scrimp.cloud.aws import Instance, InstanceCatalog, manager
+from scrimp.provisioner import Provisioner
+from scrimp.scheduler import Job
+
+LIVE_CONFIG = """
+[Database]
+database: scrimp
+host: localhost
+user: scrimp
+password: scrimp
+port: 5432
+[Provision]
+ondemand_price_threshold: .8
+max_requests: 3
+run_rate: 2
+DrAFTS: False
+DrAFTSAvgPrice: False
+DrAFTSProfiles: False
+[Simulation]
+Simulate: False
+NegTime: 0
+JobNumber: 0
+IdleTime: 120
+Terminate: False
+OverheadTime: 0
+JobFile: jobs.json
+RunName: live
+"""
+
+
+def make_instances():
+    return [Instance(1, 'c3.2xlarge', 0.42, 8, 15, 80, 'ami-1'),
+            Instance(2, 'c3.4xlarge', 0.84, '16', '30', 160, 'ami-1'),
+            Instance(3, 'm3.2xlarge', 0.532, 8, 30, 80, 'ami-1'),
+            Instance(4, 'r3.2xlarge', 0.665, 8, 61, 160, 'ami-1'),
+            Instance(5, 'r3.8xlarge', 2.66, 32, 244, 640, 'ami-1')]
+
+
+def make_job(cpus, memory):
+    return Job('tenant_addr', '1', 1, None, cpus, memory, 1)
+
+
+class TestRunner(MockedIO):
+    @istest
+    def eligible_instances_in_load_order(self):
+        """
+        Unit: InstanceCatalog Finds Eligible Instances In Load Order
+        """
+        instances = make_instances()
+        catalog = InstanceCatalog(instances)
+        eligible = catalog.eligible(make_job(8, 30))
+        assert [i.type for i in eligible] == [
+            'c3.4xlarge', 'm3.2xlarge', 'r3.2xlarge', 'r3.8xlarge'], eligible
+        assert catalog.eligible(make_job(64, 1)) == []
+
+    @istest
+    def matches_linear_scan(self):
+        """
+        Unit: InstanceCatalog Agrees With Checking Each Instance
+        """
+        instances = make_instances()
+        catalog = InstanceCatalog(instances)
+        for i in range(200):
+            job = make_job(random.randint(0, 40), random.randint(0, 260))
+            expected = [ins for ins in instances
+                        if int(ins.cpus) >= int(job.req_cpus) and
+                        int(ins.memory) >= int(job.req_mem)]
+            assert catalog.eligible(job) == expected
+            for ins in instances:
+                assert (catalog.check_requirements(ins, job) ==
+                        (ins in expected))
+                assert (catalog.check_requirements(ins.type, job) ==
+                        (ins in expected))
+
+    @istest
+    def lookup_by_name(self):
+        """
+        Unit: InstanceCatalog Looks Up Instances By Name
+        """
+        instances = make_instances()
+        catalog = InstanceCatalog(instances)
+        assert catalog.get('m3.2xlarge') is instances[2]
+        assert catalog.get('t2.micro') is None
+        # an instance that isn't in the catalog is checked directly
+        other = Instance(9, 'm3.2xlarge', 0.5, 4, 8, 80, 'ami-1')
+        assert not catalog.check_requirements(other, make_job(8, 1))
+
+    @istest
+    def live_mode_has_empty_catalog(self):
+        """
+        Unit: InstanceCatalog Is Empty Rather Than Missing When Live
+        """
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'provisioner.ini')
+            with open(path, 'w') as f:
+                f.write(LIVE_CONFIG)
+            with mock.patch.object(config, 'create_engine'), \
+                    mock.patch.object(config, 'Database'), \
+                    mock.patch.object(config, 'DBWriter'):
+                # bypass the singleton so the shared instance is untouched
+                cfg = config.ProvisionerConfig.__new__(
+                    config.ProvisionerConfig)
+                cfg.__init__(config_file=path)
+        finally:
+            shutil.rmtree(tmp)
+        assert not cfg.simulate
+        assert len(cfg.instance_catalog) == 0
+
+        prov = Provisioner.__new__(Provisioner)
+        job = make_job(8, 30)
+        with mock.patch.object(provisioner, 'ProvisionerConfig') as p, \
+                mock.patch.object(manager, 'ProvisionerConfig') as m:
+            p.return_value = m.return_value = cfg
+            assert prov.restrict_instances(job) == []
+            assert not manager.check_requirements('m3.2xlarge', job)
@@ -0,0 +1,137 @@
+import os
+import re
+import shutil
+import tempfile
+
+import mock
+from nose.tools import istest, assert_raises
+from tests.helpers import MockedIO
+
+from scrimp import migrate
+
+
+class FakeConnection(object):
+    """
+    Records statements, with the given applied versions, existing tables
+    and invalid indexes.
+    """
+
+    def __init__(self, versions=(), tables=(), invalid=()):
+        self.versions = versions
+        self.tables = tables
+        self.invalid = invalid
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        res = mock.Mock()
+        if sql.startswith("select version"):
+            return [(v,) for v in self.versions]
+        if sql.startswith("select to_regclass"):
+            res.scalar.return_value = (
+                params[0] if params[0] in self.tables else None)
+            return res
+        if sql.startswith("select c.relname"):
+            return [(i,) for i in self.invalid]
+        self.executed.append((sql, params))
+        return res
+
+
+class TestRunner(MockedIO):
+    def setUp(self):
+        MockedIO.setUp(self)
+        self.path = tempfile.mkdtemp()
+        with open(os.path.join(self.path, '0001_first.sql'), 'w') as f:
+            f.write("-- a comment; with a semicolon\n"
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n"
+                    "ON a (x);\n\n"
+                    "CREATE INDEX CONCURRENTLY IF NOT EXISTS b_idx\n"
+                    "ON b (y);\n")
+        with open(os.path.join(self.path, '0002_second.sql'), 'w') as f:
+            f.write("ALTER TABLE a ADD COLUMN z integer;\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        MockedIO.tearDown(self)
+
+    @istest
+    def applies_pending_migrations(self):
+        """
+        Unit: Migrations Are Applied In Order And Recorded Once
+        """
+        conn = FakeConnection(tables=['a', 'b'])
+        assert migrate.migrate(conn, self.path) == [1, 2]
+        sql = [s for s, p in conn.executed]
+        assert sql[0].startswith("CREATE TABLE IF NOT EXISTS schema_version")
+        assert sql[1] == ("CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n"
+                          "ON a (x)")
+        assert sql[2] == ("CREATE INDEX CONCURRENTLY IF NOT EXISTS b_idx\n"
+                          "ON b (y)")
+        assert conn.executed[3][1] == (1, 'first')
+        assert sql[4] == "ALTER TABLE a ADD COLUMN z integer"
+        assert conn.executed[5][1] == (2, 'second')
+
+        conn = FakeConnection(versions=[1], tables=['a', 'b'])
+        assert migrate.migrate(conn, self.path) == [2]
+        conn = FakeConnection(tables=['a', 'b'])
+        assert migrate.migrate(conn, self.path, target=1) == [1]
+
+    @istest
+    def skipped_statements_not_recorded(self):
+        """
+        Unit: A Migration On A Missing Table Is Applied Again Later
+        """
+        conn = FakeConnection(tables=['a'])
+        assert migrate.migrate(conn, self.path) == [2]
+        sql = [s for s, p in conn.executed]
+        # b does not exist here, so its index is skipped and the first
+        # migration is not recorded
+        assert sql[1] == ("CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n"
+                          "ON a (x)")
+        assert sql[2] == "ALTER TABLE a ADD COLUMN z integer"
+        assert conn.executed[3][1] == (2, 'second')
+
+        # once b exists the migration is completed
+        conn = FakeConnection(versions=[2], tables=['a', 'b'])
+        assert migrate.migrate(conn, self.path) == [1]
+
+    @istest
+    def stops_on_invalid_indexes(self):
+        """
+        Unit: A Migration Leaving Invalid Indexes Is Not Recorded
+        """
+        conn = FakeConnection(tables=['a', 'b'], invalid=['b_idx'])
+        assert_raises(migrate.MigrationError, migrate.migrate, conn,
+                      self.path)
+        assert not [s for s, p in conn.executed
+                    if s.startswith("insert into schema_version")]
+
+    @istest
+    def keeps_quoted_bodies_whole(self):
+        """
+        Unit: Semicolons In $$ Quoted Bodies Do Not Split Statements
+        """
+        sql = ("CREATE TABLE t(x integer);\n"
+               "-- bump; the version\n"
+               "CREATE FUNCTION f() RETURNS trigger AS $$\n"
+               "BEGIN\n  UPDATE t SET x = x + 1;\n  RETURN NULL;\nEND;\n"
+               "$$ LANGUAGE plpgsql;\n"
+               "CREATE TRIGGER g AFTER UPDATE ON t\n"
+               "FOR EACH STATEMENT EXECUTE PROCEDURE f();\n")
+        found = migrate.statements(sql)
+        assert found == [
+            "CREATE TABLE t(x integer)",
+            "CREATE FUNCTION f() RETURNS trigger AS $$\n"
+            "BEGIN\n  UPDATE t SET x = x + 1;\n  RETURN NULL;\nEND;\n"
+            "$$ LANGUAGE plpgsql",
+            "CREATE TRIGGER g AFTER UPDATE ON t\n"
+            "FOR EACH STATEMENT EXECUTE PROCEDURE f()"], found
+
+        # the tenant version triggers are only created on the tenant tables
+        for version, name, filename in migrate.migrations():
+            with open(filename) as f:
+                for stmt in migrate.statements(f.read()):
+                    match = re.search(r'\bON\s+(\w+)', stmt, re.IGNORECASE)
+                    if version == 3 and match is not None:
+                        assert match.group(1) in (
+                            'tenant', 'tenant_settings', 'aws_credentials',
+                            'subnet_mapping'), stmt
@@ -0,0 +1,45 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import manager
+
+
+def make_instance(ins_id, spot_request_id=None):
+    inst = mock.Mock()
+    inst.id = ins_id
+    inst.spot_instance_request_id = spot_request_id
+    return inst
+
+
+def make_reservation(instances):
+    res = mock.Mock()
+    res.instances = instances
+    return res
+
+
+class TestRunner(MockedIO):
+    @istest
+    def acquires_each_row_once(self):
+        """
+        Unit: check_for_new_instances Acquires Each Request Exactly Once
+        """
+        spot = make_instance('i-1', 'sir-1')
+        ondemand = make_instance('i-2')
+        other = make_instance('i-22')
+        reservations = [make_reservation([spot, ondemand]),
+                        make_reservation([other])]
+        rows = [{'id': 1, 'job_runner_id': '10', 'request_id': 'sir-1'},
+                {'id': 2, 'job_runner_id': '11', 'request_id': 'i-22'},
+                {'id': 3, 'job_runner_id': '12', 'request_id': 'sir-9'}]
+        tenant = mock.Mock()
+        with mock.patch.object(manager, 'ProvisionerConfig'), \
+                mock.patch.object(manager, 'queries') as queries, \
+                mock.patch.object(manager, 'instance_acquired') as acquired:
+            queries.execute.return_value = rows
+            manager.check_for_new_instances(
+                reservations, ['sir-1', 'i-2', 'i-22'], tenant)
+        acquired.assert_has_calls([
+            mock.call(spot, rows[0], tenant),
+            mock.call(other, rows[1], tenant)])
+        assert acquired.call_count == 2
@@ -0,0 +1,125 @@
+import mock
+import sqlalchemy
+from nose.tools import istest, assert_raises
+from sqlalchemy.engine import Connection
+from tests.helpers import MockedIO
+
+from scrimp import queries
+from scrimp.database import Database
+
+
+class StubCursor(object):
+    """
+    A DBAPI cursor that records the statements it is given.
+    """
+
+    def __init__(self, calls):
+        self.calls = calls
+        self.description = None
+        self.rowcount = 1
+        self.connection = mock.Mock(notices=[])
+
+    def execute(self, sql, params=None):
+        self.calls.append(('execute', sql, params))
+
+    def executemany(self, sql, params):
+        self.calls.append(('executemany', sql, params))
+
+    def close(self):
+        pass
+
+
+class StubConnection(object):
+    """
+    A DBAPI connection handing out StubCursors.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.info = {}
+
+    def cursor(self):
+        return StubCursor(self.calls)
+
+    def close(self):
+        pass
+
+
+def run_on_stub(prepared, *statements):
+    """
+    Execute the statements through a SQLAlchemy Connection over a stub
+    DBAPI connection, and get the cursor calls.
+    """
+    stub = StubConnection()
+    engine = mock.Mock()
+    engine.connect.return_value = Connection(
+        sqlalchemy.create_engine('postgresql://'), stub)
+    with mock.patch.object(queries, 'ProvisionerConfig') as config:
+        config.return_value.dbconn = Database(engine)
+        config.return_value.prepare_statements = prepared
+        for name, params in statements:
+            queries.execute(name, *params)
+    return stub.calls
+
+
+class TestRunner(MockedIO):
+    @istest
+    def numbers_parameters(self):
+        """
+        Unit: Statements Number Their Parameters For PREPARE
+        """
+        stmt = queries.Statement('test', "select * from t where a = %s and "
+                                 "b = ANY(%s::integer[])")
+        assert stmt.params == 2
+        assert stmt.numbered() == ("select * from t where a = $1 and "
+                                   "b = ANY($2::integer[])")
+
+    @istest
+    def prepares_once_per_connection(self):
+        """
+        Unit: Hot Statements Are Prepared Once And Executed By Name
+        """
+        conn = mock.Mock()
+        conn.info = {}
+        conn.closed = False
+        engine = mock.Mock()
+        engine.connect.return_value = conn
+        with mock.patch.object(queries, 'ProvisionerConfig') as config:
+            config.return_value.dbconn = Database(engine)
+            config.return_value.prepare_statements = True
+            queries.execute('request_counts', 120, [1, 2], 3)
+            queries.execute('request_counts', 120, [4], 3)
+            queries.execute('request_db_id', 3)
+            assert_raises(ValueError, queries.execute, 'request_db_id')
+
+        calls = [c[0] for c in conn.execute.call_args_list]
+        assert len(calls) == 4
+        assert calls[0][0].startswith("prepare request_counts as select")
+        assert "ANY($2::integer[])" in calls[0][0]
+        assert calls[1] == ("execute request_counts (%s, %s, %s)",
+                            [(120, [1, 2], 3)])
+        assert calls[2] == ("execute request_counts (%s, %s, %s)",
+                            [(120, [4], 3)])
+        assert calls[3] == (queries.STATEMENTS['request_db_id'].sql, [(3,)])
+
+    @istest
+    def array_first_is_one_parameter_set(self):
+        """
+        Unit: Statements Starting With An Array Execute Once
+        """
+        statements = [('fulfilled_requests', ([1, 2], 3)),
+                      ('orphaned_requests', ([1, 2], ['sir-1'], 3))]
+        calls = run_on_stub(False, *statements)
+        assert calls == [
+            ('execute', queries.STATEMENTS[name].sql, params)
+            for name, params in statements], calls
+
+        calls = run_on_stub(True, *statements)
+        assert len(calls) == 4, calls
+        assert calls[0][1].startswith("prepare fulfilled_requests as")
+        assert calls[1] == ('execute', "execute fulfilled_requests (%s, %s)",
+                            ([1, 2], 3)), calls[1]
+        assert calls[2][1].startswith("prepare orphaned_requests as")
+        assert calls[3] == ('execute',
+                            "execute orphaned_requests (%s, %s, %s)",
+                            ([1, 2], ['sir-1'], 3)), calls[3]
@@ -0,0 +1,66 @@
+import boto
+import mock
+from nose.tools import istest, assert_raises
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import ratelimit
+from scrimp.cloud.aws.ratelimit import TokenBucket, RateLimiter
+
+
+def throttle():
+    error = boto.exception.EC2ResponseError(400, 'Bad Request')
+    error.error_code = 'RequestLimitExceeded'
+    return error
+
+
+class TestRunner(MockedIO):
+    @istest
+    def waits_for_tokens(self):
+        """
+        Unit: TokenBucket Makes Calls Beyond The Burst Wait
+        """
+        with mock.patch.object(ratelimit.time, 'time') as now, \
+                mock.patch.object(ratelimit.time, 'sleep') as sleep:
+            now.return_value = 1000
+            bucket = TokenBucket(rate=10, burst=2)
+            assert bucket.acquire() == 0
+            assert bucket.acquire() == 0
+            assert abs(bucket.acquire() - 0.1) < 1e-9
+            assert abs(bucket.acquire() - 0.2) < 1e-9
+            assert sleep.call_count == 2
+            # the bucket refills over time
+            now.return_value = 1001
+            assert bucket.acquire() == 0
+        assert bucket.calls == 5
+
+    @istest
+    def adapts_to_throttling(self):
+        """
+        Unit: RateLimiter Slows Down And Retries Throttled Calls
+        """
+        limiter = RateLimiter(mutating_rate=4, describe_rate=20, retries=1)
+        conn = mock.Mock()
+        conn.create_tags.side_effect = [throttle(), 'tagged']
+        conn.get_all_instances.return_value = []
+        limited = limiter.wrap(conn, ('key', None))
+        with mock.patch.object(ratelimit.time, 'sleep'):
+            assert limited.create_tags(['sir-1'], {}) == 'tagged'
+            assert limited.get_all_instances() == []
+        mutating = limiter.buckets[(('key', None), True)]
+        describe = limiter.buckets[(('key', None), False)]
+        assert mutating.throttles == 1
+        assert mutating.calls == 2
+        # halved, then increased by one success
+        assert abs(mutating.rate - 2.05) < 1e-9
+        assert describe.calls == 1
+        assert describe.rate == 20
+
+        # give up after the retries
+        conn.create_tags.side_effect = throttle()
+        with mock.patch.object(ratelimit.time, 'sleep'):
+            assert_raises(boto.exception.EC2ResponseError,
+                          limited.create_tags, ['sir-1'], {})
+        assert mutating.throttles == 3
+        assert abs(mutating.rate - 2.05 / 4) < 1e-9
+        limiter.log_stats()
+        assert mutating.calls == 0
@@ -0,0 +1,85 @@
+import datetime
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.simaws.sim_events import SimEventQueue
+
+
+START = datetime.datetime(2017, 3, 25, 3, 14)
+
+
+def at(seconds):
+    """
+    A simulated time the given number of seconds after the start
+    """
+    return START + datetime.timedelta(seconds=seconds)
+
+
+class TestRunner(MockedIO):
+    @istest
+    def empty_queue_steps_once(self):
+        """
+        Unit: SimEventQueue With No Events Advances One Step
+        """
+        events = SimEventQueue(START, 2)
+        tick, kinds = events.next_tick(at(10))
+        assert tick == at(12), tick
+        assert kinds == [], kinds
+
+    @istest
+    def events_round_up_to_ticks(self):
+        """
+        Unit: SimEventQueue Rounds Events Up To The Tick Grid
+        """
+        events = SimEventQueue(START, 2)
+        events.push(at(101), 'request ready')
+        events.push(at(345.5), 'job finish', strict=True)
+        tick, kinds = events.next_tick(at(10))
+        assert tick == at(102), tick
+        assert kinds == ['request ready'], kinds
+        tick, kinds = events.next_tick(tick)
+        assert tick == at(346), tick
+        assert kinds == ['job finish'], kinds
+
+    @istest
+    def strict_events_skip_their_own_tick(self):
+        """
+        Unit: SimEventQueue Fires Strict Events After Their Time
+        """
+        events = SimEventQueue(START, 2)
+        events.push(at(100), 'job idle', strict=True)
+        events.push(at(100), 'claimed')
+        tick, kinds = events.next_tick(at(50))
+        assert tick == at(100), tick
+        assert kinds == ['claimed'], kinds
+        tick, kinds = events.next_tick(tick)
+        assert tick == at(102), tick
+        assert kinds == ['job idle'], kinds
+
+    @istest
+    def past_events_are_due_next_step(self):
+        """
+        Unit: SimEventQueue Treats Past Events As Due On The Next Step
+        """
+        events = SimEventQueue(START, 2)
+        events.push(at(4), 'claimed')
+        events.push(at(40), 'request ready')
+        tick, kinds = events.next_tick(at(20))
+        assert tick == at(22), tick
+        assert kinds == ['claimed'], kinds
+
+    @istest
+    def periodic_events(self):
+        """
+        Unit: SimEventQueue Periodic Events Land On The Next Multiple
+        """
+        events = SimEventQueue(START, 2)
+        events.push_every(at(60), 60, 'price check')
+        events.push_every(at(61), 3, 'provision')
+        tick, kinds = events.next_tick(at(61))
+        # 63 is not on the grid, so the tick after it is used
+        assert tick == at(64), tick
+        assert kinds == ['provision'], kinds
+        tick, kinds = events.next_tick(tick)
+        assert tick == at(120), tick
+        assert kinds == ['price check'], kinds
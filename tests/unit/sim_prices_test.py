@@ -0,0 +1,83 @@
+import os
+import shutil
+import datetime
+import tempfile
+import pytz
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.simaws.sim_prices import SpotPriceTrace
+
+
+START = datetime.datetime(2017, 3, 25, 3, 14, tzinfo=pytz.utc)
+
+TRACE = """Timestamp,InstanceType,AvailabilityZone,SpotPrice
+2017-03-25T03:20:00.000Z,c3.2xlarge,us-east-1a,0.0900
+2017-03-25T03:10:00.000Z,c3.2xlarge,us-east-1a,0.1000
+2017-03-25T03:15:30.000Z,c3.2xlarge,us-east-1a,0.0800
+2017-03-25T03:12:00.000Z,c3.2xlarge,us-east-1b,0.2000
+2017-03-25T03:12:00.000Z,m3.2xlarge,us-east-1a,0.3000
+"""
+
+
+def at(seconds):
+    """
+    A time the given number of seconds after the start
+    """
+    return START + datetime.timedelta(seconds=seconds)
+
+
+class TestRunner(MockedIO):
+    def setUp(self):
+        MockedIO.setUp(self)
+        self.tmpdir = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.tmpdir, 'prices.csv')
+        with open(self.csv_file, 'w') as f:
+            f.write(TRACE)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        MockedIO.tearDown(self)
+
+    @istest
+    def price_at_uses_price_in_effect(self):
+        """
+        Unit: SpotPriceTrace Returns The Price In Effect At A Time
+        """
+        trace = SpotPriceTrace(self.csv_file)
+        assert trace.price_at('c3.2xlarge', 'us-east-1a', at(0)) == 0.1
+        assert trace.price_at('c3.2xlarge', 'us-east-1a', at(90)) == 0.08
+        assert trace.price_at('c3.2xlarge', 'us-east-1a', at(400)) == 0.09
+        assert trace.price_at('c3.2xlarge', 'us-east-1b', at(-180)) is None
+        assert trace.price_at('r3.2xlarge', 'us-east-1a', at(0)) is None
+
+    @istest
+    def lowest_price_includes_start_of_window(self):
+        """
+        Unit: SpotPriceTrace Lowest Price Covers The Whole Window
+        """
+        trace = SpotPriceTrace(self.csv_file)
+        # only the price in effect at the start
+        assert trace.lowest_price('c3.2xlarge', 'us-east-1a',
+                                  at(0), at(60)) == 0.1
+        # a drop within the window
+        assert trace.lowest_price('c3.2xlarge', 'us-east-1a',
+                                  at(60), at(120)) == 0.08
+        # a window before any prices were recorded
+        assert trace.lowest_price('c3.2xlarge', 'us-east-1b',
+                                  at(-600), at(-540)) is None
+
+    @istest
+    def npz_round_trip(self):
+        """
+        Unit: SpotPriceTrace Saved To NPZ Loads The Same Prices
+        """
+        trace = SpotPriceTrace(self.csv_file)
+        npz_file = os.path.join(self.tmpdir, 'prices.npz')
+        trace.save(npz_file)
+        loaded = SpotPriceTrace(npz_file)
+        assert sorted(loaded.series.keys()) == sorted(trace.series.keys())
+        for seconds in [-300, 0, 90, 400]:
+            for key in trace.series:
+                assert (loaded.price_at(key[0], key[1], at(seconds)) ==
+                        trace.price_at(key[0], key[1], at(seconds)))
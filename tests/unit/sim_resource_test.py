@@ -0,0 +1,238 @@
+import datetime
+import random
+import threading
+
+import mock
+import numpy as np
+import pytz
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.simaws import aws_simulator, sim_resource
+from scrimp.cloud.simaws.aws_simulator import AWSSimulator
+from scrimp.cloud.simaws.sim_resource import SimResource, SimResourceTable
+
+START = datetime.datetime(2017, 3, 25, 3, 14, tzinfo=pytz.utc)
+
+TYPES = ['c3.large', 'm3.large', 'r3.large']
+SUBNETS = ['subnet-a', 'subnet-b']
+STATES = ['CONTEXTUALIZING', 'UNCLAIMED', 'IDLE', 'EXECUTING', 'TERMINATED']
+
+
+def at(seconds):
+    return START + datetime.timedelta(seconds=seconds)
+
+
+def spot_price(ins_type, subnet, tenant):
+    """
+    A fixed spot price for each type, subnet and tenant.
+    """
+    key = "%s %s %s" % (ins_type, subnet, tenant.name)
+    return 0.05 + (sum(ord(c) for c in key) % 50) / 100.0
+
+
+def check_requirements(ins_type, job):
+    return TYPES.index(ins_type) >= job.size
+
+
+def old_run_aws(sim, current_time, terminate):
+    """
+    The resource checks of run_aws and its price checks, as they were made
+    one resource at a time before the resource table.
+    """
+    for resource in sim.resources:
+        if (resource.state == 'CONTEXTUALIZING' and
+                current_time >= resource.context_time):
+            resource.state = 'UNCLAIMED'
+            wait_time = int(random.choice(sim.negotiate_time_dist))
+            resource.claimed_time = current_time + \
+                datetime.timedelta(seconds=wait_time)
+        elif resource.state == 'UNCLAIMED':
+            if (resource.claimed_time -
+                    current_time).total_seconds() <= 0:
+                if sim.check_claim(resource):
+                    resource.state = 'IDLE'
+                    continue
+                else:
+                    resource.claimed_time = current_time + \
+                        datetime.timedelta(seconds=int(
+                            random.choice(sim.negotiate_time_dist)))
+                    resource.state = 'UNCLAIMED'
+
+    terminate_resources = {}
+    for resource in sim.resources:
+        age = (current_time - resource.launch_time).total_seconds()
+        if resource.state != 'TERMINATED' and (
+                (terminate == 'hourly' and resource.state != 'EXECUTING' and
+                 int(age % 3600) > 3480) or
+                (terminate == '1hour' and resource.state != 'EXECUTING' and
+                 age > 3480) or
+                (terminate == 'idle' and resource.state == 'IDLE' and
+                 int(age) > 600)):
+            resource.reason = "time related"
+            resource.state = "TERMINATED"
+            resource.terminate_time = current_time
+
+        if resource.state != "TERMINATED":
+            if (current_time - START).total_seconds() % 60 == 0:
+                for t in sim.tenants:
+                    if resource.type in terminate_resources:
+                        if terminate_resources[resource.type] is False:
+                            continue
+                    if (float(resource.price) < float(spot_price(
+                            resource.type, resource.subnet, t))):
+                        for job in t.jobs:
+                            if job.id == resource.job_id:
+                                job.sim_status = 'IDLE'
+                                if job.id in sim.executing_jobs:
+                                    sim.executing_jobs.remove(job.id)
+                                if job not in t.idle_jobs:
+                                    t.idle_jobs = t.idle_jobs + [job]
+                        resource.state = "TERMINATED"
+                        resource.reason = ("spot instance termination "
+                                           "due to spot price")
+                        resource.terminate_time = current_time
+                    else:
+                        terminate_resources[resource.type] = False
+
+
+def make_simulator(seed, now):
+    """
+    A simulator with a random mix of resources in every state, and two
+    tenants with some jobs.
+    """
+    rng = random.Random(seed)
+    sim = AWSSimulator.__new__(AWSSimulator)
+    sim.lock = threading.Lock()
+    sim.requests = []
+    sim.resources = []
+    sim.resource_table = SimResourceTable(START, capacity=4)
+    sim.negotiate_time_dist = [rng.uniform(10, 100) for i in range(50)]
+    sim.executing_jobs = []
+    sim.get_spot_price = spot_price
+    sim.check_requirements = check_requirements
+
+    sim.tenants = []
+    for name in ['a', 'b']:
+        t = mock.Mock()
+        t.name = name
+        t.jobs = []
+        for i in range(5):
+            job = mock.Mock()
+            job.id = '%s%s' % (name, i)
+            job.size = rng.randint(0, 2)
+            job.sim_status = rng.choice(['IDLE', 'EXECUTING'])
+            if job.sim_status == 'EXECUTING':
+                sim.executing_jobs.append(job.id)
+            t.jobs.append(job)
+        t.idle_jobs = [job for job in t.jobs if job.sim_status == 'IDLE']
+        sim.tenants.append(t)
+
+    jobs = [job.id for t in sim.tenants for job in t.jobs]
+    for i in range(40):
+        res = SimResource(sim.resource_table,
+                          round(rng.uniform(0.05, 0.6), 2),
+                          rng.choice(SUBNETS), rng.choice(TYPES), START,
+                          'sir-%s' % i, 'i-%s' % i, 0, None)
+        res.state = rng.choice(STATES)
+        res.launch_time = now - datetime.timedelta(
+            seconds=rng.randint(0, 8000))
+        res.context_time = now + datetime.timedelta(
+            seconds=rng.randint(-300, 300))
+        if res.state == 'UNCLAIMED' or rng.random() < 0.5:
+            res.claimed_time = now + datetime.timedelta(
+                seconds=rng.randint(-300, 300))
+        res.job_id = rng.choice(jobs + [None])
+        sim.resources.append(res)
+    return sim
+
+
+def snapshot(sim):
+    resources = [(r.state, r.claimed_time, r.terminate_time, r.reason)
+                 for r in sim.resources]
+    jobs = [(job.id, job.sim_status) for t in sim.tenants for job in t.jobs]
+    idle = [[job.id for job in t.idle_jobs] for t in sim.tenants]
+    return resources, jobs, idle, sorted(sim.executing_jobs)
+
+
+class TestRunner(MockedIO):
+    @istest
+    def table_adds_and_grows(self):
+        """
+        Unit: SimResourceTable Adds Rows And Grows Its Columns
+        """
+        table = SimResourceTable(START, capacity=2)
+        for i in range(5):
+            assert table.add(TYPES[i % 3], SUBNETS[i % 2], i / 10.0) == i
+        assert table.size == 5
+        assert len(table.column('state')) == 5
+        assert len(table._state) == 8
+        assert table.types == TYPES
+        assert table.subnets == SUBNETS
+        assert list(table.column('type_index')) == [0, 1, 2, 0, 1]
+        assert list(table.column('subnet_index')) == [0, 1, 0, 1, 0]
+        assert list(table.column('price')) == [0.0, 0.1, 0.2, 0.3, 0.4]
+        # times are unset until given
+        assert np.all(np.isnan(table.column('launch_time')))
+
+    @istest
+    def table_times_and_due(self):
+        """
+        Unit: SimResourceTable Converts Times And Finds Due Rows
+        """
+        table = SimResourceTable(START)
+        assert table.to_seconds(at(90)) == 90
+        assert table.to_time(90.0) == at(90)
+        assert np.isnan(table.to_seconds(None))
+        assert table.to_time(np.nan) is None
+
+        for i in range(3):
+            table.add('c3.large', 'subnet-a', 0.1)
+        table.column('job_finish')[:2] = [10, 20]
+        assert list(table.due('job_finish', 20)) == [True, True, False]
+        assert list(table.due('job_finish', 20, strict=True)) == [
+            True, False, False]
+
+    @istest
+    def resource_repr_reads_table(self):
+        """
+        Unit: SimResource repr Shows The Values From Its Row
+        """
+        table = SimResourceTable(START)
+        with mock.patch.object(sim_resource, 'ProvisionerConfig') as config:
+            config.return_value.simulate_time = at(60)
+            SimResource(table, 0.1, 'subnet-a', 'c3.large', START, 'sir-0',
+                        'i-0', 30, '1')
+            res = SimResource(table, 0.2, 'subnet-b', 'm3.large', START,
+                              'sir-1', 'i-1', 30, '2')
+        res.state = 'IDLE'
+        for text in [repr(res), str(res)]:
+            assert '_table' not in text and '_index' not in text, text
+            assert 'IDLE' in text, text
+            assert repr(at(60)) in text, text
+            assert repr(at(90)) in text, text
+            assert "'i-1'" in text, text
+
+    @istest
+    def run_aws_matches_resource_loop(self):
+        """
+        Unit: Vectorized run_aws Matches Checking Each Resource In Turn
+        """
+        now = at(7200)
+        for terminate in ['hourly', '1hour', 'idle']:
+            for seed in range(5):
+                with mock.patch.object(aws_simulator,
+                                       'ProvisionerConfig') as config, \
+                        mock.patch.object(sim_resource,
+                                          'ProvisionerConfig') as res_config:
+                    for c in (config, res_config):
+                        c.return_value.simulate_time = now
+                        c.return_value.sim_time = START
+                        c.return_value.terminate = terminate
+                    old = make_simulator(seed, now)
+                    new = make_simulator(seed, now)
+                    random.seed(seed)
+                    old_run_aws(old, now, terminate)
+                    random.seed(seed)
+                    new.run_aws()
+                assert snapshot(new) == snapshot(old), (terminate, seed)
@@ -0,0 +1,286 @@
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import random
+import shutil
+import tempfile
+
+import mock
+import numpy as np
+import pytz
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp import tenant
+from scrimp.cloud.aws import Instance, InstanceCatalog
+from scrimp.cloud.simaws import aws_simulator
+from scrimp.cloud.simaws.sim_events import SimEventQueue
+from scrimp.cloud.simaws.sim_resource import SimResource
+from scrimp.config import ProvisionerConfig
+from scrimp.provisioner import Provisioner
+
+START = datetime.datetime(2017, 3, 25, 3, 14, tzinfo=pytz.utc)
+
+TYPES = [('c3.2xlarge', 0.42, 8, 15), ('c3.4xlarge', 0.84, 16, 30),
+         ('m3.2xlarge', 0.532, 8, 30), ('r3.2xlarge', 0.665, 8, 61)]
+
+ZONES = {'us-east-1a': 'subnet-a', 'us-east-1b': 'subnet-b'}
+
+
+class RecordingDB(object):
+    """
+    Stands in for the database, recording the job and instance writes.
+    """
+
+    def __init__(self):
+        self.writes = []
+
+    def execute(self, stmt, *args, **kwargs):
+        text = str(stmt)
+        if args:
+            params = args[0]
+            if isinstance(params, list):
+                # a single parameter set, as given to Connection.execute
+                params, = params
+            text = text % tuple("%s" % (v,) for v in params)
+        low = text.lower()
+        if ('jobs' in low and ('insert' in low or 'update' in low)) or \
+                'insert into instance' in low or \
+                'update instance set terminate' in low:
+            self.writes.append(" ".join(text.split()))
+        return []
+
+    def run(self, work, name='sql'):
+        return work(self)
+
+
+class SimConfig(object):
+    pass
+
+
+def price_at(ins_type, zone, when):
+    base = dict((t, p) for t, p, c, m in TYPES)[ins_type] * 0.3
+    x = (when - START).total_seconds()
+    h = (sum(ord(c) for c in ins_type + zone) % 100) / 10.0
+    return round(base * (1 + 0.9 * math.sin(x / 2500.0 + h) ** 9), 4)
+
+
+def write_trace(tmp, njobs, seed):
+    """
+    Write a small job trace and a spot price history for it.
+    """
+    rng = random.Random(seed)
+    jobs = []
+    t = 0
+    for j in range(njobs):
+        t += rng.randint(0, 400)
+        jobs.append({'id': j + 1, 'relative_time': t,
+                     'instance_type': rng.choice(['r3.8xlarge',
+                                                  'm3.2xlarge']),
+                     'duration': rng.randint(60, 5000)})
+    jobs_file = os.path.join(tmp, 'jobs.json')
+    with open(jobs_file, 'w') as f:
+        json.dump(jobs, f)
+
+    price_file = os.path.join(tmp, 'prices.csv')
+    with open(price_file, 'w') as f:
+        f.write('Timestamp,InstanceType,AvailabilityZone,SpotPrice\n')
+        for k in range(-10, 1000):
+            when = START + datetime.timedelta(seconds=k * 60)
+            for t, p, c, m in TYPES:
+                for zone in sorted(ZONES):
+                    f.write('%s,%s,%s,%s\n' % (
+                        when.strftime('%Y-%m-%dT%H:%M:%S.000Z'), t, zone,
+                        price_at(t, zone, when)))
+    return jobs_file, price_file
+
+
+def make_config(terminate, jobs_file, price_file):
+    cfg = SimConfig()
+    cfg.simulate = True
+    cfg.sim_time = START
+    cfg.simulate_time = START
+    cfg.run_rate = 2
+    cfg.terminate = terminate
+    cfg.run_id = 1
+    cfg.run_name = 'schedule'
+    cfg.relative_time = None
+    cfg.first_job_time = None
+    cfg.idle_time = 120
+    cfg.overhead_time = 0
+    cfg.DrAFTS = False
+    cfg.DrAFTSProfiles = False
+    cfg.DrAFTSAvgPrice = False
+    cfg.drafts_stored_db = False
+    cfg.drafts_url = 'http://127.0.0.1:1'
+    cfg.max_requests = 3
+    cfg.ondemand_price_threshold = .8
+    cfg.cloudinit_file = None
+    cfg.prepare_statements = False
+    cfg.spot_price_ttl = 60
+    cfg.aws_concurrency = 10
+    cfg.jobs_file = jobs_file
+    cfg.spot_price_file = price_file
+    cfg.dbconn = RecordingDB()
+    cfg.instance_types = [Instance(i + 1, t, p, c, m, 80, 'ami-1')
+                          for i, (t, p, c, m) in enumerate(TYPES)]
+    cfg.instance_catalog = InstanceCatalog(cfg.instance_types)
+    cfg.load_instance_types = lambda: None
+    return cfg
+
+
+def load_tenants():
+    t = tenant.Tenant(1, 'tenant', 'pub', 'condor', '1.2.3.4', 'us-east-1a',
+                      'subnet-a', 1, 'vpc', 'sg', 'dom', 0.5, 80, 3000,
+                      'ak', 'sk', 'kp')
+    t.subnets = dict(ZONES)
+    t.subnets_db_id = {'us-east-1a': 1, 'us-east-1b': 2}
+    return [t]
+
+
+def make_distributions(simulator):
+    r = np.random.RandomState(1)
+    simulator.negotiate_time_dist = list(r.lognormal(3, 0.5, 10000))
+    simulator.fulfilled_time_dist = list(r.normal(7.118134, 0.895632,
+                                                  10000))
+    simulator.contextualise_time_dist = list(r.lognormal(4, 0.3, 10000))
+
+
+@contextlib.contextmanager
+def patched(cfg):
+    """
+    Install cfg as the ProvisionerConfig and keep the simulator away from
+    the database.
+    """
+    with mock.patch.object(ProvisionerConfig, '_instance', cfg,
+                           create=True), \
+            mock.patch.object(aws_simulator.AWSSimulator,
+                              'make_distributions', make_distributions), \
+            mock.patch.object(aws_simulator.AWSSimulator, 'get_fake_time',
+                              lambda self, time=None: cfg.simulate_time), \
+            mock.patch.object(tenant, 'load_from_db', load_tenants), \
+            mock.patch('sys.stdout', io.BytesIO()):
+        # (the simulator prints byte strings as it runs)
+        random.seed(5)
+        cfg.simulator = aws_simulator.AWSSimulator()
+        yield cfg.simulator
+
+
+def simulate(terminate, jobs_file, price_file, fixed_step):
+    """
+    Run the simulation to the end and return the job and instance writes
+    along with the simulated time it finished at.
+    """
+    cfg = make_config(terminate, jobs_file, price_file)
+    with patched(cfg):
+        prov = Provisioner()
+        if fixed_step:
+            # step through every tick, as the simulator used to
+            prov.next_sim_event = lambda events: (
+                cfg.simulate_time + datetime.timedelta(seconds=2), [])
+        prov.run()
+    return cfg.dbconn.writes, cfg.simulate_time
+
+
+def add_resource(simulator, state, job_finish=None):
+    res = SimResource(simulator.resource_table, 0.1, 'subnet-a',
+                      'm3.2xlarge', START, 'req-1', 'ins-1', 100, '1')
+    res.state = state
+    res.job_finish = job_finish
+    simulator.resources.append(res)
+    return res
+
+
+class TestRunner(MockedIO):
+    def setUp(self):
+        super(TestRunner, self).setUp()
+        self.tmp = tempfile.mkdtemp()
+        self.jobs_file, self.price_file = write_trace(self.tmp, 10, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        super(TestRunner, self).tearDown()
+
+    def check_policy(self, terminate):
+        fixed = simulate(terminate, self.jobs_file, self.price_file, True)
+        events = simulate(terminate, self.jobs_file, self.price_file, False)
+        assert len(fixed[0]) > 0
+        assert events == fixed, (terminate, events, fixed)
+
+    @istest
+    def hourly_matches_fixed_steps(self):
+        """
+        Unit: Event Driven Simulation Matches Fixed Steps (Hourly)
+        """
+        self.check_policy('hourly')
+
+    @istest
+    def idle_matches_fixed_steps(self):
+        """
+        Unit: Event Driven Simulation Matches Fixed Steps (Idle)
+        """
+        self.check_policy('idle')
+
+    @istest
+    def one_hour_matches_fixed_steps(self):
+        """
+        Unit: Event Driven Simulation Matches Fixed Steps (1hour)
+        """
+        self.check_policy('1hour')
+
+    @istest
+    def terminated_resource_job_finish(self):
+        """
+        Unit: Finish Of A Job On A Terminated Resource Is Scheduled
+        """
+        cfg = make_config('hourly', self.jobs_file, self.price_file)
+        cfg.simulate_time = START + datetime.timedelta(seconds=500)
+        with patched(cfg) as simulator:
+            add_resource(simulator, 'TERMINATED',
+                         START + datetime.timedelta(seconds=601))
+            events = SimEventQueue(START, 2)
+            simulator.schedule_events(events)
+            tick, kinds = events.next_tick(cfg.simulate_time)
+        assert tick == START + datetime.timedelta(seconds=602), tick
+        assert kinds == ['job finish'], kinds
+
+    @istest
+    def idle_resource_with_waiting_job(self):
+        """
+        Unit: Idle Resources Are Deployed To On The Next Tick
+        """
+        cfg = make_config('hourly', self.jobs_file, self.price_file)
+        cfg.simulate_time = START + datetime.timedelta(seconds=500)
+        with patched(cfg) as simulator:
+            add_resource(simulator, 'IDLE')
+            job = mock.Mock()
+            job.sim_status = 'IDLE'
+            simulator.tenants = load_tenants()
+            simulator.tenants[0].jobs = [job]
+            events = SimEventQueue(START, 2)
+            simulator.schedule_events(events)
+            tick, kinds = events.next_tick(cfg.simulate_time)
+        assert tick == START + datetime.timedelta(seconds=502), tick
+        assert kinds == ['deploy'], kinds
+
+    @istest
+    def resource_with_finished_job(self):
+        """
+        Unit: Resources Running A Job Finished Elsewhere Are Freed Next Tick
+        """
+        cfg = make_config('1hour', self.jobs_file, self.price_file)
+        cfg.simulate_time = START + datetime.timedelta(seconds=500)
+        with patched(cfg) as simulator:
+            res = add_resource(simulator, 'EXECUTING',
+                               START + datetime.timedelta(seconds=5000))
+            # the job has finished on another resource
+            res.job_id = '1'
+            simulator.executing_jobs = []
+            events = SimEventQueue(START, 2)
+            simulator.schedule_events(events)
+            tick, kinds = events.next_tick(cfg.simulate_time)
+        assert tick == START + datetime.timedelta(seconds=502), tick
+        assert kinds == ['job finish'], kinds
@@ -0,0 +1,79 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import api
+from scrimp.cloud.aws.executor import EC2Executor
+
+
+def make_job(job_id, instance_type, zone='us-east-1a', bid=0.5, count=1):
+    job = mock.Mock()
+    job.id = job_id
+    job.launch.instance_type = instance_type
+    job.launch.zone = zone
+    job.launch.bid = bid
+    job.launch.ami = 'ami-1'
+    job.launch.count = count
+    job.launch.ondemand = False
+    job.fulfilled = False
+    job.req_cpus = 1
+    return job
+
+
+class TestRunner(MockedIO):
+    @istest
+    def batches_identical_requests(self):
+        """
+        Unit: Jobs With The Same Spot Request Are Requested Together
+        """
+        tenant = mock.Mock()
+        tenant.subnets = {'us-east-1a': 'subnet-a'}
+        jobs = [make_job(1, 'c3.large'), make_job(2, 'c3.large', count=2),
+                make_job(3, 'c3.large', bid=0.6), make_job(4, 'c3.large')]
+        with mock.patch.object(api, 'customise_cloudinit') as cloudinit:
+            cloudinit.return_value = 'user data'
+            batches = api.batch_requests(
+                tenant, [(job, job.launch) for job in jobs])
+        assert [[j.id for j in b[1]] for b in batches] == [[1, 2, 4], [3]]
+
+        conn = mock.Mock()
+        conn.request_spot_instances.return_value = [
+            mock.Mock(id='sir-%s' % i) for i in range(4)]
+        with mock.patch.object(api, 'record_spot_request') as record:
+            launched = api.launch_spot_request(conn, jobs[0].launch, tenant,
+                                               batches[0][1], 'user data')
+        assert conn.request_spot_instances.call_count == 1
+        assert conn.request_spot_instances.call_args[1]['count'] == 4
+        assert [(job.id, ids) for job, ids in launched] == [
+            (1, ['sir-0']), (2, ['sir-1', 'sir-2']), (4, ['sir-3'])]
+        assert record.call_count == 4
+
+    @istest
+    def failed_batch_keeps_other_tags(self):
+        """
+        Unit: A Failed Batch Does Not Lose The Tags Of The Others
+        """
+        tenant = mock.Mock()
+        tenant.subnets = {'us-east-1a': 'subnet-a'}
+        tenant.idle_jobs = [make_job(1, 'c3.large'),
+                            make_job(2, 'm3.large'),
+                            make_job(3, 'r3.large')]
+
+        def launch_spot_request(conn, request, tenant, jobs, user_data):
+            if request.instance_type == 'm3.large':
+                raise ValueError('request failed')
+            return [(job, ['sir-%s' % job.id]) for job in jobs]
+
+        # (recorded in a list, as the pool's threads would race to make
+        # the mock's add attribute)
+        tagged = []
+        executor = EC2Executor(2)
+        with mock.patch.object(api, 'customise_cloudinit'), \
+                mock.patch.object(api, 'tenant_connection'), \
+                mock.patch.object(api, 'launch_spot_request',
+                                  launch_spot_request), \
+                mock.patch.object(api, 'tag_queue') as tag_queue:
+            tag_queue.add = lambda t, ids: tagged.extend(ids)
+            api.request_resources(tenant, executor)
+        executor.close()
+        assert sorted(tagged) == ['sir-1', 'sir-3'], tagged
@@ -0,0 +1,79 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import SpotPriceService
+from scrimp.cloud.aws.prices import fetch_prices
+
+
+class History(list):
+    def __init__(self, prices, next_token=None):
+        list.__init__(self, prices)
+        self.next_token = next_token
+
+
+def make_price(ins_type, zone, price, timestamp='2017-03-25T03:14:00.000Z'):
+    p = mock.Mock()
+    p.instance_type = ins_type
+    p.availability_zone = zone
+    p.price = price
+    p.timestamp = timestamp
+    return p
+
+
+def make_conn():
+    conn = mock.Mock()
+    conn.get_spot_price_history.side_effect = [
+        History([make_price('c3.2xlarge', 'us-east-1a', 0.1),
+                 make_price('c3.2xlarge', 'us-east-1b', 0.2)], 'page2'),
+        History([make_price('m3.2xlarge', 'us-east-1a', 0.3),
+                 make_price('c3.2xlarge', 'us-east-1a', 0.05,
+                            '2017-03-25T03:00:00.000Z')])]
+    return conn
+
+
+class Tenant(object):
+    access_key = 'key'
+    secret_key = 'secret'
+    subnets = {'us-east-1a': 'subnet-a'}
+
+
+class Instance(object):
+    def __init__(self, ins_type):
+        self.type = ins_type
+
+
+class TestRunner(MockedIO):
+    @istest
+    def fetches_all_pages(self):
+        """
+        Unit: fetch_prices Reads Every Page Of The Price History
+        """
+        conn = make_conn()
+        prices = fetch_prices(conn, ['c3.2xlarge', 'm3.2xlarge'])
+        assert prices == {'c3.2xlarge': {'us-east-1a': 0.1,
+                                         'us-east-1b': 0.2},
+                          'm3.2xlarge': {'us-east-1a': 0.3}}, prices
+        assert conn.get_spot_price_history.call_count == 2
+        args = conn.get_spot_price_history.call_args[1]
+        assert args['next_token'] == 'page2'
+        assert args['filters'] == {'instance-type': ['c3.2xlarge',
+                                                     'm3.2xlarge']}
+
+    @istest
+    def caches_snapshots(self):
+        """
+        Unit: SpotPriceService Caches Snapshots And Filters By Subnet
+        """
+        service = SpotPriceService(ttl=60)
+        conn = make_conn()
+        instances = [Instance('c3.2xlarge'), Instance('m3.2xlarge')]
+        with mock.patch('scrimp.cloud.aws.prices.tenant_connection') as tc:
+            tc.return_value.__enter__.return_value = conn
+            view = service.view(Tenant(), instances)
+            again = service.view(Tenant(), instances)
+        assert view.get('c3.2xlarge') == {'us-east-1a': 0.1}
+        assert again.get('m3.2xlarge') == {'us-east-1a': 0.3}
+        assert view.get('r3.2xlarge') == {}
+        assert (service.hits, service.misses) == (1, 1)
+        assert tc.call_count == 1
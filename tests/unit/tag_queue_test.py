@@ -0,0 +1,100 @@
+import boto
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO, make_tenant
+
+from scrimp.cloud.aws import tags
+from scrimp.cloud.aws.tags import TagQueue
+
+
+class TestRunner(MockedIO):
+    @istest
+    def tags_in_batches(self):
+        """
+        Unit: TagQueue Tags Many Resources In Each Call
+        """
+        queue = TagQueue(batch_size=2)
+        a = make_tenant('a')
+        queue.add(a, ['sir-1', 'sir-2'])
+        queue.add(a, ['i-1'])
+        queue.add(make_tenant('b'), ['sir-3'])
+        assert len(queue) == 4
+        with mock.patch.object(tags, 'tenant_connection') as connection:
+            conn = connection.return_value.__enter__.return_value
+            queue.flush()
+        calls = sorted(c[0] for c in conn.create_tags.call_args_list)
+        assert calls == [
+            (['i-1'], {'tenant': 'a', 'Name': 'worker@a'}),
+            (['sir-1', 'sir-2'], {'tenant': 'a', 'Name': 'worker@a'}),
+            (['sir-3'], {'tenant': 'b', 'Name': 'worker@b'})]
+        assert queue.tagged == 4
+        assert len(queue) == 0
+
+    @istest
+    def retries_with_backoff(self):
+        """
+        Unit: TagQueue Retries Failed Calls After A Backoff
+        """
+        queue = TagQueue(max_attempts=2)
+        queue.add(make_tenant('a'), ['sir-1'])
+        error = boto.exception.EC2ResponseError(
+            400, 'Bad Request', 'InvalidSpotInstanceRequestID.NotFound')
+        with mock.patch.object(tags, 'tenant_connection') as connection, \
+                mock.patch.object(tags.time, 'time') as now:
+            conn = connection.return_value.__enter__.return_value
+            conn.create_tags.side_effect = error
+            now.return_value = 1000
+            queue.flush()
+            assert queue.retried == 1
+            assert len(queue) == 1
+            # not due until the backoff has passed
+            queue.flush()
+            assert conn.create_tags.call_count == 1
+            now.return_value = 1000 + queue.max_delay
+            queue.flush()
+        assert conn.create_tags.call_count == 2
+        assert queue.failed == 1
+        assert len(queue) == 0
+
+    @istest
+    def failure_keeps_other_batches(self):
+        """
+        Unit: TagQueue Keeps Other Batches When One Call Fails
+        """
+        queue = TagQueue(batch_size=1)
+        a = make_tenant('a')
+        queue.add(a, ['sir-1', 'sir-2', 'sir-3'])
+
+        def create_tags(ids, tags):
+            if ids == ['sir-1']:
+                raise ValueError('connection reset')
+
+        with mock.patch.object(tags, 'tenant_connection') as connection:
+            conn = connection.return_value.__enter__.return_value
+            conn.create_tags.side_effect = create_tags
+            queue.flush()
+        assert conn.create_tags.call_count == 3
+        assert queue.tagged == 2
+        assert [b.ids for b in queue.retries] == [['sir-1']]
+
+    @istest
+    def splits_failing_batch(self):
+        """
+        Unit: TagQueue Splits A Failing Batch Before Dropping An Id
+        """
+        queue = TagQueue(max_attempts=1)
+        queue.add(make_tenant('a'), ['sir-1', 'sir-2', 'bad', 'sir-4'])
+
+        def create_tags(ids, tags):
+            if 'bad' in ids:
+                raise boto.exception.EC2ResponseError(
+                    400, 'Bad Request', 'InvalidID')
+
+        with mock.patch.object(tags, 'tenant_connection') as connection:
+            conn = connection.return_value.__enter__.return_value
+            conn.create_tags.side_effect = create_tags
+            for i in range(4):
+                queue.flush()
+        assert queue.tagged == 3
+        assert queue.failed == 1
+        assert len(queue) == 0
@@ -0,0 +1,95 @@
+import mock
+from sqlalchemy import exc
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp import tenant
+
+
+def make_row(db_id, name, subnets):
+    return {'id': db_id, 'name': name, 'public_address': 'p',
+            'condor_address': 'c', 'public_ip': 'ip', 'zone': 'us-east-1a',
+            'subnet': 'subnet-a', 'subnet_id': 1, 'vpc': 'vpc',
+            'security_group': 'sg', 'domain': None, 'max_bid_price': 1,
+            'bid_percent': 80, 'timeout_threshold': 0,
+            'access_key_id': 'key', 'secret_key': 'secret',
+            'key_pair': 'pair', 'subnets': subnets}
+
+
+class TestRunner(MockedIO):
+    @istest
+    def reloads_only_when_changed(self):
+        """
+        Unit: TenantCache Reloads Tenants Only When The Tables Change
+        """
+        versions = [10, 10, 12]
+        rows = [make_row(1, 'a', [{'zone': u'us-east-1a',
+                                   'subnet': u'subnet-a', 'id': 1},
+                                  {'zone': u'us-east-1b',
+                                   'subnet': u'subnet-b', 'id': 2}]),
+                make_row(2, 'b', None)]
+
+        def execute(name, *params):
+            if name == 'tenants_version':
+                res = mock.Mock()
+                res.scalar.return_value = versions.pop(0)
+                return res
+            assert name == 'tenants'
+            return iter(rows)
+
+        cache = tenant.TenantCache()
+        with mock.patch.object(tenant, 'queries') as queries, \
+                mock.patch.object(tenant, 'ProvisionerConfig') as config:
+            config.return_value.simulate = False
+            config.return_value.tenant_cache_age = 300
+            queries.execute.side_effect = execute
+            first = cache.load()
+            assert cache.load() is first
+            assert cache.load() is not first
+        assert cache.loads == 2
+        assert queries.execute.call_count == 5
+
+        assert [t.name for t in first] == ['a', 'b']
+        assert first[0].subnets == {'us-east-1a': 'subnet-a',
+                                    'us-east-1b': 'subnet-b'}
+        assert first[0].subnets_db_id == {'us-east-1a': 1, 'us-east-1b': 2}
+        assert first[1].subnets == {}
+
+    @istest
+    def reloads_after_max_age(self):
+        """
+        Unit: TenantCache Reloads Old Or Unversioned Tenants
+        """
+        versions = [10, 10, 10, exc.ProgrammingError('select', {}, None),
+                    exc.ProgrammingError('select', {}, None)]
+
+        def execute(name, *params):
+            if name == 'tenants_version':
+                res = mock.Mock()
+                version = versions.pop(0)
+                if isinstance(version, Exception):
+                    res.scalar.side_effect = version
+                res.scalar.return_value = version
+                return res
+            return iter([make_row(1, 'a', None)])
+
+        cache = tenant.TenantCache()
+        with mock.patch.object(tenant, 'queries') as queries, \
+                mock.patch.object(tenant, 'ProvisionerConfig') as config, \
+                mock.patch.object(tenant.time, 'time') as now:
+            config.return_value.simulate = False
+            config.return_value.tenant_cache_age = 300
+            queries.execute.side_effect = execute
+            now.return_value = 1000
+            cache.load()
+            now.return_value = 1299
+            cache.load()
+            assert cache.loads == 1
+            # unchanged, but too old to keep
+            now.return_value = 1300
+            cache.load()
+            assert cache.loads == 2
+            # without a version the tenants are read every time
+            cache.load()
+            cache.load()
+        assert cache.loads == 4
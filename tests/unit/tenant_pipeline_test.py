@@ -0,0 +1,108 @@
+import time
+import threading
+
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO, make_tenant
+
+from scrimp import provisioner
+from scrimp.provisioner import Provisioner
+
+
+def make_provisioner(tenants):
+    prov = Provisioner.__new__(Provisioner)
+    prov.tenants = tenants
+    prov.tenant_pool = None
+    prov.running_tenants = set()
+    prov.running_lock = threading.Lock()
+    prov.spot_prices = mock.Mock()
+    prov.ec2 = mock.Mock()
+    prov.run_iterations = 1
+    return prov
+
+
+class TestRunner(MockedIO):
+    @istest
+    def slow_tenant_does_not_block_others(self):
+        """
+        Unit: Tenants Are Provisioned Concurrently With A Timeout
+        """
+        release = threading.Event()
+        provisioned = []
+
+        def provision_tenant(t):
+            if t.db_id == 1:
+                release.wait(5)
+            provisioned.append(t.db_id)
+
+        tenants = [make_tenant('tenant1', db_id=1, idle_jobs=1),
+                   make_tenant('tenant2', db_id=2, idle_jobs=1),
+                   make_tenant('tenant3', db_id=3)]
+        prov = make_provisioner(tenants)
+        prov.provision_tenant = provision_tenant
+        with mock.patch.object(provisioner, 'ProvisionerConfig') as config, \
+                mock.patch.object(provisioner, 'aws') as aws, \
+                mock.patch.object(provisioner, 'scheduler'):
+            # Mock's call_count is not thread safe, so count in a list
+            managed = []
+            aws.manager.process_resources.side_effect = \
+                lambda tenants, ec2: managed.extend(tenants)
+            config.return_value.tenant_threads = 3
+            config.return_value.tenant_timeout = 0.2
+            config.return_value.DrAFTS = False
+            config.return_value.DrAFTSProfiles = False
+            prov.process_tenants()
+            # tenant 1 timed out, the others were provisioned for
+            assert provisioned == [2]
+            assert prov.running_tenants == set([1])
+            assert len(managed) == 3
+
+            # tenant 1 is skipped while it is still running
+            prov.process_tenants()
+            assert len(managed) == 5
+            release.set()
+            time.sleep(0.1)
+        assert sorted(provisioned) == [1, 2, 2]
+        assert prov.running_tenants == set()
+        prov.tenant_pool.close()
+
+    @istest
+    def running_tenant_not_reloaded(self):
+        """
+        Unit: Tenants Still Running Are Left Out Of The Next Job Load
+        """
+        release = threading.Event()
+
+        def provision_tenant(t):
+            if t.db_id == 1:
+                release.wait(5)
+
+        slow = make_tenant('tenant1', db_id=1, idle_jobs=1)
+        other = make_tenant('tenant2', db_id=2, idle_jobs=1)
+        prov = make_provisioner([slow, other])
+        prov.provision_tenant = provision_tenant
+        prov.tenant_cache = mock.Mock()
+        prov.tenant_cache.load.return_value = [slow, other]
+        prov.sched = mock.Mock()
+        with mock.patch.object(provisioner, 'ProvisionerConfig') as config, \
+                mock.patch.object(provisioner, 'aws'), \
+                mock.patch.object(provisioner, 'scheduler'):
+            config.return_value.simulate = False
+            config.return_value.tenant_threads = 2
+            config.return_value.tenant_timeout = 0.2
+            config.return_value.DrAFTS = False
+            config.return_value.DrAFTSProfiles = False
+            prov.process_tenants()
+            assert prov.running_tenants == set([1])
+
+            # the timed out tenant is still running, so its jobs are not
+            # reset by the next cycle's load
+            prov.load_tenants_and_jobs()
+            assert prov.tenants == [other]
+            prov.sched.load_jobs.assert_called_once_with([other])
+            release.set()
+            time.sleep(0.1)
+
+            prov.load_tenants_and_jobs()
+            assert prov.tenants == [slow, other]
+        prov.tenant_pool.close()
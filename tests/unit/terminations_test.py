@@ -0,0 +1,47 @@
+import mock
+from nose.tools import istest
+from tests.helpers import MockedIO
+
+from scrimp.cloud.aws import terminations
+from scrimp.cloud.aws.terminations import TerminationReconciler
+
+
+def make_reservation(*states):
+    res = mock.Mock()
+    res.instances = []
+    for ins_id, state in states:
+        inst = mock.Mock()
+        inst.id = ins_id
+        inst.state = state
+        inst.state_reason = {'message': "Client.UserInitiatedShutdown: "
+                                        "User's shutdown"}
+        res.instances.append(inst)
+    return res
+
+
+class TestRunner(MockedIO):
+    @istest
+    def writes_new_terminations_once(self):
+        """
+        Unit: TerminationReconciler Writes Each Termination Once
+        """
+        reconciler = TerminationReconciler()
+        first = [make_reservation(('i-1', 'terminated'),
+                                  ('i-2', 'running'))]
+        second = [make_reservation(('i-1', 'terminated'),
+                                   ('i-2', 'terminated'))]
+        with mock.patch.object(terminations, 'queries') as queries:
+            execute = queries.execute
+            assert reconciler.reconcile('acct', first) == ['i-1']
+            assert reconciler.reconcile('acct', first) == []
+            assert reconciler.reconcile('acct', second) == ['i-2']
+            # i-1 is no longer reported, so it is forgotten
+            assert reconciler.reconcile('acct', [
+                make_reservation(('i-2', 'terminated'))]) == []
+            assert reconciler.recorded['acct'] == set(['i-2'])
+            # each account is tracked separately
+            assert reconciler.reconcile('other', first) == ['i-1']
+        assert execute.call_count == 3
+        execute.assert_any_call(
+            'record_terminations', ['i-1'],
+            ["Client.UserInitiatedShutdown: User's shutdown"])